@@ -11,7 +11,7 @@ import matplotlib
 from tqdm import tqdm
 
 from v2e import desktop
-from v2e.emulator import EventEmulator
+from v2e.emulator_multi import MultiConfigEventEmulator
 from v2e.slomo import SuperSloMo
 from v2e.ddd20_utils.ddd_h5_reader import DDD20ReaderMultiProcessing, DDD20SimpleReader
 from v2e.v2e_utils import inputVideoFileDialog, inputDDDFileDialog, select_events_in_roi, DVS_WIDTH, DVS_HEIGHT
@@ -108,15 +108,25 @@ if __name__ == "__main__":
 
         results = np.empty((0,3),float)
         thresholds = np.arange(1, 0.05, -0.01)
-        on_diffs = np.zeros_like(thresholds)
-        on_diffs[:]=np.nan
-        off_diffs = np.zeros_like(thresholds)
-        off_diffs[:]=np.nan
-
-        emulator = EventEmulator(output_folder=None, show_dvs_model_state=None) # 'baseLogFrame'
-        k=0
-        min_pos_diff=np.inf
-        min_neg_diff=np.inf
+        # all thresholds of the sweep are emulated together over the frames
+        emulator = MultiConfigEventEmulator(pos_thres=thresholds, neg_thres=thresholds)
+        apsOnEvents = np.zeros_like(thresholds, dtype=np.int64)
+        apsOffEvents = np.zeros_like(thresholds, dtype=np.int64)
+        for i in tqdm(range(nFrames), desc='thr sweep'):
+            events_v2e = emulator.generate_events(frames['frame'][i], frame_ts[i])
+            if events_v2e is None:
+                continue
+            for k, events_k in enumerate(events_v2e):
+                if not events_k is None:
+                    events_k=select_events_in_roi(events_k,x,y)
+                    onCount=np.count_nonzero(events_k[:,3]==1)
+                    apsOnEvents[k] += onCount
+                    apsOffEvents[k] += events_k.shape[0]-onCount
+
+        on_diffs = np.abs(dvsOnCount - apsOnEvents).astype(float)
+        off_diffs = np.abs(dvsOffCount - apsOffEvents).astype(float)
+        pos_thres = thresholds[np.argmin(on_diffs)]
+        neg_thres = thresholds[np.argmin(off_diffs)]
 
         fig,ax=plt.subplots()
         plt.rcParams.update({'font.size': 18})
@@ -125,45 +135,8 @@ if __name__ == "__main__":
         offline.set_label('Off')
         ax.set_ylabel('absolute event count difference')
         ax.set_xlabel('threshold (log_e)')
-        plt.ion()
-        plt.show()
         # plt.legend()
 
-        for threshold in tqdm(thresholds, desc='thr sweep'):
-            apsOnEvents = 0
-            apsOffEvents = 0
-            emulator.pos_thres = threshold
-            emulator.neg_thres = threshold
-            emulator.reset()
-            for i in range(nFrames):
-                events_v2e = emulator.generate_events(frames['frame'][i], frame_ts[i])
-                if not events_v2e is None:
-                    events_v2e=select_events_in_roi(events_v2e,x,y)
-                    onCount=np.count_nonzero(events_v2e[:,3]==1)
-                    offCount=events_v2e.shape[0]-onCount
-                    apsOnEvents += onCount
-                    apsOffEvents += offCount
-
-            abs_pos_diff = np.abs(dvsOnCount - apsOnEvents)
-            abs_neg_diff = np.abs(dvsOffCount - apsOffEvents)
-
-            if abs_pos_diff < min_pos_diff:
-                min_pos_diff=abs_pos_diff
-                pos_thres = threshold
-            if abs_neg_diff < min_neg_diff:
-                min_neg_diff=abs_neg_diff
-                neg_thres = threshold
-
-            on_diffs[k]=abs_pos_diff
-            off_diffs[k]=abs_neg_diff
-            online.set_ydata(on_diffs)
-            offline.set_ydata(off_diffs)
-            ax.relim()  # Recalculate limits
-            ax.autoscale_view(True, True, True)  # Autoscale
-            plt.draw()
-            plt.pause(.2)
-            k=k+1
-
     if pos_thres > 0 and neg_thres > 0:
         logger.info("Optimal Pos Threshold Found: {}".format(pos_thres))
         logger.info("Optimal Neg Threshold Found: {}".format(neg_thres))
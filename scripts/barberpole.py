@@ -162,6 +162,22 @@ class barberpole(base_synthetic_input): # the class name should be the same as t
         stripes=np.floor(low+diff*0.5*(1+np.tanh(10*np.sin(2*np.pi*(y-tan*x-t*self.speed_pps)/wavelength))))
         return np.uint8(stripes)
 
+    def intensity(self, t, ys, xs):
+        """ Continuous-time intensity of the barberpole, bb_func() without quantization to uint8,
+        and the background outside the pole
+
+        :param t: time in float seconds, scalar or np.ndarray broadcastable with ys and xs
+        :param ys: np.ndarray of pixel rows
+        :param xs: np.ndarray of pixel columns
+        :returns: np.ndarray of float intensities
+        """
+        wavelength=(self.bb_width*self.w)/self.num_stripes
+        low=(self.bg*2)/(self.contrast+1)
+        diff=(self.contrast-1)*low
+        tan=np.tan((90-self.bb_angle)*np.pi/180)
+        stripes=low+diff*0.5*(1+np.tanh(10*np.sin(2*np.pi*(ys-tan*xs-np.asarray(t)*self.speed_pps)/wavelength)))
+        return np.where(self.pole_mask[ys, xs] == 1, stripes, float(self.bg))
+
 
 if __name__ == "__main__":
     m = barberpole()
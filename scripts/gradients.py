@@ -139,6 +139,28 @@ class gradients(base_synthetic_input):  # the class name should be the same as t
 
         return np.uint8(g)
 
+    def intensity(self, t, ys, xs):
+        """ Continuous-time intensity of im_function(), without quantization to uint8
+
+        :param t: time in float seconds, scalar or np.ndarray broadcastable with ys and xs
+        :param ys: np.ndarray of pixel rows
+        :param xs: np.ndarray of pixel columns
+        :returns: np.ndarray of float intensities
+        """
+        low = (self.bg * 2) / (self.contrast + 1)
+        high = self.contrast * low
+        diff = high - low
+        w2 = (self.bump_width*self.w) / 2
+        p = w2 + np.asarray(t) * self.speed_pps # center of bump location
+        p2 = p + w2*2 # center of sharp edges
+        x = np.broadcast_to(xs, np.broadcast(xs, ys, p).shape)
+        g = np.full(x.shape, low, dtype=np.float64)
+        # triangular bump
+        g = np.where((x > p - w2) & (x <= p + w2), high - (diff / w2) * np.abs(x - p), g)
+        # square wave
+        g = np.where((x > p2) & (x <= p2 + 10), high, g)
+        return g
+
 
 if __name__ == "__main__":
     m = gradients()
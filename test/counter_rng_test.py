@@ -0,0 +1,88 @@
+"""Check that the counter-based random numbers make the same events
+whatever the order of emulation: iteration loop or vectorized event
+generation, tiles, or a restart in the middle of the recording."""
+
+import logging
+
+import numpy as np
+import torch
+
+from v2ecore.counter_rng import philox4x32
+from v2ecore.emulator import EventEmulator
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+# known answer of Philox4x32-10 of the Random123 distribution
+words = philox4x32(
+    *[torch.tensor([w]) for w in (
+        0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344)],
+    0xa4093822, 0x299f31d0)
+assert [int(w) for w in words] == [
+    0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1]
+
+output_width, output_height = 346, 260
+
+# moving gratings over a random texture, with a flashing square
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(30):
+    frame = texture + 40 * np.sin(
+        0.7 * k + np.linspace(0, 6, output_width))[None, :] * (k % 3)
+    frame[10:40, 10:40] = 255 if k % 2 else 0
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+frame_times = np.cumsum(rng.uniform(0.5e-3, 1.5e-3, len(frames)))
+
+
+def emulate(**kwargs):
+    emulator = EventEmulator(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0.03,
+        cutoff_hz=200,
+        leak_rate_hz=0.5,
+        shot_noise_rate_hz=5,
+        seed=7,
+        device=torch_device,
+        output_width=output_width,
+        output_height=output_height,
+        counter_rng=True,
+        **kwargs)
+    events = []
+    for i in range(len(frames)):
+        new_events = emulator.generate_events(frames[i], frame_times[i])
+        if new_events is not None:
+            events.append(new_events)
+    return np.concatenate(events)
+
+
+reference = emulate()
+runs = {
+    'vectorized': emulate(vectorized_event_generation=True),
+    'tiles': emulate(tile_size=64, tile_workers=4),
+}
+for name, events in runs.items():
+    print("{}: {} events, {}".format(
+        name, events.shape[0],
+        "identical" if np.array_equal(reference, events) else "DIFFERENT"))
+    assert np.array_equal(reference, events)
+
+# the noise of a segment that starts later is that of the serial run,
+# only the mismatch of the first frame must be the same
+mismatch = EventEmulator(
+    seed=7, device=torch_device, counter_rng=True,
+    output_width=output_width, output_height=output_height)
+mismatch.frame_counter = 10
+mismatch.generate_events(frames[10], frame_times[10])
+serial = EventEmulator(
+    seed=7, device=torch_device, counter_rng=True,
+    output_width=output_width, output_height=output_height)
+serial.generate_events(frames[0], frame_times[0])
+assert torch.equal(mismatch.pos_thres, serial.pos_thres)
+assert torch.equal(mismatch.noise_rate_array, serial.noise_rate_array)
+print("segment mismatch identical")
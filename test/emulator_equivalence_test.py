@@ -0,0 +1,530 @@
+"""Check with a fixed seed that the faster paths of the DVS emulator make
+the same events as the paths they replace, on moving gratings over a
+random texture with a flashing square and a static stretch, that the
+event-driven emulator finds the threshold crossings of the frames, and
+that the 'direct' center surround solver converges to the Euler steps."""
+
+import contextlib
+import io
+import logging
+import os
+import tempfile
+
+import cv2
+import h5py
+import numpy as np
+import pytest
+import torch
+
+from v2ecore.emulator import EventEmulator
+from v2ecore.emulator_parallel import emulate_frames_parallel
+from v2ecore.emulator_event_driven import EventDrivenEmulator
+from v2ecore.emulator_mhy import EventEmulator as UniformEventEmulator
+from v2ecore.emulator_multi import MultiConfigEventEmulator
+from v2ecore.emulator_utils import integrate_surround, steady_state_surround
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+output_width, output_height = 96, 72
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(30):
+    if 12 <= k < 18:
+        # static frames
+        frames.append(frames[-1])
+        continue
+    frame = texture + 40 * np.sin(
+        0.7 * k + np.linspace(0, 6, output_width))[None, :] * (k % 3)
+    frame[10:40, 10:40] = 255 if k % 2 else 0
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+frame_times = np.cumsum(rng.uniform(0.5e-3, 1.5e-3, len(frames)))
+
+
+def emulator_parameters(**kwargs):
+    parameters = dict(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0.03,
+        cutoff_hz=200,
+        leak_rate_hz=0.5,
+        shot_noise_rate_hz=5,
+        seed=7,
+        device=torch_device,
+        output_width=output_width,
+        output_height=output_height)
+    parameters.update(kwargs)
+    return parameters
+
+
+def make_emulator(**kwargs):
+    return EventEmulator(**emulator_parameters(**kwargs))
+
+
+def emulate(emulator, first=0, stop=len(frames)):
+    """Returns the events of frames first to stop-1."""
+    events = []
+    for i in range(first, stop):
+        new_events = emulator.generate_events(frames[i], frame_times[i])
+        if new_events is not None:
+            events.append(new_events)
+    return np.concatenate(events)
+
+
+def check_identical(name, reference, events):
+    print("{}: {} events, {}".format(
+        name, events.shape[0],
+        "identical" if np.array_equal(reference, events) else "DIFFERENT"))
+    assert np.array_equal(reference, events)
+
+
+def test_vectorized_event_generation():
+    # the events of all sub-frame iterations in one pass
+    check_identical(
+        'vectorized', emulate(make_emulator()),
+        emulate(make_emulator(vectorized_event_generation=True)))
+
+
+# conversions of the uint8 frames to the inputs of generate_events()
+frame_inputs = {
+    'uint8 np.ndarray': lambda frame: frame,
+    'float32 np.ndarray': lambda frame: frame.astype(np.float32),
+    # a view with negative strides, e.g. of a flipped video
+    'np.ndarray view with negative strides':
+        lambda frame: np.ascontiguousarray(frame[::-1])[::-1],
+    'uint8 torch.Tensor': lambda frame: torch.from_numpy(frame),
+    'float64 torch.Tensor on the device': lambda frame: torch.tensor(
+        frame, dtype=torch.float64, device=torch_device),
+}
+
+
+@pytest.mark.parametrize('frame_input', list(frame_inputs))
+def test_frame_inputs(frame_input):
+    # the frames are staged on the device as float64 whatever their type
+    reference = emulate(make_emulator())
+    convert = frame_inputs[frame_input]
+    emulator = make_emulator()
+    events = []
+    for frame, t in zip(frames, frame_times):
+        new_events = emulator.generate_events(convert(frame), t)
+        if new_events is not None:
+            events.append(new_events)
+    check_identical(frame_input, reference, np.concatenate(events))
+
+
+def test_refractory_period():
+    # the vectorized refractory filter drops the events of the loop
+    refractory_period_s = 2e-3
+    reference = emulate(make_emulator(
+        refractory_period_s=refractory_period_s))
+    check_identical('vectorized refractory period', reference, emulate(
+        make_emulator(refractory_period_s=refractory_period_s,
+                      vectorized_event_generation=True)))
+    assert reference.shape[0] < emulate(make_emulator()).shape[0]
+    # events of a pixel are more than the refractory period apart,
+    # except ON and OFF events at the same time
+    order = np.lexsort((reference[:, 0], reference[:, 2], reference[:, 1]))
+    events = reference[order]
+    same_pixel = (np.diff(events[:, 1]) == 0) & (np.diff(events[:, 2]) == 0)
+    intervals = np.diff(events[:, 0])[same_pixel]
+    assert intervals[intervals > 0].min() > refractory_period_s - 1e-6
+
+
+def test_resume():
+    # a checkpoint in the middle, other random numbers drawn in between
+    # and a new emulator that resumes from it
+    for kwargs in ({}, {'vectorized_event_generation': True}):
+        reference = emulate(make_emulator(**kwargs))
+        emulator = make_emulator(**kwargs)
+        head = emulate(emulator, stop=15)
+        checkpoint = io.BytesIO()
+        torch.save(emulator.state_dict(), checkpoint)
+        torch.rand(1000)
+        np.random.rand(1000)
+        checkpoint.seek(0)
+        resumed = make_emulator(seed=8, **kwargs)
+        resumed.load_state_dict(torch.load(checkpoint, weights_only=False))
+        check_identical('resumed {}'.format(kwargs), reference, np.concatenate(
+            (head, emulate(resumed, first=15))))
+
+
+def test_tiles():
+    # tiles that do not divide the frames, updated in threads
+    reference = emulate(make_emulator(vectorized_event_generation=True))
+    for tile_size in (32, 50):
+        check_identical('tiles of {}'.format(tile_size), reference, emulate(
+            make_emulator(tile_size=tile_size, tile_workers=4)))
+
+
+def event_counts(events, first, stop):
+    """Returns the [2, height, width] ON and OFF event counts of each pixel
+    in frames first to stop-1."""
+    # the float32 frame times of the events
+    times = frame_times.astype(np.float32)
+    t_start = times[first - 1] if first > 0 else -1
+    events = events[(events[:, 0] > t_start)
+                    & (events[:, 0] <= times[stop - 1])]
+    counts = np.zeros((2, output_height, output_width), dtype=np.int64)
+    np.add.at(counts, ((events[:, 3] < 0).astype(int),
+                       events[:, 2].astype(int), events[:, 1].astype(int)), 1)
+    return counts
+
+
+def test_parallel_segments():
+    # emulate_frames_parallel() in worker processes, in segments of
+    # 10 frames that are warmed up over 5 ms
+    with tempfile.TemporaryDirectory() as folder:
+        frame_files = []
+        for i, frame in enumerate(frames):
+            frame_files.append(os.path.join(folder, '{:03d}.png'.format(i)))
+            cv2.imwrite(frame_files[-1], frame)
+
+        def emulate_parallel(num_workers, **kwargs):
+            segments = list(emulate_frames_parallel(
+                frame_files, frame_times, emulator_parameters(
+                    device='cpu', **kwargs),
+                num_workers=num_workers, overlap_s=5e-3))
+            return segments, np.concatenate(
+                [s.events for s in segments if s.events is not None])
+
+        # a single segment is a serial run
+        reference = emulate(make_emulator(device='cpu'))
+        check_identical('1 segment', reference, emulate_parallel(1)[1])
+
+        # the first segment is a serial run; without noise and lowpass
+        # filter, the memorized brightness of the later segments is within
+        # a threshold of the input like in a serial run, so that each
+        # pixel makes at most 2 events more or less of each polarity in
+        # each frame
+        no_noise = dict(shot_noise_rate_hz=0, leak_rate_hz=0, cutoff_hz=0)
+        reference = emulate(make_emulator(device='cpu', **no_noise))
+        segments, events = emulate_parallel(3, **no_noise)
+        first_events = segments[0].events
+        check_identical('first of 3 segments',
+                        reference[:first_events.shape[0]], first_events)
+        deviation = max(
+            np.abs(event_counts(reference, i, i + 1)
+                   - event_counts(events, i, i + 1)).max()
+            for i in range(len(frames)))
+        print("3 segments: {} instead of {} events, at most {} events more "
+              "or less per pixel, polarity and frame".format(
+                  events.shape[0], reference.shape[0], deviation))
+        assert deviation <= 2
+
+
+def test_active_pixel_update():
+    # without leak and shot noise, updating only the active pixels makes
+    # the events of the dense update, which does not skip the static
+    # frames here
+    no_noise = dict(leak_rate_hz=0, shot_noise_rate_hz=0)
+    for kwargs in ({}, {'cutoff_hz': 0}, {'refractory_period_s': 2e-3},
+                   {'vectorized_event_generation': True}):
+        # the seed of an emulator is set when it is made, so each one is
+        # run before the next one is made
+        dense = make_emulator(**no_noise, **kwargs)
+        dense._skip_static_frame = lambda *args: False
+        reference = emulate(dense)
+        active = make_emulator(active_pixel_update=True, **no_noise, **kwargs)
+        check_identical('active pixel update {}'.format(kwargs),
+                        reference, emulate(active))
+        assert active.num_pixel_updates < active.num_pixel_frames
+
+
+def test_threshold_crossing_timestamps():
+    # the same events as the vectorized event generation, only at other
+    # times within their frame
+    no_noise = dict(shot_noise_rate_hz=0)
+    reference = emulate(make_emulator(
+        vectorized_event_generation=True, **no_noise))
+    events = emulate(make_emulator(
+        threshold_crossing_timestamps=True, **no_noise))
+
+    def by_pixel(e):
+        return e[np.lexsort((e[:, 3], e[:, 2], e[:, 1])), 1:]
+
+    check_identical('threshold crossing pixels and polarities',
+                    by_pixel(reference), by_pixel(events))
+    assert np.all(np.diff(events[:, 0]) >= 0)
+    assert events[0, 0] >= frame_times[0] \
+        and events[-1, 0] <= frame_times[-1]
+
+    # a log intensity ramp of 0.5 over 1 ms crosses the thresholds 0.2 and
+    # 0.4 at 0.4 and 0.8 ms
+    emulator = make_emulator(
+        sigma_thres=0, cutoff_hz=0, leak_rate_hz=0, output_width=8,
+        output_height=8, threshold_crossing_timestamps=True, **no_noise)
+    emulator.generate_events(np.full((8, 8), 100.), 0.)
+    ramp_events = emulator.generate_events(
+        np.full((8, 8), 100. * np.exp(0.5)), 1e-3)
+    assert ramp_events.shape[0] == 2 * 64
+    assert np.all(ramp_events[:, 3] == 1)
+    assert np.allclose(np.unique(ramp_events[:, 0]), [0.4e-3, 0.8e-3],
+                       rtol=0, atol=1e-6)
+
+
+def test_event_driven_emulation():
+    # without noise, leak and lowpass filter, the events of a log intensity
+    # that changes linearly between the frames are those of the threshold
+    # crossing timestamps of the frames, up to the bisection tolerance and
+    # float32 timestamps
+    rng = np.random.RandomState(3)
+    height, width, frame_interval = 24, 32, 1e-3
+    texture = rng.uniform(np.log(40), np.log(200), (height, width))
+    log_frames = np.stack([texture + 0.6 * np.sin(
+        0.9 * k + np.linspace(0, 6, width))[None, :] for k in range(21)])
+    times = np.arange(log_frames.shape[0]) * frame_interval
+
+    def intensity(t, ys, xs):
+        k = np.clip(np.floor(t / frame_interval + 1e-9).astype(int),
+                    0, log_frames.shape[0] - 2)
+        a = (t - times[k]) / frame_interval
+        return np.exp((1 - a) * log_frames[k, ys, xs]
+                      + a * log_frames[k + 1, ys, xs])
+
+    max_log_rate = np.abs(np.diff(log_frames, axis=0)).max() / frame_interval
+    event_driven = EventDrivenEmulator(
+        pos_thres=0.2, neg_thres=0.2, sigma_thres=0, leak_rate_hz=0,
+        max_log_rate=1.01 * max_log_rate, time_tolerance=1e-9, seed=7)
+    reference = np.concatenate(list(event_driven.emulate(
+        intensity, height, width, times[0], times[-1])))
+    emulator = make_emulator(
+        sigma_thres=0, cutoff_hz=0, leak_rate_hz=0, shot_noise_rate_hz=0,
+        output_width=width, output_height=height,
+        threshold_crossing_timestamps=True)
+    events = []
+    for log_frame, t in zip(log_frames, times):
+        new_events = emulator.generate_events(np.exp(log_frame), t)
+        if new_events is not None:
+            events.append(new_events)
+    events = np.concatenate(events).astype(np.float64)
+
+    def by_pixel(e):
+        return e[np.lexsort((e[:, 0], e[:, 2], e[:, 1]))]
+
+    reference, events = by_pixel(reference), by_pixel(events)
+    check_identical('event-driven pixels and polarities',
+                    reference[:, 1:], events[:, 1:])
+    deviation = np.abs(reference[:, 0] - events[:, 0]).max()
+    print("event-driven timestamps: max deviation {:.3g} s".format(deviation))
+    assert deviation < 1e-6
+
+
+def replicated_laplacian(frame):
+    """Returns the 4-neighbour Laplacian with replicated borders of the
+    Euler steps of the surround diffuser."""
+    padded = torch.nn.functional.pad(
+        frame[None, None], (1, 1, 1, 1), mode='replicate')[0, 0]
+    return padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] \
+        + padded[1:-1, 2:] - 4 * frame
+
+
+def test_direct_surround():
+    # the surround of the 'direct' cs_solver over a frame against float64
+    # Euler steps, whose error is proportional to the step
+    surround_rng = np.random.RandomState(2)
+    photoreceptor = torch.from_numpy(surround_rng.uniform(2, 5, (24, 32)))
+    surround = torch.from_numpy(surround_rng.uniform(2, 5, (24, 32)))
+    cs_lambda_pixels, cs_tau_p, delta_time = 1.5, 1e-3, 0.5e-3
+    exact = integrate_surround(
+        surround, photoreceptor, cs_lambda_pixels, cs_tau_p, delta_time)
+    errors = []
+    for num_steps in (1000, 4000):
+        step = delta_time / num_steps
+        euler = surround.clone()
+        for _ in range(num_steps):
+            euler += step / cs_tau_p * (
+                photoreceptor - euler
+                + cs_lambda_pixels ** 2 * replicated_laplacian(euler))
+        errors.append((euler - exact).abs().max().item())
+        print("{} Euler steps: surround within {:.2g}".format(
+            num_steps, errors[-1]))
+    assert errors[1] < 1e-4 and errors[0] > 3.5 * errors[1]
+
+    # the steady state solves the linear system of the instantaneous
+    # surround, and is where the dynamics settle
+    steady_state = steady_state_surround(photoreceptor, cs_lambda_pixels)
+    residual = steady_state - cs_lambda_pixels ** 2 * replicated_laplacian(
+        steady_state) - photoreceptor
+    assert residual.abs().max() < 1e-10
+    assert torch.allclose(integrate_surround(
+        surround, photoreceptor, cs_lambda_pixels, cs_tau_p, 1.),
+        steady_state, rtol=0, atol=1e-10)
+
+
+def test_uniform_event_scheduling():
+    # emulator_mhy spreads the events of each pixel uniformly over the
+    # frame, in closed form or by iterations; without noise, each pixel
+    # makes the same events in each frame
+    num_frames = 10
+    runs = []
+    for closed_form_scheduling in (True, False):
+        emulator = UniformEventEmulator(
+            **emulator_parameters(
+                device='cpu', leak_rate_hz=0, shot_noise_rate_hz=0),
+            closed_form_scheduling=closed_form_scheduling)
+        events = []
+        # the iterations print their event counts
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(num_frames):
+                new_events = emulator.generate_events(
+                    frames[i], frame_times[i])
+                if new_events is not None:
+                    events.append(new_events)
+        runs.append(np.concatenate(events))
+    closed_form, iterative = runs
+    print("closed form {} events, iterations {} events".format(
+        closed_form.shape[0], iterative.shape[0]))
+    for i in range(num_frames):
+        assert np.array_equal(event_counts(closed_form, i, i + 1),
+                              event_counts(iterative, i, i + 1))
+
+    # the k'th of the n events of a pixel in a frame is at
+    # t_previous+(k+1)*delta_time/n
+    t_previous, t_frame = frame_times[1], frame_times[2]
+    events = closed_form[(closed_form[:, 0] > np.float32(t_previous))
+                         & (closed_form[:, 0] <= np.float32(t_frame))]
+    events = events[np.lexsort(
+        (events[:, 0], events[:, 3], events[:, 2], events[:, 1]))]
+    first = np.flatnonzero(np.any(np.diff(
+        events[:, 1:], axis=0, prepend=np.nan) != 0, axis=1))
+    counts = np.diff(np.append(first, events.shape[0]))
+    k = np.arange(events.shape[0]) - np.repeat(first, counts)
+    n = np.repeat(counts, counts)
+    assert events.shape[0] > 0 and n.max() > 1
+    assert np.allclose(
+        events[:, 0], t_previous + (k + 1) * (t_frame - t_previous) / n,
+        rtol=0, atol=1e-6)
+
+
+def test_aps_frame_sampling():
+    # the HDF5 frames of the APS frame sampling are a subset of the frames
+    # of a run that writes all frames, with the same timestamps and
+    # event indices, and the same events
+    def write_hdf5(**kwargs):
+        with tempfile.TemporaryDirectory() as folder:
+            emulator = make_emulator(
+                output_folder=folder, dvs_h5='events.h5', **kwargs)
+            emulator.prepare_storage(len(frames), frame_times)
+            for i in range(len(frames)):
+                emulator.generate_events(frames[i], frame_times[i])
+            emulator.cleanup()
+            with h5py.File(os.path.join(folder, 'events.h5'), 'r') as f:
+                return {name: f[name][()] for name in
+                        ('events', 'frame', 'frame_ts', 'frame_idx')}
+
+    all_frames = write_hdf5()
+    assert np.array_equal(all_frames['frame'], np.stack(frames))
+    sampled_runs = {
+        # frames 0, 4, ..., 28
+        'every 4th frame': (
+            write_hdf5(aps_frame_interval=4), np.arange(0, len(frames), 4)),
+        # the first frame of each 5 ms
+        'at 200 Hz': (
+            write_hdf5(aps_frame_rate_hz=200), np.flatnonzero(np.diff(
+                np.floor((frame_times - frame_times[0]) * 200 + 1e-6),
+                prepend=-np.inf) > 0)),
+        # not the static frames 12 to 17, copies of frame 11
+        'changed frames': (
+            write_hdf5(aps_frame_change=1),
+            np.setdiff1d(np.arange(len(frames)), np.arange(12, 18))),
+    }
+    for name, (sampled, frame_numbers) in sampled_runs.items():
+        print("{}: frames {}".format(name, frame_numbers.tolist()))
+        assert np.array_equal(sampled['events'], all_frames['events'])
+        for dataset in ('frame', 'frame_ts', 'frame_idx'):
+            assert np.array_equal(
+                sampled[dataset], all_frames[dataset][frame_numbers])
+
+
+def test_multiple_configurations():
+    # each configuration of the multi-configuration emulator makes the
+    # events of the vectorized event generation with its parameters
+    def emulate_configurations(**kwargs):
+        parameters = emulator_parameters(**kwargs)
+        del parameters['output_width'], parameters['output_height']
+        emulator = MultiConfigEventEmulator(**parameters)
+        events = [[] for _ in range(emulator.num_configs)]
+        for frame, t in zip(frames, frame_times):
+            new_events = emulator.generate_events(frame, t)
+            for k, config_events in enumerate(new_events or []):
+                if config_events is not None:
+                    events[k].append(config_events)
+        return [np.concatenate(e) for e in events]
+
+    def emulate_configuration(**kwargs):
+        emulator = make_emulator(vectorized_event_generation=True, **kwargs)
+        # the multi-configuration emulator does not skip static frames
+        emulator._skip_static_frame = lambda *args: False
+        return emulate(emulator)
+
+    # a single configuration makes the same events in the same order
+    check_identical('1 configuration', emulate_configuration(),
+                    emulate_configurations()[0])
+
+    # the shuffles of the configurations take random numbers, so only
+    # without leak and shot noise are the following frames the same,
+    # and the events of a frame are in another order
+    configurations = dict(
+        pos_thres=[0.15, 0.2, 0.3], neg_thres=[0.25, 0.2, 0.18],
+        refractory_period_s=[0, 1e-3, 0])
+    no_noise = dict(leak_rate_hz=0, shot_noise_rate_hz=0)
+
+    def sort(e):
+        return e[np.lexsort(e.T[::-1])]
+
+    for k, events in enumerate(
+            emulate_configurations(**configurations, **no_noise)):
+        parameters = {name: values[k]
+                      for name, values in configurations.items()}
+        check_identical('configuration {} sorted'.format(parameters), sort(
+            emulate_configuration(**parameters, **no_noise)), sort(events))
+
+
+def memorized_brightness(emulator):
+    """Returns the base_log_frame of the emulator or of its tiles."""
+    if emulator.pixel_tiles is not None:
+        return [tile.base_log_frame for tile in emulator.pixel_tiles.tiles]
+    return [emulator.base_log_frame]
+
+
+def test_static_frames():
+    # without noise and lowpass filter, the 6 static frames have no events
+    # and skip the event generation, with the same events and pixel
+    # states as without the skip
+    no_noise = dict(shot_noise_rate_hz=0, leak_rate_hz=0, cutoff_hz=0)
+    for kwargs in ({}, {'vectorized_event_generation': True},
+                   {'tile_size': 32}):
+        skipping = make_emulator(**no_noise, **kwargs)
+        reference = emulate(skipping)
+        assert skipping.num_static_frames == 6
+        emulator = make_emulator(**no_noise, **kwargs)
+        emulator._skip_static_frame = lambda *args: False
+        check_identical('static frames skipped {}'.format(kwargs),
+                        reference, emulate(emulator))
+        assert emulator.num_static_frames == 0
+        assert all(torch.equal(a, b) for a, b in zip(
+            memorized_brightness(skipping), memorized_brightness(emulator)))
+        assert skipping.t_previous == emulator.t_previous
+
+
+if __name__ == '__main__':
+    test_vectorized_event_generation()
+    for frame_input in frame_inputs:
+        test_frame_inputs(frame_input)
+    test_refractory_period()
+    test_resume()
+    test_tiles()
+    test_parallel_segments()
+    test_active_pixel_update()
+    test_threshold_crossing_timestamps()
+    test_event_driven_emulation()
+    test_direct_surround()
+    test_uniform_event_scheduling()
+    test_aps_frame_sampling()
+    test_multiple_configurations()
+    test_static_frames()
@@ -0,0 +1,104 @@
+"""Check that the AEDAT-2.0 and text outputs write the same bytes for
+EVENT_DTYPE records of the event arena as for the [N, 4] float arrays of
+the same events, and that a file reopened for appending and truncated to
+an offset(), as when resuming from a checkpoint, continues like a file
+written in one go."""
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from v2ecore.event_arena import EVENT_DTYPE, EventArena, records_to_events
+from v2ecore.output.ae_text_output import DVSTextOutput
+from v2ecore.output.aedat2_output import AEDat2Output
+
+output_width, output_height = 346, 260
+
+
+def make_records(num_events, t_start_us, seed):
+    """Returns random time-ordered EVENT_DTYPE records from an arena."""
+    rng = np.random.RandomState(seed)
+    arena = EventArena(capacity=16)
+    arena.append(
+        t_start_us + np.sort(rng.randint(0, 100_000_000, num_events)),
+        rng.randint(0, output_width, num_events),
+        rng.randint(0, output_height, num_events),
+        rng.choice([-1, 1], num_events))
+    return arena.events().copy()
+
+
+def open_output(kind, path, append=False):
+    if kind == 'aedat2':
+        return AEDat2Output(path, output_width=output_width,
+                            output_height=output_height, append=append)
+    return DVSTextOutput(path, append=append)
+
+
+def write(kind, path, *blocks):
+    """Writes the blocks of events to a new file and returns the bytes
+    after the header, which has the creation time."""
+    output = open_output(kind, path)
+    header_size = output.offset()['position']
+    for events in blocks:
+        output.appendEvents(events)
+    output.close()
+    with open(path, 'rb') as f:
+        return f.read()[header_size:]
+
+
+@pytest.mark.parametrize('kind', ['aedat2', 'text'])
+def test_records_and_float_events(kind):
+    records = make_records(1000, 0, seed=1)
+    assert records.dtype == EVENT_DTYPE
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'events')
+        written = write(kind, path, records[:400], records[400:])
+        float_written = write(kind, path, records_to_events(records))
+    print("{}: {} bytes of {} events, {}".format(
+        kind, len(written), records.shape[0],
+        "identical" if written == float_written else "DIFFERENT"))
+    assert len(written) > 0
+    assert written == float_written
+
+
+@pytest.mark.parametrize('kind', ['aedat2', 'text'])
+def test_resume(kind):
+    # the events of the first run after the checkpoint are dropped and
+    # written again by the resumed run
+    before, dropped, after = (make_records(300, 100_000_000 * k, seed=k)
+                              for k in range(3))
+    with tempfile.TemporaryDirectory() as folder:
+        reference = write(
+            kind, os.path.join(folder, 'reference'), before, after)
+
+        path = os.path.join(folder, 'events')
+        output = open_output(kind, path)
+        header_size = output.offset()['position']
+        output.appendEvents(before)
+        checkpoint = output.offset()
+        output.appendEvents(dropped)
+        output.close()
+
+        output = open_output(kind, path, append=True)
+        output.truncate(checkpoint)
+        assert output.numEventsWritten == before.shape[0]
+        output.appendEvents(records_to_events(after))
+        assert output.numEventsWritten == before.shape[0] + after.shape[0]
+        if kind == 'aedat2':
+            assert output.numOnEvents + output.numOffEvents == \
+                output.numEventsWritten
+            assert output.numOnEvents == \
+                np.count_nonzero(before['p'] > 0) + \
+                np.count_nonzero(after['p'] > 0)
+        output.close()
+        with open(path, 'rb') as f:
+            resumed = f.read()[header_size:]
+    assert resumed == reference
+
+
+if __name__ == '__main__':
+    for kind in ('aedat2', 'text'):
+        test_records_and_float_events(kind)
+        test_resume(kind)
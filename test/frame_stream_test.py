@@ -0,0 +1,160 @@
+"""Check the streams of frames of v2e --streaming: FramePairs makes the
+batches of consecutive frame pairs of SloMo, FrameStream hands the
+frames of a source running in a thread over a bounded queue, in order,
+and raises the errors of the source in the consumer, ordered_map keeps
+the order of the frames, FrameSink consumes them in a thread, and the
+stages overlap."""
+
+import threading
+import time
+
+import numpy as np
+import torch
+
+from v2ecore.dataloader import FramePairs
+from v2ecore.frame_stream import FrameStream, FrameSink, ordered_map, \
+    log_stream_metrics
+
+rng = np.random.RandomState(1)
+frames = [rng.randint(0, 255, (45, 70)).astype(np.uint8) for _ in range(11)]
+
+
+def to_tensor(image):
+    return torch.from_numpy(np.asarray(image, dtype=np.float32))[None]
+
+
+def check_threads_stopped(threads_before):
+    """Checks that the threads started since threads_before have
+    stopped, after waiting a little for those that are finishing."""
+    for thread in set(threading.enumerate()) - threads_before:
+        thread.join(timeout=1)
+        assert not thread.is_alive(), 'thread {} still running'.format(
+            thread.name)
+
+
+def test_frame_pairs():
+    # pairs of frames 0-1, 1-2, ... in batches of batch_size pairs
+    for batch_size in (1, 3, 4, 10, 16):
+        pairs = FramePairs(iter(frames), (70, 45), batch_size=batch_size,
+                           transform=to_tensor)
+        assert pairs.dim == (64, 32)
+        frame0 = torch.cat([b[0] for b in pairs])
+        frame1 = torch.cat([b[1] for b in FramePairs(
+            iter(frames), (70, 45), batch_size=batch_size,
+            transform=to_tensor)])
+        assert frame0.shape == (len(frames) - 1, 1, 32, 64)
+        assert torch.equal(frame0[1:], frame1[:-1])
+        assert all(len(b[0]) <= batch_size for b in pairs)
+    print("frame pairs ok")
+
+
+def test_frame_stream():
+    # frames in order, at most max_size waiting in the queue
+    threads_before = set(threading.enumerate())
+    produced = []
+
+    def source():
+        for i, frame in enumerate(frames):
+            produced.append(i)
+            yield i, frame
+
+    stream = FrameStream('test', source(), max_size=2)
+    time.sleep(0.5)
+    # max_size frames in the queue and one waiting to be put
+    assert len(produced) == 3, produced
+    received = list(stream)
+    assert [i for i, _ in received] == list(range(len(frames)))
+    assert all(np.array_equal(frame, frames[i]) for i, frame in received)
+    check_threads_stopped(threads_before)
+    print("frame stream ok")
+
+
+def test_frame_stream_errors_and_close():
+    threads_before = set(threading.enumerate())
+
+    # the errors of the source are raised in the consumer
+    def failing_source():
+        yield 0
+        raise RuntimeError('decode failed')
+
+    try:
+        list(FrameStream('failing', failing_source()))
+        assert False, 'error not raised'
+    except RuntimeError as e:
+        assert str(e) == 'decode failed'
+
+    # closing stops a source blocked on a full queue
+    stream = FrameStream('closed', iter(range(100)), max_size=1)
+    stream.close()
+    assert not stream.thread.is_alive()
+    check_threads_stopped(threads_before)
+    print("frame stream errors and close ok")
+
+
+def test_ordered_map():
+    # results in the order of the items, whatever the worker that is first
+    threads_before = set(threading.enumerate())
+    results = list(ordered_map(
+        lambda i: (time.sleep(0.01 * (i % 3)), i)[1], iter(range(30)),
+        workers=4, max_size=5))
+    assert results == list(range(30))
+    check_threads_stopped(threads_before)
+    print("ordered map ok")
+
+
+def slow(items):
+    for item in items:
+        time.sleep(0.02)
+        yield item
+
+
+def test_overlapping_stages():
+    # three stages of 20 ms per frame take about the time of one stage
+    threads_before = set(threading.enumerate())
+    num_items = 20
+    consumed = []
+    start = time.time()
+    first = FrameStream('first', slow(iter(range(num_items))), max_size=4)
+    second = FrameStream('second', slow(first), max_size=4)
+    sink = FrameSink('sink', lambda i: (time.sleep(0.02), consumed.append(i)),
+                     max_size=4)
+    for item in second:
+        sink.put(item)
+    sink.close()
+    duration = time.time() - start
+    assert consumed == list(range(num_items))
+    print("3 stages of {:.1f}s took {:.2f}s".format(
+        0.02 * num_items, duration))
+    assert duration < 2 * 0.02 * num_items
+    metrics = first.metrics()
+    assert metrics['items'] == num_items and metrics['max_depth'] <= 4
+    log_stream_metrics([first, second, sink])
+    check_threads_stopped(threads_before)
+
+
+def test_frame_sink_errors():
+    # the errors of the consumer of a sink are raised in the producer
+    threads_before = set(threading.enumerate())
+
+    def fail(item):
+        raise ValueError('render failed')
+
+    sink = FrameSink('failing', fail, max_size=1)
+    try:
+        for i in range(10):
+            sink.put(i)
+        sink.close()
+        assert False, 'error not raised'
+    except ValueError as e:
+        assert str(e) == 'render failed'
+    check_threads_stopped(threads_before)
+    print("frame sink ok")
+
+
+if __name__ == '__main__':
+    test_frame_pairs()
+    test_frame_stream()
+    test_frame_stream_errors_and_close()
+    test_ordered_map()
+    test_overlapping_stages()
+    test_frame_sink_errors()
@@ -0,0 +1,59 @@
+"""Check that the fused pixel pipeline makes the same events as the eager one."""
+
+import numpy as np
+import torch
+
+from v2ecore.emulator import EventEmulator
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+output_width, output_height = 346, 260
+
+# moving gratings over a random texture, with a flashing square
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(30):
+    frame = texture + 40 * np.sin(
+        0.7 * k + np.linspace(0, 6, output_width))[None, :] * (k % 3)
+    frame[10:40, 10:40] = 255 if k % 2 else 0
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+frame_times = np.cumsum(rng.uniform(0.5e-3, 1.5e-3, len(frames)))
+
+configs = [
+    dict(cutoff_hz=0, leak_rate_hz=0, shot_noise_rate_hz=0),
+    dict(cutoff_hz=200, leak_rate_hz=0.5, shot_noise_rate_hz=5),
+    dict(cutoff_hz=200, leak_rate_hz=0.5, shot_noise_rate_hz=5,
+         vectorized_event_generation=True),
+    dict(cutoff_hz=200, leak_rate_hz=0.5, shot_noise_rate_hz=0,
+         threshold_crossing_timestamps=True),
+]
+
+for config in configs:
+    events = {}
+    for fused in (False, True):
+        emulator = EventEmulator(
+            pos_thres=0.2,
+            neg_thres=0.2,
+            sigma_thres=0.03,
+            seed=7,
+            device=torch_device,
+            output_width=output_width,
+            output_height=output_height,
+            fused_pixel_pipeline=fused,
+            **config)
+        events_fused = []
+        for frame, t in zip(frames, frame_times):
+            new_events = emulator.generate_events(frame, t)
+            if new_events is not None:
+                events_fused.append(new_events)
+        events[fused] = np.concatenate(events_fused)
+
+    print("{}: {} events, {}".format(
+        config, events[False].shape[0],
+        "identical" if np.array_equal(events[False], events[True])
+        else "DIFFERENT"))
+    assert np.array_equal(events[False], events[True])
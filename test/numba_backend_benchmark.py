@@ -0,0 +1,82 @@
+"""Compare the numba backend with the torch CPU backend of the emulator.
+
+Without noise, both backends make the same events; with leak and shot noise
+the event counts agree statistically. The frame rate of each backend
+is printed.
+"""
+
+import logging
+import time
+
+import numpy as np
+import torch
+
+from v2ecore.emulator import EventEmulator
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+output_width, output_height = 346, 260
+num_frames = 200
+frame_interval = 1e-3
+
+# moving gratings over a random texture
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(num_frames):
+    frame = texture + 40 * np.sin(
+        0.2 * k + np.linspace(0, 6, output_width))[None, :]
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+
+
+def emulate(device, **kwargs):
+    emulator = EventEmulator(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0.03,
+        cutoff_hz=200,
+        seed=7,
+        device=device,
+        output_width=output_width,
+        output_height=output_height,
+        **kwargs)
+    events = []
+    # first frames initialize the states and compile the kernels
+    for i in range(3):
+        emulator.generate_events(frames[i], i * frame_interval)
+    start = time.time()
+    for i in range(3, num_frames):
+        new_events = emulator.generate_events(frames[i], i * frame_interval)
+        if new_events is not None:
+            events.append(new_events)
+    fps = (num_frames - 3) / (time.time() - start)
+    return np.concatenate(events), fps
+
+
+configs = [
+    dict(leak_rate_hz=0, shot_noise_rate_hz=0),
+    dict(leak_rate_hz=0.5, shot_noise_rate_hz=2),
+    dict(leak_rate_hz=0.5, shot_noise_rate_hz=2, refractory_period_s=5e-3),
+]
+
+for config in configs:
+    results = {
+        'torch cpu': emulate('cpu', **config),
+        'torch cpu vectorized': emulate(
+            'cpu', vectorized_event_generation=True, **config),
+        'numba': emulate('numba', **config),
+    }
+    print(config)
+    for name, (events, fps) in results.items():
+        print('  {}: {} events, {:.1f} frames/s'.format(
+            name, events.shape[0], fps))
+
+    if config['leak_rate_hz'] == 0 and config['shot_noise_rate_hz'] == 0:
+        events_torch, events_numba = \
+            results['torch cpu'][0], results['numba'][0]
+        assert np.array_equal(
+            events_torch[np.lexsort(events_torch.T[::-1])],
+            events_numba[np.lexsort(events_numba.T[::-1])])
@@ -0,0 +1,75 @@
+"""Check that the numba backend makes the same events as the torch CPU
+backend when the noise is off.
+
+The numba backend draws its own random numbers, so only the events of
+each frame are compared, sorted; with leak and shot noise they agree only
+statistically, see numba_backend_benchmark.py."""
+
+import logging
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip('numba')
+
+from v2ecore.emulator import EventEmulator  # noqa: E402
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+output_width, output_height = 346, 260
+
+# moving gratings over a random texture, with a flashing square
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(30):
+    frame = texture + 40 * np.sin(
+        0.7 * k + np.linspace(0, 6, output_width))[None, :] * (k % 3)
+    frame[10:40, 10:40] = 255 if k % 2 else 0
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+frame_times = np.cumsum(rng.uniform(0.5e-3, 1.5e-3, len(frames)))
+
+
+def emulate(device, **kwargs):
+    """Returns the events of each frame, sorted."""
+    emulator = EventEmulator(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0.03,
+        cutoff_hz=200,
+        leak_rate_hz=0,
+        shot_noise_rate_hz=0,
+        seed=7,
+        device=device,
+        output_width=output_width,
+        output_height=output_height,
+        **kwargs)
+    events = []
+    for frame, t in zip(frames, frame_times):
+        new_events = emulator.generate_events(frame, t)
+        if new_events is not None:
+            events.append(new_events[np.lexsort(new_events.T[::-1])])
+    return events
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'refractory_period_s': 2e-3}])
+def test_numba_backend(kwargs):
+    reference = emulate('cpu', **kwargs)
+    events = emulate('numba', **kwargs)
+    print("numba backend {}: {} events, {}".format(
+        kwargs, sum(e.shape[0] for e in events),
+        "identical" if len(reference) == len(events) and all(
+            np.array_equal(a, b) for a, b in zip(reference, events))
+        else "DIFFERENT"))
+    assert len(reference) == len(events)
+    for a, b in zip(reference, events):
+        assert np.array_equal(a, b)
+
+
+if __name__ == '__main__':
+    test_numba_backend({})
+    test_numba_backend({'refractory_period_s': 2e-3})
@@ -0,0 +1,113 @@
+"""Compare the leak events of a static scene with the leak applied to all
+pixels at each frame and with scheduled_leak, which only updates the
+pixels whose next leak event can fall in the frame interval: the number
+of leak events per pixel and the intervals between them must have the
+same statistics. A pixel that the input brings near its threshold in the
+middle of a leak time bucket must make its leak event at the same time
+as with the leak applied at each frame."""
+
+import logging
+import time
+
+import numpy as np
+import torch
+
+from v2ecore.emulator import EventEmulator
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+output_width, output_height = 346, 260
+num_frames = 2000
+frame_interval_s = 1e-3
+
+texture = np.random.RandomState(1).randint(
+    0, 255, (output_height, output_width)).astype(np.uint8)
+
+
+def emulate(scheduled_leak):
+    emulator = EventEmulator(
+        cutoff_hz=0,
+        leak_rate_hz=1,
+        shot_noise_rate_hz=0,
+        seed=7,
+        device=torch_device,
+        output_width=output_width,
+        output_height=output_height,
+        vectorized_event_generation=True,
+        scheduled_leak=scheduled_leak)
+    emulator.generate_events(texture, 0)
+    events = []
+    start = time.time()
+    for i in range(1, num_frames + 1):
+        new_events = emulator.generate_events(texture, i * frame_interval_s)
+        if new_events is not None:
+            events.append(new_events)
+    duration = time.time() - start
+    events = np.concatenate(events)
+
+    pixels = (events[:, 2] * output_width + events[:, 1]).astype(np.int64)
+    counts = np.bincount(pixels, minlength=output_width * output_height)
+    order = np.lexsort((events[:, 0], pixels))
+    same_pixel = pixels[order][1:] == pixels[order][:-1]
+    intervals = np.diff(events[order, 0])[same_pixel]
+    print("scheduled_leak={}: {:.2f} ms/frame, {} events, per pixel "
+          "mean {:.3f} var {:.3f}, interval mean {:.4f}s std {:.4f}s".format(
+              scheduled_leak, duration / num_frames * 1e3, events.shape[0],
+              counts.mean(), counts.var(), intervals.mean(), intervals.std()))
+    return counts, intervals
+
+
+dense_counts, dense_intervals = emulate(False)
+counts, intervals = emulate(True)
+
+assert abs(counts.mean() - dense_counts.mean()) < 0.01 * dense_counts.mean()
+assert abs(counts.var() - dense_counts.var()) < 0.05 * dense_counts.var()
+assert abs(intervals.mean() - dense_intervals.mean()) < \
+    0.01 * dense_intervals.mean()
+assert abs(intervals.std() - dense_intervals.std()) < \
+    0.05 * dense_intervals.std()
+print("same leak statistics")
+
+
+# without jitter and mismatch, the leak is deterministic: a step of the
+# input 4 ms after the first bucket started leaves half of the pixels
+# 0.55e-3 below the ON threshold, which the leak reaches 2.75 ms later
+def first_step_event(scheduled_leak):
+    width, height = 32, 24
+    step_interval_s = 0.5e-3
+    emulator = EventEmulator(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0,
+        cutoff_hz=0,
+        leak_rate_hz=1,
+        shot_noise_rate_hz=0,
+        leak_jitter_fraction=0,
+        noise_rate_cov_decades=0,
+        seed=7,
+        device=torch_device,
+        output_width=width,
+        output_height=height,
+        scheduled_leak=scheduled_leak)
+    frame = np.full((height, width), 100., dtype=np.float32)
+    stepped = frame.copy()
+    stepped[:, :width // 2] = 100 * np.exp(0.2 - 0.55e-3 - 4e-3 * 0.2)
+    emulator.generate_events(frame, 0)
+    for i in range(1, 60):
+        t = i * step_interval_s
+        new_events = emulator.generate_events(
+            stepped if t >= 4e-3 else frame, t)
+        if new_events is not None and new_events.shape[0] > 0:
+            return new_events[:, 0].min(), new_events.shape[0]
+
+
+dense_step = first_step_event(False)
+step = first_step_event(True)
+print("first leak event after a step in the bucket at {:.4f}s ({} events), "
+      "scheduled_leak at {:.4f}s ({} events)".format(*dense_step, *step))
+assert step == dense_step
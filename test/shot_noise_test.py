@@ -0,0 +1,69 @@
+"""Check that the sparse shot noise sampler has the per-pixel ON and OFF
+rates of the default sampler, which draws one random number per pixel and
+sub-frame iteration, and that neither makes an ON and an OFF event in the
+same iteration of a pixel."""
+
+import numpy as np
+import torch
+
+from v2ecore.emulator_utils import generate_shot_noise
+from v2ecore.emulator_utils import generate_shot_noise_sparse
+from v2ecore.emulator_utils import shot_noise_probabilities
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+height, width = 32, 32
+num_iters = 10000
+
+# intensities and threshold mismatch of the pixels
+rng = np.random.RandomState(1)
+inten01 = torch.tensor(rng.uniform(0, 1, (height, width)), device=torch_device)
+pos_thres_pre_prob = torch.tensor(
+    rng.uniform(0.8, 1.2, (height, width)), device=torch_device)
+neg_thres_pre_prob = torch.tensor(
+    rng.uniform(0.8, 1.2, (height, width)), device=torch_device)
+# up to 2% event probability per iteration, low enough that two
+# candidates of the sparse sampler rarely fall on the same iteration
+shot_noise = dict(
+    shot_noise_rate_hz=40,
+    delta_time=num_iters * 1e-3,
+    num_iters=num_iters,
+    shot_noise_inten_factor=0.25,  # as EventEmulator
+    inten01=inten01,
+    pos_thres_pre_prob=pos_thres_pre_prob,
+    neg_thres_pre_prob=neg_thres_pre_prob)
+
+
+def test_sparse_shot_noise():
+    torch.manual_seed(7)
+    one_minus_shot_on_prob, shot_off_prob = shot_noise_probabilities(
+        **shot_noise)
+    expected = [num_iters * (1 - one_minus_shot_on_prob),
+                num_iters * shot_off_prob]
+    samplers = {
+        'dense': generate_shot_noise(**shot_noise),
+        'sparse': [cord.to_dense()
+                   for cord in generate_shot_noise_sparse(**shot_noise)],
+    }
+    for name, (shot_on_cord, shot_off_cord) in samplers.items():
+        assert not torch.any(shot_on_cord & shot_off_cord)
+        for polarity, cord, expected_counts in zip(
+                ('ON', 'OFF'), (shot_on_cord, shot_off_cord), expected):
+            counts = cord.sum(dim=0).double()
+            # mean rate of all pixels, and the Poisson deviations of the
+            # pixels from their rates
+            mean_ratio = float(counts.sum() / expected_counts.sum())
+            rms_z = float(torch.sqrt(torch.mean(
+                (counts - expected_counts) ** 2 / expected_counts)))
+            print("{} {}: {:.0f} events, {:.3f} of the mean rate, "
+                  "rms deviation {:.2f} sigma".format(
+                      name, polarity, float(counts.sum()), mean_ratio, rms_z))
+            assert abs(mean_ratio - 1) < 0.03
+            assert 0.85 < rms_z < 1.15
+
+
+if __name__ == '__main__':
+    test_sparse_shot_noise()
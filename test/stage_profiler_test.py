@@ -0,0 +1,94 @@
+"""Time the stages of the emulator with the stage profiler, as JSON lines
+and as a Chrome trace, and check that the timers do not change the
+events."""
+
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from v2ecore.emulator import EventEmulator
+from v2ecore.stage_profiler import disable_stage_profiler
+from v2ecore.stage_profiler import enable_stage_profiler
+
+logging.disable(logging.WARNING)  # no events warnings of static frames
+
+# disable torch grad
+torch.set_grad_enabled(False)
+
+torch_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+output_width, output_height = 346, 260
+
+# moving gratings over a random texture
+rng = np.random.RandomState(1)
+texture = rng.randint(0, 255, (output_height, output_width))
+frames = []
+for k in range(20):
+    frame = texture + 40 * np.sin(
+        0.7 * k + np.linspace(0, 6, output_width))[None, :] * (k % 3)
+    frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+
+
+def emulate(folder, **kwargs):
+    emulator = EventEmulator(
+        pos_thres=0.2,
+        neg_thres=0.2,
+        sigma_thres=0.03,
+        cutoff_hz=200,
+        leak_rate_hz=0.5,
+        shot_noise_rate_hz=5,
+        seed=7,
+        device=torch_device,
+        output_folder=folder,
+        dvs_h5='events.h5',
+        output_width=output_width,
+        output_height=output_height,
+        **kwargs)
+    events = []
+    for i, frame in enumerate(frames):
+        new_events = emulator.generate_events(frame, i * 1e-3)
+        if new_events is not None:
+            events.append(new_events)
+    emulator.cleanup()
+    return np.concatenate(events)
+
+
+with tempfile.TemporaryDirectory() as folder:
+    reference = emulate(folder)
+
+    path = os.path.join(folder, 'stages.jsonl')
+    enable_stage_profiler(path)
+    events = emulate(folder)
+    disable_stage_profiler()
+    assert np.array_equal(reference, events)
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    stages = set(r['stage'] for r in records)
+    print("JSON lines: {} records of stages {}".format(
+        len(records), sorted(stages)))
+    for name in ('generate_events', 'lin_log', 'low_pass_filter', 'leak',
+                 'event_map', 'shot_noise', 'event_generation', 'shuffle',
+                 'h5_resize'):
+        assert name in stages, name
+    frames_timed = sorted(
+        r['frame'] for r in records if r['stage'] == 'generate_events')
+    assert frames_timed == list(range(len(frames)))
+    # the stages inside generate_events have its frame number
+    assert all('frame' in r for r in records)
+    assert all(r['iterations'] >= 1 for r in records
+               if r['stage'] == 'event_generation')
+
+    path = os.path.join(folder, 'stages.json')
+    enable_stage_profiler(path)
+    events = emulate(folder, vectorized_event_generation=True)
+    disable_stage_profiler()
+    assert np.array_equal(reference, events)
+    with open(path) as f:
+        trace = json.load(f)
+    print("Chrome trace: {} events".format(len(trace['traceEvents'])))
+    assert all(e['ph'] == 'X' and e['dur'] >= 0
+               for e in trace['traceEvents'])
@@ -0,0 +1,70 @@
+"""Check that v2e --streaming makes the same events as the temporary frame
+folders, without SloMo and, if the SloMo model is there, with a fixed
+upsampling factor."""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+v2e_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'v2e.py')
+slomo_model = os.path.join(os.path.dirname(v2e_path),
+                           'input', 'SuperSloMo39.ckpt')
+
+
+def write_video(path, num_frames=20):
+    """Writes a texture moving by 2 pixels per frame."""
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (240, 180))
+    texture = np.random.RandomState(0).randint(
+        0, 255, (180, 240 + 2 * num_frames, 3)).astype(np.uint8)
+    for k in range(num_frames):
+        writer.write(np.ascontiguousarray(texture[:, 2 * k:2 * k + 240]))
+    writer.release()
+
+
+def v2e_events(folder, video, *options):
+    output_folder = os.path.join(folder, 'out{}'.format(len(os.listdir(
+        folder))))
+    subprocess.run(
+        [sys.executable, v2e_path, '-i', video, '-o', output_folder,
+         '--overwrite', '--unique_output_folder', 'false', '--dvs240',
+         '--dvs_text', 'events.txt', '--no_preview', '--skip_video_output',
+         '--dvs_exposure', 'duration', '0.01', '--dvs_emulator_seed', '3']
+        + list(options), check=True)
+    return np.loadtxt(os.path.join(output_folder, 'events.txt'))
+
+
+def check_same_events(*options):
+    with tempfile.TemporaryDirectory() as folder:
+        video = os.path.join(folder, 'moving.avi')
+        write_video(video)
+        events = v2e_events(folder, video, *options)
+        streamed_events = v2e_events(folder, video, '--streaming', *options)
+    print("{}: {} events, {}".format(
+        ' '.join(options), events.shape[0],
+        "identical" if np.array_equal(events, streamed_events)
+        else "DIFFERENT"))
+    assert np.array_equal(events, streamed_events)
+
+
+def test_streaming_without_slomo():
+    check_same_events('--disable_slomo')
+
+
+def test_streaming_with_slomo():
+    if not os.path.isfile(slomo_model):
+        print("no SloMo model {}, skipped".format(slomo_model))
+        return
+    check_same_events(
+        '--auto_timestamp_resolution', 'false', '--timestamp_resolution',
+        '0.01', '--batch_size', '3')
+
+
+if __name__ == '__main__':
+    test_streaming_without_slomo()
+    test_streaming_with_slomo()
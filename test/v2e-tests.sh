@@ -10,3 +10,6 @@ python v2e.py  --input input/box-moving-white.mp4 --output_folder=output/v2e-tes
 # convert a synthetic file with slow bandwidth and lots of noise
 python v2e.py  --input input/box-moving-white.mp4 --output_folder=output/v2e-test-white-dot-noisy-1ms --unique_output_folder --pos_thres=.15 --neg_thres=.15 --sigma_thres=0.05 --cutoff=10 --leak_rate=0.1 --shot=0.1 --dvs_exposure duration 0.005 --timestamp=1e-3 --dvs_aedat2 v2e.aedat --output_width=346 --output_height=260 --batch=8 --no_preview
 
+# emulate a continuous-time synthetic input event by event, without frames
+python v2e.py --synthetic_input=scripts.gradients --event_driven --output_folder=output/v2e-test-gradients-event-driven --unique_output_folder --dvs_exposure duration 0.005 --dvs_aedat2 v2e.aedat --output_width=346 --output_height=260 --no_preview
+
@@ -11,6 +11,7 @@ frames from the original video frames.
 
 import glob
 import argparse
+import hashlib
 import importlib
 import sys
 
@@ -26,8 +27,9 @@ import torch
 
 import v2ecore.desktop as desktop
 from v2ecore.base_synthetic_input import base_synthetic_input
+from v2ecore.emulator_event_driven import EventDrivenEmulator
 from v2ecore.v2e_utils import all_images, read_image, \
-    check_lowpass, v2e_quit
+    check_lowpass, v2e_quit, luma_frames, read_frames, luma_frame
 from v2ecore.v2e_utils import set_output_dimension
 from v2ecore.v2e_utils import set_output_folder
 from v2ecore.v2e_utils import ImageFolderReader
@@ -36,9 +38,14 @@ from v2ecore.v2e_args import v2e_check_dvs_exposure_args
 from v2ecore.v2e_args import NO_SLOWDOWN
 from v2ecore.renderer import EventRenderer, ExposureMode
 from v2ecore.slomo import SuperSloMo
-# from v2ecore.emulator import EventEmulator
+from v2ecore.emulator import EventEmulator
 # from v2ecore.emulator_mhy import EventEmulator
-from v2ecore.emulator_sparse import EventEmulator
+from v2ecore.emulator_parallel import emulate_frames_parallel
+from v2ecore.event_arena import is_event_records, records_to_events
+from v2ecore.frame_stream import FrameStream, FrameSink, ordered_map, \
+    log_stream_metrics
+from v2ecore.stage_profiler import enable_stage_profiler, \
+    disable_stage_profiler, begin_stage, end_stage, stage
 from v2ecore.v2e_utils import inputVideoFileDialog
 import logging
 import time
@@ -103,6 +110,37 @@ def get_args():
     return (args_namespace,other_args,command_line)
 
 
+def update_frames_digest(frames_digest, frames, times):
+    """Adds the (interpolated) frames and their times to the SHA-1 digest
+    of the emulated frames that is saved with the checkpoints."""
+    for frame, t in zip(frames, times):
+        frames_digest.update(np.ascontiguousarray(frame).tobytes())
+        frames_digest.update(np.float64(t).tobytes())
+
+
+def save_checkpoint(checkpoint_file, emulator, frame_index, num_frames,
+                    frames_digest):
+    """Saves the emulator state to resume the DVS emulation at frame_index.
+
+    The SHA-1 digest of the frames before frame_index is saved with it,
+    so that resuming can check that the frames decoded and interpolated
+    again are the same, see update_frames_digest().
+    The file is replaced atomically, so an interruption while saving
+    keeps the previous checkpoint.
+    """
+    checkpoint = {
+        'frame_index': frame_index,
+        'num_frames': num_frames,
+        'frames_sha1': frames_digest.hexdigest(),
+        'emulator': emulator.state_dict(),
+    }
+    tmp_file = checkpoint_file + '.tmp'
+    torch.save(checkpoint, tmp_file)
+    os.replace(tmp_file, checkpoint_file)
+    logger.debug(f'saved checkpoint at frame {frame_index} to '
+                 f'{checkpoint_file}')
+
+
 def main():
     try:
         ga = Gooey(get_args, program_name="v2e", default_size=(575, 600))
@@ -136,14 +174,30 @@ def main():
             v2e_quit(1)
 
     # Set output folder
+    # resuming continues in the output folder of the interrupted run
+    overwrite = args.overwrite or args.resume
     output_folder = set_output_folder(
         args.output_folder,
         input_file,
-        args.unique_output_folder if not args.overwrite else False,
-        args.overwrite,
+        args.unique_output_folder if not overwrite else False,
+        overwrite,
         args.output_in_place if (not synthetic_input) else False,
         logger)
 
+    # checkpoint of the DVS emulation to resume from
+    checkpoint_file = args.checkpoint_file if args.checkpoint_file \
+        else os.path.join(output_folder, 'v2e-checkpoint.pt')
+    resume_checkpoint = None
+    if args.resume:
+        if os.path.isfile(checkpoint_file):
+            logger.info(f'resuming from checkpoint {checkpoint_file}')
+            resume_checkpoint = torch.load(
+                checkpoint_file, map_location='cpu', weights_only=False)
+        else:
+            logger.warning(
+                f'--resume: no checkpoint {checkpoint_file} found, '
+                f'starting from the beginning')
+
     # Set output width and height based on the arguments
     output_width, output_height = set_output_dimension(
         args.output_width, args.output_height,
@@ -191,6 +245,12 @@ def main():
             logger.error(f'{synthetic_input} method incorrect?: {e}')
             v2e_quit(1)
 
+    if args.event_driven and (synthetic_input_instance is None
+                              or not synthetic_input_instance.has_intensity()):
+        logger.error('--event_driven needs a --synthetic_input that '
+                     'implements intensity(t, ys, xs)')
+        v2e_quit(1)
+
 
 
 
@@ -301,6 +361,25 @@ def main():
     # added by Haiyang Mei
     polarization_input = args.polarization_input
 
+    # stream the video frames, else pass them through the frame folders
+    streaming = args.streaming
+    if streaming:
+        unsupported = [option for option, used in (
+            ('--polarization_input', polarization_input),
+            ('--davis_output', args.davis_output),
+            ('--emulator_processes', args.emulator_processes > 1),
+            ('checkpoints', args.checkpoint_interval > 0 or args.resume),
+            # the frame times are normalized by the time of the last SloMo
+            # frame, which automatic upsampling only finds at the end
+            ('--auto_timestamp_resolution with SloMo',
+             not args.disable_slomo and args.auto_timestamp_resolution))
+            if used]
+        if unsupported:
+            logger.warning(
+                f'--streaming is not supported with '
+                f'{", ".join(unsupported)}, using the frame folders')
+            streaming = False
+
     # DVS exposure
     exposure_mode, exposure_val, area_dimension = \
         v2e_check_dvs_exposure_args(args)
@@ -310,6 +389,11 @@ def main():
 
     time_run_started = time.time()
 
+    if args.profile_stages:
+        enable_stage_profiler(
+            os.path.join(output_folder, args.profile_stages),
+            cuda_sync=torch.cuda.is_available())
+
     slomoTimestampResolutionS = None
 
     if synthetic_input is None:
@@ -489,7 +573,8 @@ def main():
                 'frames with {} events), '
                 .format(exposure_val))
 
-    emulator = EventEmulator(
+    # DVS model arguments, also used by the --emulator_processes workers
+    emulator_args = dict(
         pos_thres=pos_thres, neg_thres=neg_thres,
         sigma_thres=sigma_thres, cutoff_hz=cutoff_hz,
         leak_rate_hz=leak_rate_hz, shot_noise_rate_hz=shot_noise_rate_hz,
@@ -497,12 +582,29 @@ def main():
         noise_rate_cov_decades=args.noise_rate_cov_decades,
         refractory_period_s=args.refractory_period,
         seed=args.dvs_emulator_seed,
+        output_width=output_width, output_height=output_height,
+        device=torch_device if args.emulator_backend == 'torch' else 'numba',
+        cs_lambda_pixels=args.cs_lambda_pixels, cs_tau_p_ms=args.cs_tau_p_ms,
+        cs_solver=args.cs_solver,
+        vectorized_event_generation=args.vectorized_event_generation,
+        active_pixel_update=args.active_pixel_update,
+        sparse_shot_noise=args.sparse_shot_noise,
+        compact_events=args.compact_events,
+        tile_size=args.tile_size, tile_workers=args.tile_workers,
+        threshold_crossing_timestamps=args.threshold_crossing_timestamps,
+        fused_pixel_pipeline=args.fused_pixel_pipeline,
+        counter_rng=args.counter_rng,
+        scheduled_leak=args.scheduled_leak,
+    )
+    emulator = EventEmulator(
         output_folder=output_folder, dvs_h5=dvs_h5, dvs_aedat2=dvs_aedat2,
         dvs_text=dvs_text, show_dvs_model_state=args.show_dvs_model_state,
         save_dvs_model_state=args.save_dvs_model_state,
-        output_width=output_width, output_height=output_height,
-        device=torch_device,
-        cs_lambda_pixels=args.cs_lambda_pixels, cs_tau_p_ms=args.cs_tau_p_ms,
+        append_outputs=resume_checkpoint is not None,
+        aps_frame_interval=args.aps_frame_interval,
+        aps_frame_rate_hz=args.aps_frame_rate_hz,
+        aps_frame_change=args.aps_frame_change,
+        **emulator_args
     )
 
     if args.dvs_params is not None:
@@ -520,7 +622,39 @@ def main():
         area_dimension=area_dimension,
         avi_frame_rate=args.avi_frame_rate)
 
-    if synthetic_input_next_frame_method is not None:
+    if synthetic_input_instance is not None and args.event_driven:
+        # emulate the continuous-time input directly, chunk by chunk
+        event_driven_emulator = EventDrivenEmulator(
+            pos_thres=emulator.pos_thres, neg_thres=emulator.neg_thres,
+            sigma_thres=emulator.sigma_thres,
+            leak_rate_hz=emulator.leak_rate_hz,
+            noise_rate_cov_decades=emulator.noise_rate_cov_decades,
+            refractory_period_s=emulator.refractory_period_s,
+            time_step=args.event_driven_time_step,
+            max_log_rate=args.event_driven_max_log_rate,
+            seed=args.dvs_emulator_seed)
+        t_total = synthetic_input_instance.t_total
+        num_chunks = max(1, int(np.ceil(
+            t_total/event_driven_emulator.chunk_s - 1e-9)))
+        t_chunk = 0
+        num_chunks_emulated = 0
+        with tqdm(total=num_chunks, desc='dvs', unit='chunk') as pbar:
+            for events in event_driven_emulator.emulate(
+                    synthetic_input_instance.intensity,
+                    output_height, output_width, 0, t_total):
+                t_chunk = min(t_chunk+event_driven_emulator.chunk_s, t_total)
+                num_on = int(np.count_nonzero(events[:, 3] > 0))
+                emulator.add_events(
+                    events, [], t_chunk, num_on, events.shape[0]-num_on)
+                if events.shape[0] > 0 and not args.skip_video_output:
+                    eventRenderer.render_events_to_frames(
+                        events, height=output_height, width=output_width)
+                num_chunks_emulated += 1
+                pbar.update(1)
+        logger.info(
+            'event-driven emulation checked the input of {} pixels'.format(
+                eng(event_driven_emulator.num_checks)))
+    elif synthetic_input_next_frame_method is not None:
         # array to batch events for rendering to DVS frames
         events = np.zeros((0, 4), dtype=np.float32)
         (fr, fr_time) = synthetic_input_instance.next_frame()
@@ -535,6 +669,8 @@ def main():
                     i += 1
                     if newEvents is not None and newEvents.shape[0] > 0 \
                             and not args.skip_video_output:
+                        if is_event_records(newEvents):
+                            newEvents = records_to_events(newEvents)
                         events = np.append(events, newEvents, axis=0)
                         events = np.array(events)
                         if i % batch_size == 0:
@@ -592,327 +728,487 @@ def main():
             c_b=-c[3] if c[3]>0 else None
             logger.info(f'cropping video by (left,right,top,bottom)=({c_l},{c_r},{c_t},{c_b})')
 
-        with TemporaryDirectory() as source_frames_dir:
-            if os.path.isdir(input_file):  # folder input
-                inputWidth = cap.frame_width
-                inputHeight = cap.frame_height
-                inputChannels = cap.frame_channels
-            else:
-                inputWidth = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                inputHeight = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                inputChannels = 1 if int(cap.get(cv2.CAP_PROP_MONOCHROME)) \
-                    else 3
-            logger.info(
-                'Input video {} has W={} x H={} frames each with {} channels'
-                .format(input_file, inputWidth, inputHeight, inputChannels))
-
-            if (output_width is None) and (output_height is None):
-                output_width = inputWidth
-                output_height = inputHeight
-                logger.warning(
-                    'output size ({}x{}) was set automatically to '
-                    'input video size\n    Are you sure you want this? '
-                    'It might be slow.\n Consider using\n '
-                    '    --output_width=346 --output_height=260\n '
-                    'to match Davis346.'
-                    .format(output_width, output_height))
-
-                # set emulator output width and height for the last time
-                emulator.output_width = output_width
-                emulator.output_height = output_height
+        if os.path.isdir(input_file):  # folder input
+            inputWidth = cap.frame_width
+            inputHeight = cap.frame_height
+            inputChannels = cap.frame_channels
+        else:
+            inputWidth = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            inputHeight = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            inputChannels = 1 if int(cap.get(cv2.CAP_PROP_MONOCHROME)) \
+                else 3
+        logger.info(
+            'Input video {} has W={} x H={} frames each with {} channels'
+            .format(input_file, inputWidth, inputHeight, inputChannels))
 
+        if (output_width is None) and (output_height is None):
+            output_width = inputWidth
+            output_height = inputHeight
+            logger.warning(
+                'output size ({}x{}) was set automatically to '
+                'input video size\n    Are you sure you want this? '
+                'It might be slow.\n Consider using\n '
+                '    --output_width=346 --output_height=260\n '
+                'to match Davis346.'
+                .format(output_width, output_height))
+
+            # set emulator output width and height for the last time
+            emulator.output_width = output_width
+            emulator.output_height = output_height
+            emulator_args.update(
+                output_width=output_width, output_height=output_height)
+
+        if streaming:
+            # decode, convert, interpolate, emulate and render the frames
+            # at the same time, connected by bounded queues instead of the
+            # frame folders
+            use_slomo = slomo is not None and (
+                auto_timestamp_resolution
+                or slowdown_factor != NO_SLOWDOWN)
             logger.info(
-                f'*** Stage 1/3: '
-                f'Resizing {srcNumFramesToBeProccessed} input frames '
-                f'to output size '
-                f'(with possible RGB to luma conversion)')
-            for inputFrameIndex in tqdm(
-                    range(srcNumFramesToBeProccessed),
-                    desc='rgb2luma', unit='fr'):
-                # read frame
-                ret, inputVideoFrame = cap.read()
-                num_frames+=1
-                if ret==False:
-                    logger.warning(f'could not read frame {inputFrameIndex} from {cap}')
-                    continue
-                if inputVideoFrame is None or np.shape(inputVideoFrame) == ():
-                    logger.warning(f'empty video frame number {inputFrameIndex} in {cap}')
-                    continue
-                if not ret or inputFrameIndex + start_frame > stop_frame:
-                    break
-
-                if args.crop is not None:
-                    # crop the frame, indices are y,x, UL is 0,0
-                    if c_l+(c_r if c_r is not None else 0)>=inputWidth:
-                        logger.error(f'left {c_l}+ right crop {c_r} is larger than image width {inputWidth}')
-                        v2e_quit(1)
-                    if c_t+(c_b if c_b is not None else 0)>=inputHeight:
-                        logger.error(f'top {c_t}+ bottom crop {c_b} is larger than image height {inputHeight}')
-                        v2e_quit(1)
-
-                    inputVideoFrame= inputVideoFrame[c_t:c_b, c_l:c_r] # https://stackoverflow.com/questions/15589517/how-to-crop-an-image-in-opencv-using-python
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- Crop is performed! ---------')
-                else:
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- Crop is NOT performed! ---------')
-
-                if output_height and output_width and \
-                        (inputHeight != output_height or
-                         inputWidth != output_width):
-                    dim = (output_width, output_height)
-                    (fx, fy) = (float(output_width) / inputWidth,
-                                float(output_height) / inputHeight)
-                    inputVideoFrame = cv2.resize(
-                        src=inputVideoFrame, dsize=dim, fx=fx, fy=fy,
-                        interpolation=cv2.INTER_AREA)
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- Resize is performed! ---------')
-                else:
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- Resize is NOT performed! ---------')
-                if inputChannels == 3:  # color
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- BGR2GRAY is performed! ---------')
-                    # TODO would break resize if input is gray frames
-                    # convert RGB frame into luminance.
-                    inputVideoFrame = cv2.cvtColor(
-                        inputVideoFrame, cv2.COLOR_BGR2GRAY)  # much faster
-
-                    # TODO add vid_orig output if not using slomo
-
-                else:
-                    if inputFrameIndex == 0:  # print info once
-                        logger.info('\n------- BGR2GRAY is NOT performed! ---------')
-
-
-                # save frame into numpy records
-                save_path = os.path.join(
-                    source_frames_dir, str(inputFrameIndex).zfill(8) + ".npy")
-                np.save(save_path, inputVideoFrame)
-                # print("Writing source frame {}".format(save_path), end="\r")
-            cap.release()
-
-            with TemporaryDirectory() as interpFramesFolder:
-                interpTimes = None
-                # make input to slomo
-                if slomo is not None and (auto_timestamp_resolution or slowdown_factor != NO_SLOWDOWN):
-                    # interpolated frames are stored to tmpfolder as
-                    # 1.png, 2.png, etc
-
-                    logger.info(
-                        f'*** Stage 2/3: SloMo upsampling from '
-                        f'{source_frames_dir}')
-
-                    # added by Haiyang Mei
-                    if polarization_input:
-                        output_width_half = int(output_width / 2)
-                        output_height_half = int(output_height / 2)
-                        # 90 degree
-                        with TemporaryDirectory() as interpFramesFolder_i90:
-                            interpTimes_i90, avgUpsamplingFactor_i90 = slomo.interpolate_polarization(
-                                source_frames_dir, interpFramesFolder_i90,
-                                (output_width_half, output_height_half), direction='90')
-                            #45 degree
-                            with TemporaryDirectory() as interpFramesFolder_i45:
-                                interpTimes_i45, avgUpsamplingFactor_i45 = slomo.interpolate_polarization(
-                                    source_frames_dir, interpFramesFolder_i45,
-                                    (output_width_half, output_height_half), direction='45')
-                                # 135 degree
-                                with TemporaryDirectory() as interpFramesFolder_i135:
-                                    interpTimes_i135, avgUpsamplingFactor_i135 = slomo.interpolate_polarization(
-                                        source_frames_dir, interpFramesFolder_i135,
-                                        (output_width_half, output_height_half), direction='135')
-                                    # 0 degree
-                                    with TemporaryDirectory() as interpFramesFolder_i0:
-                                        interpTimes_i0, avgUpsamplingFactor_i0 = slomo.interpolate_polarization(
-                                            source_frames_dir, interpFramesFolder_i0,
-                                            (output_width_half, output_height_half), direction='0')
-
-                                        # check
-                                        # print(interpTimes_i90, avgUpsamplingFactor_i90)
-                                        # print(interpTimes_i45, avgUpsamplingFactor_i45)
-                                        # print(interpTimes_i135, avgUpsamplingFactor_i135)
-                                        # print(interpTimes_i0, avgUpsamplingFactor_i0)
-                                        # exit(0)
-                                        # if interpTimes_i90 != interpTimes_i45 or interpTimes_i90 != interpTimes_i135 or interpTimes_i90 != interpTimes_i0:
-                                        #     print('************** Not aligned time between four interpolated frames ****************')
-                                        #     exit(0)
-                                        if avgUpsamplingFactor_i90 != avgUpsamplingFactor_i45 or avgUpsamplingFactor_i90 != avgUpsamplingFactor_i135 or avgUpsamplingFactor_i90 != avgUpsamplingFactor_i0:
-                                            print('************** Not aligned factor between four interpolated frames ****************')
-                                            exit(0)
-
-                                        interpTimes = interpTimes_i90
-                                        avgUpsamplingFactor = avgUpsamplingFactor_i90
-
-                                        # merge and save
-                                        list = os.listdir(interpFramesFolder_i90)
-                                        for interpFramesName in list:
-                                            interpFramesPath_i90 = os.path.join(interpFramesFolder_i90, interpFramesName)
-                                            interpFramesPath_i45 = os.path.join(interpFramesFolder_i45, interpFramesName)
-                                            interpFramesPath_i135 = os.path.join(interpFramesFolder_i135, interpFramesName)
-                                            interpFramesPath_i0 = os.path.join(interpFramesFolder_i0, interpFramesName)
-
-                                            interpFrames_i90 = cv2.imread(interpFramesPath_i90, cv2.IMREAD_GRAYSCALE)
-                                            interpFrames_i45 = cv2.imread(interpFramesPath_i45, cv2.IMREAD_GRAYSCALE)
-                                            interpFrames_i135 = cv2.imread(interpFramesPath_i135, cv2.IMREAD_GRAYSCALE)
-                                            interpFrames_i0 = cv2.imread(interpFramesPath_i0, cv2.IMREAD_GRAYSCALE)
-
-                                            interpFrames_raw = np.zeros((output_height, output_width)).astype(np.uint8)
-
-                                            interpFrames_raw[0::2, 0::2] = interpFrames_i90
-                                            interpFrames_raw[0::2, 1::2] = interpFrames_i45
-                                            interpFrames_raw[1::2, 0::2] = interpFrames_i135
-                                            interpFrames_raw[1::2, 1::2] = interpFrames_i0
-
-                                            interpFramesPath_raw = os.path.join(interpFramesFolder, interpFramesName)
-                                            cv2.imwrite(interpFramesPath_raw, interpFrames_raw)
-
-                                        # initialize orig writer
-                                        if slomo.video_path is not None and slomo.vid_orig is not None and \
-                                                slomo.ori_writer is None:
-                                            slomo.ori_writer = video_writer(
-                                                os.path.join(slomo.video_path, slomo.vid_orig),
-                                                output_height,
-                                                output_width, frame_rate=slomo.avi_frame_rate
-                                            )
-
-                                        # initialize slomo writer
-                                        if slomo.video_path is not None and slomo.vid_slomo is not None and \
-                                                slomo.slomo_writer is None:
-                                            slomo.slomo_writer = video_writer(
-                                                os.path.join(slomo.video_path, slomo.vid_slomo),
-                                                output_height,
-                                                output_width, frame_rate=slomo.avi_frame_rate
-                                            )
-
-                                        # write orig video
-                                        if slomo.ori_writer:
-                                            src_files = sorted(
-                                                glob.glob("{}".format(source_frames_dir) + "/*.npy"))
-
-                                            # write original frames into stop-motion video
-                                            for frame_idx, src_file_path in enumerate(
-                                                    tqdm(src_files, desc='write-orig-avi',
-                                                         unit='fr'), 0):
-                                                src_frame = np.load(src_file_path)
-                                                slomo.ori_writer.write(cv2.cvtColor(src_frame, cv2.COLOR_GRAY2BGR))
-                                                # slomo.ori_writer.write(src_frame)
-                                                slomo.numOrigVideoFramesWritten += 1
-
-                                        # write slomo video
-                                        frame_paths = slomo.all_images(interpFramesFolder)
-                                        if slomo.slomo_writer:
-                                            for path in tqdm(frame_paths, desc='write-slomo-vid', unit='fr'):
-                                                frame = slomo.read_image(path)
-                                                slomo.slomo_writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
-                                                # slomo.slomo_writer.write(frame)
-                                                slomo.numSlomoVideoFramesWritten += 1
-
-                                        nFramesWritten = len(frame_paths)
-                                        nTimePoints = len(interpTimes)
-                                        logger.info('Wrote {} frames and returning {} frame times.'.format(
-                                                nFramesWritten, nTimePoints))
+                f'*** Streaming {srcNumFramesToBeProccessed} input frames '
+                f'through resizing (with possible RGB to luma conversion), '
+                f'{"SloMo upsampling, " if use_slomo else ""}'
+                f'and DVS emulation')
+            crop = (c_l, c_r, c_t, c_b) if args.crop is not None else None
+            queue_size = args.stream_queue_size
+            streams = [FrameStream(
+                'decode', read_frames(cap, srcNumFramesToBeProccessed),
+                max_size=queue_size)]
+            streams.append(FrameStream(
+                'luma', ordered_map(
+                    lambda item: luma_frame(
+                        *item, (inputWidth, inputHeight),
+                        (output_width, output_height), inputChannels, crop),
+                    streams[-1], workers=args.stream_workers,
+                    max_size=queue_size),
+                max_size=queue_size))
+            # the same frame times as the folder path, which normalizes
+            # them to the duration of the source frames by the time of the
+            # last frame: that of the last SloMo batch, computed as in
+            # SuperSloMo.interpolate(), or the last source frame
+            lastFrameTime = srcNumFramesToBeProccessed - 1
+            if use_slomo:
+                lastBatchStart = (lastFrameTime - 1) // slomo.batch_size \
+                    * slomo.batch_size
+                lastFrameTime = lastBatchStart + (
+                    slomo.upsampling_factor
+                    * (lastFrameTime - lastBatchStart) - 1) \
+                    * (1 / slomo.upsampling_factor)
+            timeScale = srcVideoRealProcessedDuration / lastFrameTime
+            if use_slomo:
+                streams.append(FrameStream(
+                    'slomo', slomo.interpolate_stream(
+                        streams[-1], (output_width, output_height)),
+                    max_size=queue_size))
+                frames = iter(streams[-1])
+            else:
+                frames = enumerate(streams[-1])
+            # the DVS video is encoded while the next frames are emulated
+            renderer = FrameSink(
+                'render', lambda events:
+                    eventRenderer.render_events_to_frames(
+                        events, height=output_height, width=output_width),
+                max_size=queue_size)
+
+            # array to batch events for rendering to DVS frames
+            events = np.zeros((0, 4), dtype=np.float32)
+            stage3_timer = begin_stage('v2e_stage3_emulate')
+            try:
+                with tqdm(desc='dvs', unit='fr') as pbar, torch.no_grad():
+                    i = 0
+                    for t, fr in frames:
+                        # the frame times are in units of source frames
+                        newEvents = emulator.generate_events(
+                            fr.astype(np.float32), timeScale*t)
+
+                        pbar.update(1)
+                        if newEvents is not None and \
+                                newEvents.shape[0] > 0 \
+                                and not args.skip_video_output:
+                            if is_event_records(newEvents):
+                                newEvents = records_to_events(newEvents)
+                            events = np.append(events, newEvents, axis=0)
+                            events = np.array(events)
+                            if i % batch_size == 0:
+                                renderer.put(events)
+                                events = np.zeros((0, 4), dtype=np.float32)
+                        i += 1
+                # process leftover events
+                if len(events) > 0 and not args.skip_video_output:
+                    renderer.put(events)
+                renderer.close()
+                expectedFrames = (srcNumFramesToBeProccessed - 1) \
+                    * slomo.upsampling_factor if use_slomo \
+                    else srcNumFramesToBeProccessed
+                if i != expectedFrames:
+                    logger.warning(
+                        f'emulated {i} frames instead of {expectedFrames} '
+                        f'because some input frames could not be read; '
+                        f'the frame times differ from those of the frame '
+                        f'folders, which are normalized to the frames read')
+            finally:
+                for frame_stream in reversed(streams):
+                    frame_stream.close()
+                cap.release()
+            log_stream_metrics(streams + [renderer])
+            end_stage(stage3_timer)
+        else:
+            with TemporaryDirectory() as source_frames_dir:
+                logger.info(
+                    f'*** Stage 1/3: '
+                    f'Resizing {srcNumFramesToBeProccessed} input frames '
+                    f'to output size '
+                    f'(with possible RGB to luma conversion)')
+                stage1_timer = begin_stage(
+                    'v2e_stage1_resize', frames=srcNumFramesToBeProccessed)
+                crop = (c_l, c_r, c_t, c_b) if args.crop is not None else None
+                for inputFrameIndex, inputVideoFrame in enumerate(tqdm(
+                        luma_frames(
+                            cap, srcNumFramesToBeProccessed,
+                            (inputWidth, inputHeight),
+                            (output_width, output_height), inputChannels, crop),
+                        total=srcNumFramesToBeProccessed,
+                        desc='rgb2luma', unit='fr')):
+                    num_frames+=1
+                    # save frame into numpy records
+                    save_path = os.path.join(
+                        source_frames_dir, str(inputFrameIndex).zfill(8) + ".npy")
+                    np.save(save_path, inputVideoFrame)
+                    # print("Writing source frame {}".format(save_path), end="\r")
+                cap.release()
+                end_stage(stage1_timer)
+
+                with TemporaryDirectory() as interpFramesFolder:
+                    interpTimes = None
+                    stage2_timer = begin_stage('v2e_stage2_interpolate')
+                    # make input to slomo
+                    if slomo is not None and (auto_timestamp_resolution or slowdown_factor != NO_SLOWDOWN):
+                        # interpolated frames are stored to tmpfolder as
+                        # 1.png, 2.png, etc
+
+                        logger.info(
+                            f'*** Stage 2/3: SloMo upsampling from '
+                            f'{source_frames_dir}')
+
+                        # added by Haiyang Mei
+                        if polarization_input:
+                            output_width_half = int(output_width / 2)
+                            output_height_half = int(output_height / 2)
+                            # 90 degree
+                            with TemporaryDirectory() as interpFramesFolder_i90:
+                                interpTimes_i90, avgUpsamplingFactor_i90 = slomo.interpolate_polarization(
+                                    source_frames_dir, interpFramesFolder_i90,
+                                    (output_width_half, output_height_half), direction='90')
+                                #45 degree
+                                with TemporaryDirectory() as interpFramesFolder_i45:
+                                    interpTimes_i45, avgUpsamplingFactor_i45 = slomo.interpolate_polarization(
+                                        source_frames_dir, interpFramesFolder_i45,
+                                        (output_width_half, output_height_half), direction='45')
+                                    # 135 degree
+                                    with TemporaryDirectory() as interpFramesFolder_i135:
+                                        interpTimes_i135, avgUpsamplingFactor_i135 = slomo.interpolate_polarization(
+                                            source_frames_dir, interpFramesFolder_i135,
+                                            (output_width_half, output_height_half), direction='135')
+                                        # 0 degree
+                                        with TemporaryDirectory() as interpFramesFolder_i0:
+                                            interpTimes_i0, avgUpsamplingFactor_i0 = slomo.interpolate_polarization(
+                                                source_frames_dir, interpFramesFolder_i0,
+                                                (output_width_half, output_height_half), direction='0')
+
+                                            # check
+                                            # print(interpTimes_i90, avgUpsamplingFactor_i90)
+                                            # print(interpTimes_i45, avgUpsamplingFactor_i45)
+                                            # print(interpTimes_i135, avgUpsamplingFactor_i135)
+                                            # print(interpTimes_i0, avgUpsamplingFactor_i0)
+                                            # exit(0)
+                                            # if interpTimes_i90 != interpTimes_i45 or interpTimes_i90 != interpTimes_i135 or interpTimes_i90 != interpTimes_i0:
+                                            #     print('************** Not aligned time between four interpolated frames ****************')
+                                            #     exit(0)
+                                            if avgUpsamplingFactor_i90 != avgUpsamplingFactor_i45 or avgUpsamplingFactor_i90 != avgUpsamplingFactor_i135 or avgUpsamplingFactor_i90 != avgUpsamplingFactor_i0:
+                                                print('************** Not aligned factor between four interpolated frames ****************')
+                                                exit(0)
+
+                                            interpTimes = interpTimes_i90
+                                            avgUpsamplingFactor = avgUpsamplingFactor_i90
+
+                                            # merge and save
+                                            list = os.listdir(interpFramesFolder_i90)
+                                            for interpFramesName in list:
+                                                interpFramesPath_i90 = os.path.join(interpFramesFolder_i90, interpFramesName)
+                                                interpFramesPath_i45 = os.path.join(interpFramesFolder_i45, interpFramesName)
+                                                interpFramesPath_i135 = os.path.join(interpFramesFolder_i135, interpFramesName)
+                                                interpFramesPath_i0 = os.path.join(interpFramesFolder_i0, interpFramesName)
+
+                                                interpFrames_i90 = cv2.imread(interpFramesPath_i90, cv2.IMREAD_GRAYSCALE)
+                                                interpFrames_i45 = cv2.imread(interpFramesPath_i45, cv2.IMREAD_GRAYSCALE)
+                                                interpFrames_i135 = cv2.imread(interpFramesPath_i135, cv2.IMREAD_GRAYSCALE)
+                                                interpFrames_i0 = cv2.imread(interpFramesPath_i0, cv2.IMREAD_GRAYSCALE)
+
+                                                interpFrames_raw = np.zeros((output_height, output_width)).astype(np.uint8)
+
+                                                interpFrames_raw[0::2, 0::2] = interpFrames_i90
+                                                interpFrames_raw[0::2, 1::2] = interpFrames_i45
+                                                interpFrames_raw[1::2, 0::2] = interpFrames_i135
+                                                interpFrames_raw[1::2, 1::2] = interpFrames_i0
+
+                                                interpFramesPath_raw = os.path.join(interpFramesFolder, interpFramesName)
+                                                cv2.imwrite(interpFramesPath_raw, interpFrames_raw)
+
+                                            # initialize orig writer
+                                            if slomo.video_path is not None and slomo.vid_orig is not None and \
+                                                    slomo.ori_writer is None:
+                                                slomo.ori_writer = video_writer(
+                                                    os.path.join(slomo.video_path, slomo.vid_orig),
+                                                    output_height,
+                                                    output_width, frame_rate=slomo.avi_frame_rate
+                                                )
+
+                                            # initialize slomo writer
+                                            if slomo.video_path is not None and slomo.vid_slomo is not None and \
+                                                    slomo.slomo_writer is None:
+                                                slomo.slomo_writer = video_writer(
+                                                    os.path.join(slomo.video_path, slomo.vid_slomo),
+                                                    output_height,
+                                                    output_width, frame_rate=slomo.avi_frame_rate
+                                                )
+
+                                            # write orig video
+                                            if slomo.ori_writer:
+                                                src_files = sorted(
+                                                    glob.glob("{}".format(source_frames_dir) + "/*.npy"))
+
+                                                # write original frames into stop-motion video
+                                                for frame_idx, src_file_path in enumerate(
+                                                        tqdm(src_files, desc='write-orig-avi',
+                                                             unit='fr'), 0):
+                                                    src_frame = np.load(src_file_path)
+                                                    slomo.ori_writer.write(cv2.cvtColor(src_frame, cv2.COLOR_GRAY2BGR))
+                                                    # slomo.ori_writer.write(src_frame)
+                                                    slomo.numOrigVideoFramesWritten += 1
+
+                                            # write slomo video
+                                            frame_paths = slomo.all_images(interpFramesFolder)
+                                            if slomo.slomo_writer:
+                                                for path in tqdm(frame_paths, desc='write-slomo-vid', unit='fr'):
+                                                    frame = slomo.read_image(path)
+                                                    slomo.slomo_writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+                                                    # slomo.slomo_writer.write(frame)
+                                                    slomo.numSlomoVideoFramesWritten += 1
+
+                                            nFramesWritten = len(frame_paths)
+                                            nTimePoints = len(interpTimes)
+                                            logger.info('Wrote {} frames and returning {} frame times.'.format(
+                                                    nFramesWritten, nTimePoints))
+                        else:
+                            interpTimes, avgUpsamplingFactor = slomo.interpolate(
+                                source_frames_dir, interpFramesFolder,
+                                (output_width, output_height))
+
+                        avgTs = srcFrameIntervalS / avgUpsamplingFactor
+                        logger.info(
+                            'SloMo average upsampling factor={:5.2f}; '
+                            'average DVS timestamp resolution={}s'
+                            .format(avgUpsamplingFactor, eng(avgTs)))
+                        # check for undersampling wrt the
+                        # photoreceptor lowpass filtering
+
+                        if cutoff_hz > 0:
+                            logger.warning('Using auto_timestamp_resolution. '
+                                           'checking if cutoff hz is ok given '
+                                           'samplee rate {}'.format(1/avgTs))
+                            check_lowpass(cutoff_hz, 1/avgTs, logger)
+
+                        # read back to memory
+                        interpFramesFilenames = all_images(interpFramesFolder)
+                        # number of frames
+                        n = len(interpFramesFilenames)
                     else:
-                        interpTimes, avgUpsamplingFactor = slomo.interpolate(
-                            source_frames_dir, interpFramesFolder,
-                            (output_width, output_height))
+                        logger.info(
+                            f'*** Stage 2/3:turning npy frame files to png '
+                            f'from {source_frames_dir}')
+                        interpFramesFilenames = []
+                        n = 0
+                        src_files = sorted(
+                            glob.glob("{}".format(source_frames_dir) + "/*.npy"))
+                        for frame_idx, src_file_path in tqdm(
+                                enumerate(src_files), desc='npy2png', unit='fr'):
+                            src_frame = np.load(src_file_path)
+                            tgt_file_path = os.path.join(
+                                interpFramesFolder, str(frame_idx) + ".png")
+                            interpFramesFilenames.append(tgt_file_path)
+                            n += 1
+                            cv2.imwrite(tgt_file_path, src_frame)
+                        interpTimes = np.array(range(n))
+
+                    end_stage(stage2_timer)
+
+                    # compute times of output integrated frames
+                    nFrames = len(interpFramesFilenames)
+                    # interpTimes is in units of 1 per input frame,
+                    # normalize it to src video time range
+                    f = srcVideoRealProcessedDuration/(
+                        np.max(interpTimes)-np.min(interpTimes))
+                    # compute actual times from video times
+                    interpTimes = f*interpTimes
+                    # debug
+                    if slomo_stats_plot:
+                        from matplotlib import pyplot as plt  # TODO debug
+                        dt = np.diff(interpTimes)
+                        fig = plt.figure()
+                        ax1 = fig.add_subplot(111)
+                        ax1.set_title(
+                            'Slo-Mo frame interval stats (close to continue)')
+                        ax1.plot(interpTimes)
+                        ax1.plot(interpTimes, 'x')
+                        ax1.set_xlabel('frame')
+                        ax1.set_ylabel('frame time (s)')
+                        ax2 = ax1.twinx()
+                        ax2.plot(dt*1e3)
+                        ax2.set_ylabel('frame interval (ms)')
+                        logger.info('close plot to continue')
+                        fig.show()
+
+                    # array to batch events for rendering to DVS frames
+                    events = np.zeros((0, 4), dtype=np.float32)
 
-                    avgTs = srcFrameIntervalS / avgUpsamplingFactor
                     logger.info(
-                        'SloMo average upsampling factor={:5.2f}; '
-                        'average DVS timestamp resolution={}s'
-                        .format(avgUpsamplingFactor, eng(avgTs)))
-                    # check for undersampling wrt the
-                    # photoreceptor lowpass filtering
-
-                    if cutoff_hz > 0:
-                        logger.warning('Using auto_timestamp_resolution. '
-                                       'checking if cutoff hz is ok given '
-                                       'samplee rate {}'.format(1/avgTs))
-                        check_lowpass(cutoff_hz, 1/avgTs, logger)
-
-                    # read back to memory
-                    interpFramesFilenames = all_images(interpFramesFolder)
-                    # number of frames
-                    n = len(interpFramesFilenames)
-                else:
-                    logger.info(
-                        f'*** Stage 2/3:turning npy frame files to png '
-                        f'from {source_frames_dir}')
-                    interpFramesFilenames = []
-                    n = 0
-                    src_files = sorted(
-                        glob.glob("{}".format(source_frames_dir) + "/*.npy"))
-                    for frame_idx, src_file_path in tqdm(
-                            enumerate(src_files), desc='npy2png', unit='fr'):
-                        src_frame = np.load(src_file_path)
-                        tgt_file_path = os.path.join(
-                            interpFramesFolder, str(frame_idx) + ".png")
-                        interpFramesFilenames.append(tgt_file_path)
-                        n += 1
-                        cv2.imwrite(tgt_file_path, src_frame)
-                    interpTimes = np.array(range(n))
-
-                # compute times of output integrated frames
-                nFrames = len(interpFramesFilenames)
-                # interpTimes is in units of 1 per input frame,
-                # normalize it to src video time range
-                f = srcVideoRealProcessedDuration/(
-                    np.max(interpTimes)-np.min(interpTimes))
-                # compute actual times from video times
-                interpTimes = f*interpTimes
-                # debug
-                if slomo_stats_plot:
-                    from matplotlib import pyplot as plt  # TODO debug
-                    dt = np.diff(interpTimes)
-                    fig = plt.figure()
-                    ax1 = fig.add_subplot(111)
-                    ax1.set_title(
-                        'Slo-Mo frame interval stats (close to continue)')
-                    ax1.plot(interpTimes)
-                    ax1.plot(interpTimes, 'x')
-                    ax1.set_xlabel('frame')
-                    ax1.set_ylabel('frame time (s)')
-                    ax2 = ax1.twinx()
-                    ax2.plot(dt*1e3)
-                    ax2.set_ylabel('frame interval (ms)')
-                    logger.info('close plot to continue')
-                    fig.show()
-
-                # array to batch events for rendering to DVS frames
-                events = np.zeros((0, 4), dtype=np.float32)
-
-                logger.info(
-                    f'*** Stage 3/3: emulating DVS events from '
-                    f'{nFrames} frames')
-
-                # parepare extra steps for data storage
-                # right before event emulation
-                if args.davis_output:
-                    emulator.prepare_storage(nFrames, interpTimes)
-                with tqdm(total=nFrames, desc='dvs', unit='fr') as pbar:
-                    with torch.no_grad():
-                        for i in range(nFrames):
-                            fr = read_image(interpFramesFilenames[i])
-                            newEvents = emulator.generate_events(
-                                fr, interpTimes[i])
-
-                            pbar.update(1)
-                            if newEvents is not None and \
-                                    newEvents.shape[0] > 0 \
-                                    and not args.skip_video_output:
-                                events = np.append(events, newEvents, axis=0)
-                                events = np.array(events)
-                                if i % batch_size == 0:
+                        f'*** Stage 3/3: emulating DVS events from '
+                        f'{nFrames} frames')
+                    stage3_timer = begin_stage(
+                        'v2e_stage3_emulate', frames=nFrames)
+
+                    # parepare extra steps for data storage
+                    # right before event emulation
+                    if args.davis_output:
+                        emulator.prepare_storage(nFrames, interpTimes)
+                    first_frame = 0
+                    # digest of the frames emulated so far, see
+                    # save_checkpoint()
+                    frames_digest = hashlib.sha1()
+                    if resume_checkpoint is not None:
+                        if resume_checkpoint['num_frames'] != nFrames:
+                            logger.error(
+                                f'checkpoint {checkpoint_file} is for '
+                                f'{resume_checkpoint["num_frames"]} frames '
+                                f'but there are {nFrames} frames; '
+                                f'are the arguments the same as before?')
+                            v2e_quit(1)
+                        first_frame = resume_checkpoint['frame_index']
+                        # the frames were decoded and interpolated again,
+                        # check that they are the frames of the checkpoint
+                        for i in tqdm(range(first_frame), desc='checksum',
+                                      unit='fr'):
+                            update_frames_digest(
+                                frames_digest,
+                                [read_image(interpFramesFilenames[i])],
+                                [interpTimes[i]])
+                        if frames_digest.hexdigest() != \
+                                resume_checkpoint.get('frames_sha1'):
+                            logger.error(
+                                f'the first {first_frame} frames are not '
+                                f'the frames of checkpoint {checkpoint_file}; '
+                                f'are the arguments the same as before, and '
+                                f'is SloMo deterministic on this device? '
+                                f'Run again without --resume.')
+                            v2e_quit(1)
+                        emulator.load_state_dict(resume_checkpoint['emulator'])
+                        logger.info(f'resuming DVS emulation at frame '
+                                    f'{first_frame}')
+                    checkpoint_interval = args.checkpoint_interval
+                    next_checkpoint = first_frame + checkpoint_interval
+                    emulator_processes = args.emulator_processes
+                    if emulator_processes > 1 and (
+                            checkpoint_interval > 0
+                            or resume_checkpoint is not None):
+                        logger.warning(
+                            '--emulator_processes does not support checkpoints, '
+                            'emulating serially')
+                        emulator_processes = 0
+                    with tqdm(total=nFrames, initial=first_frame,
+                              desc='dvs', unit='fr') as pbar:
+                        if emulator_processes > 1:
+                            segment_results = emulate_frames_parallel(
+                                interpFramesFilenames, interpTimes,
+                                emulator_args, num_workers=emulator_processes,
+                                overlap_s=args.segment_overlap_s,
+                                dvs_params=args.dvs_params)
+                            for result in segment_results:
+                                # the segments are in time order
+                                block = range(
+                                    emulator.frame_counter,
+                                    emulator.frame_counter
+                                    + len(result.num_events_to_frame))
+                                frs = (read_image(interpFramesFilenames[j])
+                                       for j in block) \
+                                    if args.davis_output else None
+                                emulator.add_events(
+                                    result.events, result.num_events_to_frame,
+                                    result.t_last, result.num_events_on,
+                                    result.num_events_off, new_frames=frs,
+                                    num_static_frames=result.num_static_frames)
+                                pbar.update(len(block))
+                                if result.events is None \
+                                        or args.skip_video_output:
+                                    continue
+                                # render the events of batch_size frames at a time
+                                ends = result.num_events_to_frame[
+                                    batch_size - 1::batch_size].tolist() \
+                                    + [len(result.events)]
+                                start = 0
+                                for end in ends:
+                                    if end <= start:
+                                        continue
+                                    newEvents = result.events[start:end]
+                                    if is_event_records(newEvents):
+                                        newEvents = records_to_events(newEvents)
                                     eventRenderer.render_events_to_frames(
-                                        events, height=output_height,
+                                        newEvents, height=output_height,
                                         width=output_width)
-                                    events = np.zeros((0, 4), dtype=np.float32)
-                    # process leftover events
-                    if len(events) > 0 and not args.skip_video_output:
-                        eventRenderer.render_events_to_frames(
-                            events, height=output_height, width=output_width)
+                                    start = end
+                        else:
+                            with torch.no_grad():
+                                for i in range(first_frame, nFrames):
+                                    with stage('read_image', frame=i):
+                                        fr = read_image(
+                                            interpFramesFilenames[i])
+                                    newEvents = emulator.generate_events(
+                                        fr, interpTimes[i])
+                                    if checkpoint_interval > 0:
+                                        update_frames_digest(
+                                            frames_digest, [fr],
+                                            [interpTimes[i]])
+
+                                    pbar.update(1)
+                                    if newEvents is not None and \
+                                            newEvents.shape[0] > 0 \
+                                            and not args.skip_video_output:
+                                        if is_event_records(newEvents):
+                                            newEvents = records_to_events(newEvents)
+                                        events = np.append(events, newEvents, axis=0)
+                                        events = np.array(events)
+                                        if i % batch_size == 0:
+                                            eventRenderer.render_events_to_frames(
+                                                events, height=output_height,
+                                                width=output_width)
+                                            events = np.zeros((0, 4), dtype=np.float32)
+
+                                    if 0 < checkpoint_interval and \
+                                            next_checkpoint <= i + 1 < nFrames:
+                                        save_checkpoint(
+                                            checkpoint_file, emulator,
+                                            frame_index=i + 1,
+                                            num_frames=nFrames,
+                                            frames_digest=frames_digest)
+                                        next_checkpoint += checkpoint_interval
+                        # process leftover events
+                        if len(events) > 0 and not args.skip_video_output:
+                            eventRenderer.render_events_to_frames(
+                                events, height=output_height, width=output_width)
+                    end_stage(stage3_timer)
+                    if os.path.isfile(checkpoint_file):
+                        # the conversion is complete
+                        os.remove(checkpoint_file)
 
     # Clean up
     eventRenderer.cleanup()
@@ -921,16 +1217,29 @@ def main():
         slomo.cleanup()
     if synthetic_input_instance is not None:
         synthetic_input_instance.cleanup()
+    disable_stage_profiler()
 
-    if num_frames == 0:
+    event_driven = synthetic_input_instance is not None and args.event_driven
+    if num_frames == 0 and not event_driven:
         logger.error('no frames read from file')
 
     totalTime = (time.time()-time_run_started)
-    framePerS = num_frames / totalTime
-    sPerFrame = totalTime / num_frames if num_frames>0 else None
-    throughputStr = (str(eng(framePerS)) + 'fr/s') \
-        if framePerS > 1 else (str(eng(sPerFrame)) + 's/fr')
-    timestr ='done processing {} frames in {}s ({})\n **************** see output folder {}'.format(num_frames,
+    if event_driven:
+        # there are no frames, report the emulated time and event rate
+        processedStr = '{} chunks ({}s of input)'.format(
+            num_chunks_emulated, eng(emulator.t_previous))
+        throughputStr = str(eng(emulator.num_events_total / totalTime)) \
+            + 'ev/s'
+    elif num_frames > 0:
+        framePerS = num_frames / totalTime
+        sPerFrame = totalTime / num_frames
+        processedStr = '{} frames'.format(num_frames)
+        throughputStr = (str(eng(framePerS)) + 'fr/s') \
+            if framePerS > 1 else (str(eng(sPerFrame)) + 's/fr')
+    else:
+        processedStr = '0 frames'
+        throughputStr = 'no throughput'
+    timestr ='done processing {} in {}s ({})\n **************** see output folder {}'.format(processedStr,
             eng(totalTime),
             throughputStr,
             output_folder)
@@ -938,12 +1247,13 @@ def main():
                 .format(eng(emulator.num_events_total),
                         eng(emulator.num_events_on),
                         eng(emulator.num_events_off)))
-    logger.info(
-        'avg event rate {}Hz ({}Hz on, {}Hz off)'
-        .format(
-            eng(emulator.num_events_total / emulator.t_previous),
-            eng(emulator.num_events_on / emulator.t_previous),
-            eng(emulator.num_events_off / emulator.t_previous)))
+    if emulator.t_previous > 0:
+        logger.info(
+            'avg event rate {}Hz ({}Hz on, {}Hz off)'
+            .format(
+                eng(emulator.num_events_total / emulator.t_previous),
+                eng(emulator.num_events_on / emulator.t_previous),
+                eng(emulator.num_events_off / emulator.t_previous)))
     if totalTime>60:
         try:
             from plyer import notification
@@ -76,6 +76,22 @@ class base_synthetic_input(): # the class name should be the same as the filenam
         """
         return (self.pix_arr, self.time)
 
+    def intensity(self, t, ys, xs) -> np.ndarray:
+        """ Optional continuous-time description of the input, for event-driven emulation
+        with --event_driven, see EventDrivenEmulator. Subclasses that can compute their intensity
+        at any time override this method.
+
+        :param t: time in float seconds, scalar or np.ndarray broadcastable with ys and xs
+        :param ys: np.ndarray of pixel rows
+        :param xs: np.ndarray of pixel columns, same shape as ys
+        :returns: np.ndarray of the float intensities 0-255 of the pixels at time t, same shape as ys
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not implement intensity(t, ys, xs)')
+
+    def has_intensity(self) -> bool:
+        """:returns: True if the subclass implements intensity()"""
+        return type(self).intensity is not base_synthetic_input.intensity
+
     def write_video_frame(self,frame=None):
         """ writes the current self.pix_array to video output file as source frames
         :param frame
@@ -0,0 +1,171 @@
+"""
+Counter-based random numbers of the DVS pixel model.
+
+The default random numbers of EventEmulator come from the global torch
+random state, so each depends on all random numbers drawn before it,
+and splitting the pixels into tiles, the frames into segments or
+reordering the work changes the noise.
+
+With EventEmulator(counter_rng=True), each random number is instead a
+function of (seed, pixel, frame, stream, iteration): the Philox4x32-10
+block cipher [1] encrypts the counter (pixel, frame, iteration // 4,
+stream) with the seed as key, and each of its four 32 bit output words
+gives one random number. The noise of any pixel and frame can then be
+computed in any order, on any worker, with the same result as a serial
+run. The ten Philox rounds take a few dozen integer tensor ops, so the
+random numbers are several times slower to draw than with torch.rand().
+
+[1] J. K. Salmon, M. A. Moraes, R. O. Dror and D. E. Shaw, "Parallel random
+numbers: as easy as 1, 2, 3", SC '11.
+"""
+import math
+
+import torch
+
+# random streams of the pixel model
+POS_THRES_STREAM = 0  # ON threshold mismatch
+NEG_THRES_STREAM = 1  # OFF threshold mismatch
+NOISE_RATE_STREAM = 2  # leak rate mismatch
+LEAK_STREAM = 3  # leak jitter of each frame
+SHOT_STREAM = 4  # shot noise of each iteration
+SHOT_ITER_STREAM = 5  # iteration of shot noise of active pixel update
+SHUFFLE_STREAM = 6  # order of the events of an iteration
+
+_MASK32 = 0xFFFFFFFF
+_PHILOX_M0 = 0xD2511F53
+_PHILOX_M1 = 0xCD9E8D57
+_PHILOX_W0 = 0x9E3779B9
+_PHILOX_W1 = 0xBB67AE85
+
+
+def _mulhilo32(m, x):
+    """Returns the high and low 32 bit words of m*x for a Philox
+    multiplier m and int64 tensor x of 32 bit words.
+
+    m*x = q+x*2**32 with q = (m-2**32)*x, which does not overflow int64
+    since 2**32-m < 2**30 for the Philox multipliers.
+    """
+    q = x*(m-(1 << 32))
+    return (q >> 32)+x, q & _MASK32
+
+
+def philox4x32(c0, c1, c2, c3, k0, k1, rounds=10):
+    """Philox4x32 block cipher.
+
+    # Arguments
+        c0, c1, c2, c3: int or int64 tensors of the 32 bit counter words,
+            broadcast together.
+        k0, k1: int 32 bit key words.
+        rounds: number of rounds.
+
+    # Returns
+        the four 32 bit output words as int64 tensors.
+    """
+    for r in range(rounds):
+        if r > 0:
+            k0 = (k0+_PHILOX_W0) & _MASK32
+            k1 = (k1+_PHILOX_W1) & _MASK32
+        hi0, lo0 = _mulhilo32(_PHILOX_M0, c0)
+        hi1, lo1 = _mulhilo32(_PHILOX_M1, c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+    return c0, c1, c2, c3
+
+
+def _to_unit(words):
+    """Maps 32 bit words to float32 uniform numbers in (0, 1)."""
+    return ((words >> 8).float()+0.5)*(1./(1 << 24))
+
+
+class CounterRNG(object):
+    """Random numbers keyed by (seed, pixel, frame, stream, iteration),
+    see the module documentation.
+    """
+
+    def __init__(self, seed):
+        """
+        Parameters
+        ----------
+        seed: int
+            key of all random numbers, up to 64 bit.
+        """
+        self.seed = int(seed)
+
+    def random_words(self, pixels, frame, stream, blocks=0):
+        """Returns the [4, ...] int64 tensor of the four random
+        32 bit words of the counters (pixels, frame, blocks, stream).
+
+        Parameters
+        ----------
+        pixels: torch.Tensor
+            int64 flat pixel indices.
+        frame: int
+            frame number.
+        stream: int
+            random stream, e.g. LEAK_STREAM.
+        blocks: int or torch.Tensor
+            block numbers, broadcast with pixels.
+        """
+        return torch.stack(philox4x32(
+            pixels, frame & _MASK32, blocks, stream,
+            self.seed & _MASK32, (self.seed >> 32) & _MASK32)) \
+            .expand((4,)+torch.broadcast_shapes(
+                pixels.shape, torch.as_tensor(blocks).shape))
+
+    def uniform(self, pixels, frame, stream, iters=0):
+        """Returns float32 uniform random numbers in (0, 1).
+
+        Parameters
+        ----------
+        pixels: torch.Tensor
+            int64 flat pixel indices.
+        frame: int
+            frame number.
+        stream: int
+            random stream.
+        iters: int or torch.Tensor
+            iteration numbers, broadcast with pixels.
+        """
+        iters = torch.as_tensor(iters, device=pixels.device)
+        words = self.random_words(pixels, frame, stream, iters >> 2)
+        return _to_unit(torch.gather(
+            words, 0, (iters & 3).expand(words.shape[1:]).unsqueeze(0))[0])
+
+    def uniform_block(self, pixels, frame, stream, block=0):
+        """Returns the [4, ...] float32 uniform random numbers in (0, 1) of
+        iterations 4*block to 4*block+3 of the pixels."""
+        return _to_unit(self.random_words(pixels, frame, stream, block))
+
+    def uniform_iters(self, pixels, frame, stream, num_iters):
+        """Returns the [num_iters, ...] float32 uniform random numbers of
+        iterations 0..num_iters-1 of the pixels, the same as
+        uniform(pixels, frame, stream, iters) for each iteration."""
+        blocks = torch.arange(
+            (num_iters+3) >> 2, device=pixels.device).view(
+                (-1,)+(1,)*pixels.dim())
+        words = self.random_words(pixels, frame, stream, blocks)
+        # [4, blocks, ...] to [blocks*4, ...] in iteration order
+        words = words.transpose(0, 1).reshape((-1,)+tuple(pixels.shape))
+        return _to_unit(words[:num_iters])
+
+    def normal(self, pixels, frame, stream):
+        """Returns float32 standard normal random numbers of the pixels
+        (Box-Muller transform of two uniform numbers)."""
+        words = self.random_words(pixels, frame, stream)
+        u0, u1 = _to_unit(words[0]), _to_unit(words[1])
+        return torch.sqrt(-2*torch.log(u0))*torch.cos((2*math.pi)*u1)
+
+    def shuffle_keys(self, frame, columns):
+        """Returns [N] int64 random 32 bit keys of events, which order the
+        events of each iteration, see shuffle_event_columns().
+
+        Parameters
+        ----------
+        frame: int
+            frame number.
+        columns: tuple
+            (iters, pixels, polarity) [N] int64 tensors of the events,
+            with flat pixel indices of the full frame.
+        """
+        iters, pixels, polarity = columns
+        return self.random_words(
+            pixels, frame, SHUFFLE_STREAM, iters*2+(polarity < 0))[0]
@@ -4,6 +4,7 @@
     @contact: zhehe@student.ethz.ch
     @latest update: 2019-May-27th
 """
+import torch
 import torch.utils.data as data
 
 import glob
@@ -179,6 +180,58 @@ class FramesDirectory(data.Dataset):
         return fmt_str
 
 
+class FramePairs(object):
+
+    """
+        Batches of pairs of consecutive frames of a stream of frames,
+        the same as a DataLoader of FramesDirectory without shuffling,
+        without the frame files.
+    """
+
+    def __init__(self, frames, ori_dim, batch_size=1, transform=None):
+
+        """
+            @Parameters:
+                frames: iterable of [H, W] uint8 numpy arrays.
+                ori_dim: (width, height) of the frames.
+                batch_size: int, number of pairs of a batch.
+                transform: Compose object.
+        """
+
+        self.frames = frames
+        self.transform = transform
+        self.batch_size = batch_size
+        self.origDim = ori_dim
+        self.dim = (int(self.origDim[0] / 32) * 32,
+                    int(self.origDim[1] / 32) * 32)
+
+    def __iter__(self):
+
+        """Yield the batches of pairs, the last one may be smaller.
+
+            @Return: List(Tensor, Tensor) of frame0 and frame1 batches,
+                frame1 is the frame after frame0.
+        """
+
+        # the last frame of a batch is the first frame1 of the next
+        window = []
+        for image in self.frames:
+            window.append(self._transform(image))
+            if len(window) == self.batch_size + 1:
+                yield [torch.stack(window[:-1]), torch.stack(window[1:])]
+                window = window[-1:]
+        if len(window) > 1:
+            yield [torch.stack(window[:-1]), torch.stack(window[1:])]
+
+    def _transform(self, image):
+        # like FramesDirectory, LANCZOS is the filter of Image.ANTIALIAS
+        image = Image.fromarray(image)
+        image = image.resize(self.dim, Image.LANCZOS)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image
+
+
 class FramesDirectory_90(data.Dataset):
 
     """
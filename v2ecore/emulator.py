@@ -15,12 +15,27 @@ import numpy as np
 import torch  # https://pytorch.org/docs/stable/torch.html
 from screeninfo import get_monitors
 
+from v2ecore import counter_rng as crng
+from v2ecore.counter_rng import CounterRNG
 from v2ecore.emulator_utils import compute_event_map
+from v2ecore.emulator_utils import event_columns_to_list
+from v2ecore.emulator_utils import fused_pixel_update
+from v2ecore.emulator_utils import generate_event_columns
+from v2ecore.emulator_utils import generate_event_list
 from v2ecore.emulator_utils import generate_shot_noise
+from v2ecore.emulator_utils import generate_shot_noise_counter
+from v2ecore.emulator_utils import generate_shot_noise_sparse
+from v2ecore.emulator_utils import integrate_surround
 from v2ecore.emulator_utils import lin_log
 from v2ecore.emulator_utils import low_pass_filter
 from v2ecore.emulator_utils import rescale_intensity_frame
+from v2ecore.emulator_utils import steady_state_surround
 from v2ecore.emulator_utils import subtract_leak_current
+from v2ecore.emulator_utils import threshold_crossing_timestamps
+from v2ecore import emulator_numba
+from v2ecore.emulator_tiled import TiledPixelArray
+from v2ecore.event_arena import EventArena, is_event_records
+from v2ecore.stage_profiler import profiled, stage
 from v2ecore.output.ae_text_output import DVSTextOutput
 from v2ecore.output.aedat2_output import AEDat2Output
 from v2ecore.v2e_utils import checkAddSuffix, v2e_quit, video_writer
@@ -48,6 +63,36 @@ class EventEmulator(object):
 
     MAX_CHANGE_TO_TERMINATE_EULER_SURROUND_STEPPING = 1e-5
 
+    # active pixel update: a pixel's lowpass filter is settled when
+    # both stages are this close (in log intensity) to its input
+    ACTIVE_PIXEL_SETTLED_TOLERANCE = 1e-4
+    # active pixel update: an inactive pixel is woken up when its
+    # mean leak sped up by this fraction would reach its ON threshold
+    ACTIVE_PIXEL_LEAK_WAKE_MARGIN = 0.5
+    # scheduled leak: the leak of a pixel is applied when its mean leak
+    # sped up by this fraction may bring it to its ON threshold
+    SCHEDULED_LEAK_MARGIN = 0.5
+    # scheduled leak: duration of the time buckets of the leak times
+    SCHEDULED_LEAK_BUCKET_S = 0.01
+
+    # attributes saved by state_dict()
+    STATE_ATTRIBUTES = (
+        't_previous', 'frame_counter', 'new_frame',
+        'lp_log_frame0', 'lp_log_frame1', 'cs_surround_frame',
+        'c_minus_s_frame', 'base_log_frame', 'diff_frame', 'timestamp_mem',
+        'pos_thres', 'neg_thres', 'pos_thres_pre_prob', 'neg_thres_pre_prob',
+        'noise_rate_array', 'numba_seed', 'counter_rng_seed',
+        'num_events_on', 'num_events_off', 'num_events_total',
+        'cs_steps_taken', 'num_pixel_updates', 'num_pixel_frames',
+        'num_static_frames',
+        'active_pixels_input', 'active_pixels_unsettled',
+        'active_pixels_last_update', 'active_pixels_sum_dt2',
+        'active_pixels_last_sum_dt2', 'active_pixels_wake_time',
+        'leak_rate_bound', 'leak_last_update', 'leak_sum_dt2',
+        'leak_last_sum_dt2', 'leak_bucket_end', 'leak_bucket_pixels',
+        'leak_bucket_diff',
+        'aps_last_frame')
+
     def __init__(
             self,
             pos_thres: float = 0.2,
@@ -72,7 +117,23 @@ class EventEmulator(object):
             output_height: int = None,
             device: str = "cuda",
             cs_lambda_pixels: float = None,
-            cs_tau_p_ms: float = None
+            cs_tau_p_ms: float = None,
+            cs_solver: str = 'euler',
+            vectorized_event_generation: bool = False,
+            active_pixel_update: bool = False,
+            sparse_shot_noise: bool = False,
+            compact_events: bool = False,
+            append_outputs: bool = False,
+            tile_size: int = 0,
+            tile_workers: int = 0,
+            threshold_crossing_timestamps: bool = False,
+            fused_pixel_pipeline: bool = False,
+            device_events: bool = False,
+            aps_frame_interval: int = 1,
+            aps_frame_rate_hz: float = 0,
+            aps_frame_change: float = 0,
+            counter_rng: bool = False,
+            scheduled_leak: bool = False
     ):
         """
         Parameters
@@ -105,11 +166,109 @@ class EventEmulator(object):
         output_height: int,
             height of output in pixels
         device: str
-            device, either 'cpu' or 'cuda' (selected automatically by caller depending on GPU availability)
+            device, either 'cpu' or 'cuda' (selected automatically by caller depending on GPU availability),
+            or 'numba' for the numba CPU backend, see emulator_numba;
+            the pixel states are then CPU tensors and the leak and shot
+            noise events are statistically equivalent to the 'cpu' device.
+            Not supported with center surround, active_pixel_update,
+            tile_size, threshold_crossing_timestamps and fused_pixel_pipeline.
         cs_lambda_pixels: float
             space constant of surround in pixels, or None to disable surround inhibition
         cs_tau_p_ms: float
             time constant of lowpass filter of surround in ms or 0 to make surround 'instantaneous'
+        cs_solver: str
+            solver of the surround diffuser:
+            'direct' solves it in the frequency domain with a few FFTs
+            per frame, its steady state for an 'instantaneous' surround
+            (cs_tau_p_ms 0 or None), see steady_state_surround(),
+            else its exact dynamics over the frame, see integrate_surround();
+            'euler' (default) runs Euler steps of the diffuser, until the
+            max change is smaller than
+            MAX_CHANGE_TO_TERMINATE_EULER_SURROUND_STEPPING for an
+            'instantaneous' surround, so its events differ slightly from
+            those of 'direct'.
+        vectorized_event_generation: bool
+            generate the events of all sub-frame iterations in one pass
+            instead of one full-frame pass per iteration;
+            the output is identical for the same seed
+        active_pixel_update: bool
+            update only the pixels whose input changed, whose lowpass
+            filter has not settled, that have a shot noise event or whose
+            leak may bring them to the ON threshold;
+            the leak of the other pixels is applied when they become active.
+            Not supported with center surround (cs_lambda_pixels).
+        sparse_shot_noise: bool
+            sample only the shot noise events instead of drawing a random
+            number for each pixel and sub-frame iteration;
+            same rates, but different random numbers
+        compact_events: bool
+            write the events into a reused EventArena of EVENT_DTYPE
+            records with integer microsecond timestamps, and return views
+            of it instead of [N, 4] float32 arrays;
+            implies vectorized_event_generation
+        append_outputs: bool
+            open existing event output files for appending instead of
+            overwriting them, to resume a conversion from a checkpoint
+            with load_state_dict()
+        tile_size: int
+            if >0, keep the pixel states in tiles of this width and height
+            that are updated by tile_workers threads (0 for the number of
+            CPU cores), see TiledPixelArray; the events are identical to
+            the untiled vectorized event generation.
+            Not supported with active_pixel_update and show_dvs_model_state.
+        threshold_crossing_timestamps: bool
+            timestamp each event at the time its pixel crosses the
+            threshold level of the event, assuming that the DVS input
+            changes linearly from the previous frame, instead of
+            spreading the events evenly over the frame, see
+            threshold_crossing_timestamps(); implies
+            vectorized_event_generation.
+            Not supported with active_pixel_update and tile_size.
+        fused_pixel_pipeline: bool
+            compute the lin-log conversion, lowpass filter, leak,
+            difference and event counts of each frame in one kernel
+            compiled with torch.compile(), see fused_pixel_update(),
+            and update the pixel states in place. The events are the same
+            as without it up to rounding of the compiled kernel.
+            Not supported with center surround, active_pixel_update
+            and tile_size.
+        device_events: bool
+            return the [N, 4] events of generate_events()
+            as a torch.Tensor on the device,
+            for consumers that stay on the device, instead of copying them
+            to a np.ndarray; the event outputs still get a CPU copy.
+            Not supported with compact_events.
+        aps_frame_interval: int
+            write only every aps_frame_interval'th frame, starting with
+            the first, to the HDF5 frame dataset of prepare_storage(),
+            like the APS frames of a DAVIS.
+        aps_frame_rate_hz: float
+            if >0, write instead the first frame of each APS frame
+            interval of 1/aps_frame_rate_hz seconds.
+        aps_frame_change: float
+            if >0, write a frame selected by aps_frame_interval or
+            aps_frame_rate_hz only if its mean absolute difference to
+            the last written frame is at least this many gray levels.
+        counter_rng: bool
+            draw the threshold and leak rate mismatch, leak jitter,
+            shot noise and event order from counter-based random numbers
+            keyed by (seed, pixel, frame number, stream), see counter_rng,
+            instead of the global torch random state, so that they do
+            not depend on the order in which pixels and frames are
+            emulated: tiled and segmented runs make the same
+            noise as a serial run. The shot noise is sampled per pixel
+            like sparse_shot_noise, with the same rates as the default
+            sampler. The numba backend keeps its own keyed random numbers.
+        scheduled_leak: bool
+            apply the leak of a pixel only at the frames where it may
+            bring the pixel to its ON threshold, i.e. after its next leak
+            time t+(pos_thres-diff)/leak rate, or where the pixel makes
+            events, instead of at every frame. The leak of the skipped
+            frames is applied at once, with the jitter of their sum,
+            so the leak statistics are the same.
+            Not supported with active_pixel_update, which defers the leak
+            of inactive pixels already, tile_size, fused_pixel_pipeline
+            and the numba backend.
         """
 
         logger.info(
@@ -121,8 +280,11 @@ class EventEmulator(object):
 
         self.dont_show_list = []  # list of frame types to not show and not print warnings for except for once
         self.show_list = []  # list of named windows shown for internal states
-        # torch device
-        self.device = device
+        # torch device, the numba backend keeps its states on the CPU
+        self.numba_backend = str(device) == 'numba'
+        self.device = 'cpu' if self.numba_backend else device
+        # float64 frames on the device, reused across frames
+        self.frame_staging_buffer: Optional[torch.Tensor] = None
 
         # thresholds
         self.sigma_thres = sigma_thres
@@ -144,6 +306,108 @@ class EventEmulator(object):
 
         self.SHOT_NOISE_INTEN_FACTOR = 0.25
 
+        self.compact_events = compact_events
+        self.event_arena = EventArena() if compact_events else None
+        self.vectorized_event_generation = \
+            vectorized_event_generation or compact_events
+        self.active_pixel_update = active_pixel_update
+        self.sparse_shot_noise = sparse_shot_noise
+        if self.active_pixel_update and cs_lambda_pixels is not None:
+            logger.warning(
+                'active_pixel_update is not supported with center surround '
+                'DVS (cs_lambda_pixels), all pixels will be updated')
+            self.active_pixel_update = False
+        self.tile_size = tile_size
+        self.tile_workers = tile_workers
+        if self.tile_size > 0:
+            self.vectorized_event_generation = True
+            if self.active_pixel_update:
+                logger.warning(
+                    'active_pixel_update is not supported with tiles, '
+                    'all pixels will be updated')
+                self.active_pixel_update = False
+        self.threshold_crossing_timestamps = threshold_crossing_timestamps
+        if self.threshold_crossing_timestamps:
+            self.vectorized_event_generation = True
+            if self.active_pixel_update:
+                logger.warning(
+                    'active_pixel_update is not supported with '
+                    'threshold_crossing_timestamps, '
+                    'all pixels will be updated')
+                self.active_pixel_update = False
+            if self.tile_size > 0:
+                logger.warning(
+                    'tile_size is not supported with '
+                    'threshold_crossing_timestamps, the pixels are not tiled')
+                self.tile_size = 0
+        self.fused_pixel_pipeline = fused_pixel_pipeline
+        if self.fused_pixel_pipeline:
+            unsupported = [name for name, enabled in (
+                ('center surround DVS (cs_lambda_pixels)',
+                 cs_lambda_pixels is not None),
+                ('active_pixel_update', self.active_pixel_update),
+                ('tile_size', self.tile_size > 0)) if enabled]
+            if len(unsupported) > 0:
+                logger.warning(
+                    'fused_pixel_pipeline is not supported with {}, '
+                    'the pixel pipeline is not fused'.format(
+                        ' and '.join(unsupported)))
+                self.fused_pixel_pipeline = False
+        self._compiled_fused_pixel_update = None  # compiled on first use
+        if self.numba_backend:
+            unsupported = [name for name, enabled in (
+                ('center surround DVS (cs_lambda_pixels)',
+                 cs_lambda_pixels is not None),
+                ('active_pixel_update', self.active_pixel_update),
+                ('tile_size', self.tile_size > 0),
+                ('threshold_crossing_timestamps',
+                 self.threshold_crossing_timestamps),
+                ('fused_pixel_pipeline', self.fused_pixel_pipeline))
+                if enabled]
+            if len(unsupported) > 0:
+                logger.warning(
+                    'the numba backend is not supported with {}, '
+                    'using the torch CPU backend'.format(
+                        ' and '.join(unsupported)))
+                self.numba_backend = False
+        self.scheduled_leak = scheduled_leak
+        if self.scheduled_leak:
+            unsupported = [name for name, enabled in (
+                ('active_pixel_update', self.active_pixel_update),
+                ('tile_size', self.tile_size > 0),
+                ('fused_pixel_pipeline', self.fused_pixel_pipeline),
+                ('the numba backend', self.numba_backend)) if enabled]
+            if len(unsupported) > 0:
+                logger.warning(
+                    'scheduled_leak is not supported with {}, the leak '
+                    'is applied at every frame'.format(
+                        ' and '.join(unsupported)))
+                self.scheduled_leak = False
+        self.device_events = device_events
+        if aps_frame_interval < 1 or aps_frame_rate_hz < 0 \
+                or aps_frame_change < 0:
+            raise ValueError(
+                'aps_frame_interval={} must be >=1 and aps_frame_rate_hz={} '
+                'and aps_frame_change={} must be >=0'.format(
+                    aps_frame_interval, aps_frame_rate_hz, aps_frame_change))
+        if aps_frame_rate_hz > 0 and aps_frame_interval > 1:
+            logger.warning(
+                'aps_frame_rate_hz={} overrides aps_frame_interval={}'.format(
+                    aps_frame_rate_hz, aps_frame_interval))
+        self.aps_frame_interval = aps_frame_interval
+        self.aps_frame_rate_hz = aps_frame_rate_hz
+        self.aps_frame_change = aps_frame_change
+        if self.device_events and self.compact_events:
+            logger.warning(
+                'device_events is not supported with compact_events, '
+                'the events are returned as EVENT_DTYPE records')
+            self.device_events = False
+        self.num_pixel_updates = 0  # number of pixel updates of active pixel update
+        self.num_pixel_frames = 0  # number of pixels times frames
+        # number of frames without events that skipped the event generation
+        self.num_static_frames = 0
+        self.no_events_warning_printed = False
+
         # output properties
         self.output_folder = output_folder
         self.output_width = output_width
@@ -157,14 +421,33 @@ class EventEmulator(object):
             torch.manual_seed(seed)
             np.random.seed(seed)
             random.seed(seed)
+        # key of the random numbers of the numba backend
+        self.numba_seed = np.random.randint(0, 2**31) \
+            if self.numba_backend else 0
+        # key of the counter-based random numbers, see counter_rng
+        self.counter_rng_seed = 0
+        self.counter_rng: Optional[CounterRNG] = None
+        if counter_rng:
+            self.counter_rng_seed = seed if seed != 0 \
+                else int(np.random.randint(1, 2**31))
+            self.counter_rng = CounterRNG(self.counter_rng_seed)
+        # flat pixel indices, the pixel keys of the counter-based
+        # random numbers
+        self.pixel_indices: Optional[torch.Tensor] = None
 
         # h5 output
         self.output_folder = output_folder
+        self.append_outputs = append_outputs
         self.dvs_h5 = dvs_h5
         self.dvs_h5_dataset = None
         self.frame_h5_dataset = None
         self.frame_ts_dataset = None
         self.frame_ev_idx_dataset = None
+        # APS frame sampling of the HDF5 frame datasets, see prepare_storage()
+        self.aps_frame_numbers: Optional[np.ndarray] = None
+        self.aps_frame_ts: Optional[np.ndarray] = None
+        self.aps_frame_slots = {}  # frame number: slot, with aps_frame_change
+        self.aps_last_frame: Optional[np.ndarray] = None
 
         # aedat or text output
         self.dvs_aedat2 = dvs_aedat2
@@ -182,6 +465,10 @@ class EventEmulator(object):
         self.cs_alpha_warning_printed = False
         self.cs_tau_p_ms = cs_tau_p_ms
         self.cs_lambda_pixels = cs_lambda_pixels
+        if cs_solver not in ('direct', 'euler'):
+            raise ValueError(
+                "cs_solver={} must be 'direct' or 'euler'".format(cs_solver))
+        self.cs_solver = cs_solver
         self.cs_surround_frame: Optional[torch.Tensor] = None  # surround frame state
         self.csdvs_enabled = False  # flag to run center surround DVS emulation
         if self.cs_lambda_pixels is not None:
@@ -204,6 +491,7 @@ class EventEmulator(object):
                         f'cs_tau_p_ms: {self.cs_tau_p_ms}\n\t'
                         f'cs_tau_h_ms:  {self.cs_tau_h_ms}\n\t'
                         f'cs_lambda_pixels:  {self.cs_lambda_pixels:.2f}\n\t'
+                        f'cs_solver:  {self.cs_solver}\n\t'
                         )
 
         try:
@@ -211,10 +499,11 @@ class EventEmulator(object):
                 path = os.path.join(self.output_folder, dvs_h5)
                 path = checkAddSuffix(path, '.h5')
                 logger.info('opening event output dataset file ' + path)
-                self.dvs_h5 = h5py.File(path, "w")
+                self.dvs_h5 = h5py.File(
+                    path, "a" if self.append_outputs else "w")
 
                 # for events
-                self.dvs_h5_dataset = self.dvs_h5.create_dataset(
+                self.dvs_h5_dataset = self._create_dataset(
                     name="events",
                     shape=(0, 4),
                     maxshape=(None, 4),
@@ -227,12 +516,14 @@ class EventEmulator(object):
                 logger.info('opening AEDAT-2.0 output file ' + path)
                 self.dvs_aedat2 = AEDat2Output(
                     path, output_width=self.output_width,
-                    output_height=self.output_height)
+                    output_height=self.output_height,
+                    append=self.append_outputs)
             if dvs_text:
                 path = os.path.join(self.output_folder, dvs_text)
                 path = checkAddSuffix(path, '.txt')
                 logger.info('opening text DVS output file ' + path)
-                self.dvs_text = DVSTextOutput(path)
+                self.dvs_text = DVSTextOutput(
+                    path, append=self.append_outputs)
 
 
 
@@ -251,6 +542,10 @@ class EventEmulator(object):
         except Exception as e:
             logger.warning(f'cannot get screen size for window placement: {e}')
 
+        if self.show_dvs_model_state is not None and self.tile_size > 0:
+            logger.warning(
+                'show_dvs_model_state is not supported with tiles')
+            self.show_dvs_model_state = None
         if self.show_dvs_model_state is not None and len(self.show_dvs_model_state) == 1 and self.show_dvs_model_state[0] == 'all':
             logger.info(f'will show all model states that exist from {EventEmulator.MODEL_STATES.keys()}')
             self.show_dvs_model_state = EventEmulator.MODEL_STATES.keys()
@@ -259,27 +554,88 @@ class EventEmulator(object):
 
         atexit.register(self.cleanup)
 
+    def _create_dataset(self, name, **kwargs):
+        """Creates a dataset in the HDF5 output, or returns the existing
+        one when appending to the outputs."""
+        if self.append_outputs and name in self.dvs_h5:
+            return self.dvs_h5[name]
+        return self.dvs_h5.create_dataset(name=name, **kwargs)
+
+    def aps_frame_numbers_of(self, n_frames, frame_ts):
+        """Returns the numbers of the frames that may be written to
+        the HDF5 frame dataset, see aps_frame_interval and
+        aps_frame_rate_hz.
+
+        Parameters
+        ----------
+        n_frames: int
+            number of frames.
+        frame_ts: np.ndarray
+            [n_frames] timestamps of the frames in float seconds.
+
+        Returns
+        -------
+        np.ndarray of increasing 0-based frame numbers.
+        """
+        if self.aps_frame_rate_hz > 0:
+            frame_ts = np.asarray(frame_ts, dtype=np.float64)[:n_frames]
+            # APS interval of each frame, the small offset keeps a frame
+            # at the start of an interval in it despite rounding
+            intervals = np.floor(
+                (frame_ts-frame_ts[0])*self.aps_frame_rate_hz+1e-6)
+            return np.flatnonzero(
+                np.diff(intervals, prepend=-np.inf) > 0)
+        return np.arange(0, n_frames, self.aps_frame_interval)
+
     def prepare_storage(self, n_frames, frame_ts):
+        """Prepares the HDF5 datasets of the frames, their timestamps
+        and the index of the first event after each of them, for the
+        frames selected by the APS frame sampling.
+
+        With aps_frame_change, the datasets grow as the frames are
+        written, else they have their final size.
+
+        Parameters
+        ----------
+        n_frames: int
+            number of frames that will be emulated.
+        frame_ts: np.ndarray
+            [n_frames] timestamps of the frames in float seconds.
+        """
         # extra prepare for frame storage
         if self.dvs_h5:
+            self.aps_frame_numbers = self.aps_frame_numbers_of(
+                n_frames, frame_ts)
+            self.aps_frame_ts = \
+                (np.array(frame_ts, dtype=np.float32) * 1e6).astype(np.uint32)
+            n_aps_frames = len(self.aps_frame_numbers)
+            size = 0 if self.aps_frame_change > 0 else n_aps_frames
+            logger.info(
+                'writing up to {} of {} frames to the HDF5 frame '
+                'dataset'.format(n_aps_frames, n_frames))
+
             # for frame
-            self.frame_h5_dataset = self.dvs_h5.create_dataset(
+            self.frame_h5_dataset = self._create_dataset(
                 name="frame",
-                shape=(n_frames, self.output_height, self.output_width),
+                shape=(size, self.output_height, self.output_width),
+                maxshape=(n_aps_frames, self.output_height,
+                          self.output_width),
                 dtype="uint8",
                 compression="gzip")
 
-            frame_ts_arr = np.array(frame_ts, dtype=np.float32) * 1e6
-            self.frame_ts_dataset = self.dvs_h5.create_dataset(
+            self.frame_ts_dataset = self._create_dataset(
                 name="frame_ts",
-                shape=(n_frames,),
-                data=frame_ts_arr.astype(np.uint32),
+                shape=(size,),
+                maxshape=(n_aps_frames,),
+                data=None if self.aps_frame_change > 0
+                else self.aps_frame_ts[self.aps_frame_numbers],
                 dtype="uint32",
                 compression="gzip")
             # corresponding event idx
-            self.frame_ev_idx_dataset = self.dvs_h5.create_dataset(
+            self.frame_ev_idx_dataset = self._create_dataset(
                 name="frame_idx",
-                shape=(n_frames,),
+                shape=(size,),
+                maxshape=(n_aps_frames,),
                 dtype="uint64",
                 compression="gzip")
         else:
@@ -287,6 +643,173 @@ class EventEmulator(object):
             self.frame_ts_dataset = None
             self.frame_ev_idx_dataset = None
 
+    def _aps_frame_index(self, frame_number):
+        """Returns the index of a frame in aps_frame_numbers, or None if
+        the APS frame sampling does not select it."""
+        k = int(np.searchsorted(self.aps_frame_numbers, frame_number))
+        if k < len(self.aps_frame_numbers) and \
+                self.aps_frame_numbers[k] == frame_number:
+            return k
+        return None
+
+    def _aps_frame_slot(self, frame_number):
+        """Returns the index in the HDF5 frame datasets of a frame that
+        is written there, else None."""
+        if self.aps_frame_change > 0:
+            return self.aps_frame_slots.get(frame_number)
+        return self._aps_frame_index(frame_number)
+
+    def _write_frame(self, new_frame):
+        """Saves the input frame to the HDF5 frame dataset, if prepared
+        and selected by the APS frame sampling."""
+        frame_number = self.frame_counter
+        if self.frame_h5_dataset is None or \
+                self._aps_frame_index(frame_number) is None:
+            return
+        if torch.is_tensor(new_frame):
+            new_frame = new_frame.cpu().numpy()
+        new_frame = new_frame.astype(np.uint8)
+        if self.aps_frame_change > 0:
+            if self.aps_last_frame is not None and np.mean(np.abs(
+                    new_frame.astype(np.float32) -
+                    self.aps_last_frame)) < self.aps_frame_change:
+                return
+            self.aps_last_frame = new_frame
+            # append the frame and its timestamp
+            slot = self.frame_h5_dataset.shape[0]
+            for dataset in (self.frame_h5_dataset, self.frame_ts_dataset,
+                            self.frame_ev_idx_dataset):
+                dataset.resize(slot+1, axis=0)
+            self.frame_ts_dataset[slot] = self.aps_frame_ts[frame_number]
+            self.aps_frame_slots[frame_number] = slot
+        else:
+            slot = self._aps_frame_index(frame_number)
+        # save frame data
+        self.frame_h5_dataset[slot] = new_frame
+
+    def _write_frame_event_idx(self, frame_number, num_pending_events=0):
+        """Saves the event index of a frame, if prepared and written to
+        the HDF5 frame dataset.
+
+        Parameters
+        ----------
+        frame_number: int
+            0-based number of the frame.
+        num_pending_events: int
+            number of events of this frame and frames before it that
+            are not yet written to the HDF5 event dataset.
+        """
+        if self.frame_ev_idx_dataset is not None:
+            slot = self._aps_frame_slot(frame_number)
+            if slot is None:
+                return
+            self.aps_frame_slots.pop(frame_number, None)
+            self.frame_ev_idx_dataset[slot] = \
+                self.dvs_h5_dataset.shape[0] + num_pending_events
+
+    def state_dict(self):
+        """Returns the state of the emulator, to resume it later with
+        load_state_dict().
+
+        The state holds the pixel states, per-pixel thresholds and noise
+        rates, the time of the previous frame, the frame counter,
+        the event statistics, the states of the torch, numpy and python
+        random number generators and the sizes of the event outputs,
+        which are flushed to disk.
+
+        Returns
+        -------
+        state: dict
+            copy of the state, can be saved with torch.save().
+        """
+        state = {}
+        for name in EventEmulator.STATE_ATTRIBUTES:
+            if not hasattr(self, name):
+                continue
+            value = getattr(self, name)
+            if torch.is_tensor(value):
+                value = value.clone()
+            elif isinstance(value, list):
+                value = list(value)
+            state[name] = value
+
+        if self.pixel_tiles is not None:
+            state['pixel_tiles'] = self.pixel_tiles.state_dict()
+
+        state['rng'] = {
+            'torch': torch.get_rng_state(),
+            'numpy': np.random.get_state(),
+            'random': random.getstate()}
+        if str(self.device).startswith('cuda'):
+            state['rng']['cuda'] = torch.cuda.get_rng_state_all()
+
+        outputs = {}
+        if self.dvs_h5 is not None:
+            self.dvs_h5.flush()
+            outputs['h5_events'] = self.dvs_h5_dataset.shape[0]
+        if self.aps_frame_change > 0 and self.frame_h5_dataset is not None:
+            outputs['h5_frames'] = self.frame_h5_dataset.shape[0]
+        if self.dvs_aedat2 is not None:
+            outputs['aedat2'] = self.dvs_aedat2.offset()
+        if self.dvs_text is not None:
+            outputs['text'] = self.dvs_text.offset()
+        state['outputs'] = outputs
+
+        return state
+
+    def load_state_dict(self, state):
+        """Restores the state from state_dict().
+
+        The event outputs are truncated to their size in the state,
+        so they must be opened with append_outputs.
+        The next frame must be the one after the last frame before
+        state_dict(); the events are then the same as without
+        the interruption.
+
+        Parameters
+        ----------
+        state: dict
+            state returned by state_dict().
+        """
+        for name in EventEmulator.STATE_ATTRIBUTES:
+            if name not in state:
+                continue
+            value = state[name]
+            if torch.is_tensor(value):
+                value = value.to(self.device)
+            setattr(self, name, value)
+        if 'pixel_tiles' in state:
+            self.pixel_tiles = TiledPixelArray(
+                *state['pixel_tiles']['shape'], self.tile_size,
+                self.tile_workers)
+            self.pixel_tiles.load_state_dict(
+                state['pixel_tiles'], self.device)
+        if self.fused_pixel_pipeline and self.base_log_frame is not None:
+            self._init_fused_pixel_pipeline()
+        if self.numba_backend and self.base_log_frame is not None:
+            self._init_numba_backend()
+        if self.counter_rng is not None:
+            self.counter_rng = CounterRNG(self.counter_rng_seed)
+
+        rng = state['rng']
+        torch.set_rng_state(rng['torch'])
+        np.random.set_state(rng['numpy'])
+        random.setstate(rng['random'])
+        if 'cuda' in rng and str(self.device).startswith('cuda'):
+            torch.cuda.set_rng_state_all(rng['cuda'])
+
+        outputs = state.get('outputs', {})
+        if self.dvs_h5 is not None and 'h5_events' in outputs:
+            self.dvs_h5_dataset.resize(outputs['h5_events'], axis=0)
+        if self.frame_h5_dataset is not None and 'h5_frames' in outputs:
+            for dataset in (self.frame_h5_dataset, self.frame_ts_dataset,
+                            self.frame_ev_idx_dataset):
+                dataset.resize(outputs['h5_frames'], axis=0)
+        if self.dvs_aedat2 is not None and 'aedat2' in outputs:
+            self.dvs_aedat2.truncate(outputs['aedat2'])
+        if self.dvs_text is not None and 'text' in outputs:
+            self.dvs_text.truncate(outputs['text'])
+
     def cleanup(self):
         if len(self.cs_steps_taken) > 1:
             mean_staps = np.mean(self.cs_steps_taken)
@@ -294,6 +817,19 @@ class EventEmulator(object):
             median_steps = np.median(self.cs_steps_taken)
             logger.info(
                 f'CSDVS steps statistics: mean+std= {mean_staps:.0f} + {std_steps:.0f} (median= {median_steps:.0f})')
+        if self.active_pixel_update and self.num_pixel_frames > 0:
+            logger.info(
+                f'active pixel update: updated '
+                f'{100 * self.num_pixel_updates / self.num_pixel_frames:.2f}% '
+                f'of pixels per frame on average')
+        if self.num_static_frames > 0:
+            logger.info(
+                f'skipped the event generation of '
+                f'{self.num_static_frames} static frames without events '
+                f'({100 * self.num_static_frames / self.frame_counter:.1f}% '
+                f'of frames)')
+        if self.pixel_tiles is not None:
+            self.pixel_tiles.close()
         if self.dvs_h5 is not None:
             self.dvs_h5.close()
 
@@ -330,7 +866,16 @@ class EventEmulator(object):
         self.diff_frame = None
 
         # take the variance of threshold into account.
-        if self.sigma_thres > 0:
+        if self.sigma_thres > 0 and self.counter_rng is not None:
+            # mismatch of frame 0 of the counter-based random numbers
+            pixels = self._pixel_indices()
+            self.pos_thres = self.pos_thres + self.sigma_thres * \
+                self.counter_rng.normal(pixels, 0, crng.POS_THRES_STREAM)
+            self.pos_thres = torch.clamp(self.pos_thres, min=0.01)
+            self.neg_thres = self.neg_thres + self.sigma_thres * \
+                self.counter_rng.normal(pixels, 0, crng.NEG_THRES_STREAM)
+            self.neg_thres = torch.clamp(self.neg_thres, min=0.01)
+        elif self.sigma_thres > 0:
             self.pos_thres = torch.normal(
                 self.pos_thres, self.sigma_thres,
                 size=first_frame_linear.shape,
@@ -367,9 +912,13 @@ class EventEmulator(object):
             #      dtype=torch.float32, device=self.device)*self.pos_thres
 
             # set noise rate array, it's a log-normal distribution
-            self.noise_rate_array = torch.randn(
-                first_frame_linear.shape, dtype=torch.float32,
-                device=self.device)
+            if self.counter_rng is not None:
+                self.noise_rate_array = self.counter_rng.normal(
+                    self._pixel_indices(), 0, crng.NOISE_RATE_STREAM)
+            else:
+                self.noise_rate_array = torch.randn(
+                    first_frame_linear.shape, dtype=torch.float32,
+                    device=self.device)
             self.noise_rate_array = torch.exp(
                 math.log(10) * self.noise_rate_cov_decades * self.noise_rate_array)
 
@@ -439,6 +988,10 @@ class EventEmulator(object):
         self.c_minus_s_frame: Optional[np.ndarray] = None
         self.base_log_frame: Optional[np.ndarray] = None
         self.diff_frame: Optional[np.ndarray] = None
+        self.timestamp_mem: Optional[torch.Tensor] = None  # time of last event
+        if getattr(self, 'pixel_tiles', None) is not None:
+            self.pixel_tiles.close()
+        self.pixel_tiles: Optional[TiledPixelArray] = None  # tiles, see tile_size
 
         self.frame_counter = 0
 
@@ -478,13 +1031,49 @@ class EventEmulator(object):
                 cv2.cvtColor((img * 255).astype(np.uint8),
                              cv2.COLOR_GRAY2BGR))
 
+    def _stage_frame(self, frame):
+        """Returns a frame as a float64 tensor on the device.
+
+        A float64 tensor on the device is returned as is. Other tensors and
+        np.ndarray, which is wrapped by torch.from_numpy() without a copy,
+        are copied into a staging buffer on the device that is reused by
+        the next frames of the same shape; the copy converts the dtype,
+        so e.g. uint8 frames are transferred to a GPU as uint8.
+
+        Parameters
+        ----------
+        frame: np.ndarray or torch.Tensor
+            [height, width] frame.
+
+        Returns
+        -------
+        torch.Tensor, valid until the next call.
+        """
+        if torch.is_tensor(frame):
+            device = torch.device(self.device)
+            if frame.dtype == torch.float64 \
+                    and frame.device.type == device.type \
+                    and device.index in (None, frame.device.index):
+                return frame
+        else:
+            # from_numpy() does not take negative strides
+            frame = torch.from_numpy(np.ascontiguousarray(frame))
+        if self.frame_staging_buffer is None \
+                or self.frame_staging_buffer.shape != frame.shape:
+            self.frame_staging_buffer = torch.empty(
+                frame.shape, dtype=torch.float64, device=self.device)
+        return self.frame_staging_buffer.copy_(frame)
+
     def generate_events(self, new_frame, t_frame):
         """Compute events in new frame.
 
         Parameters
         ----------
-        new_frame: np.ndarray
+        new_frame: np.ndarray or torch.Tensor
             [height, width], NOTE y is first dimension, like in matlab the column, x is 2nd dimension, i.e. row.
+            Any dtype, e.g. uint8, see _stage_frame(); a float64 tensor
+            on the device is used without a copy and must not be
+            modified in place while the emulator runs the frame.
         t_frame: float
             timestamp of new frame in float seconds
 
@@ -494,6 +1083,9 @@ class EventEmulator(object):
             [N, 4], each row contains [timestamp, y coordinate,
             x coordinate, sign of event].
             NOTE y then x, not x,y.
+            With compact_events, [N] EVENT_DTYPE records in a view of
+            the event arena that is valid until the next call.
+            With device_events, a torch.Tensor on the device.
         """
 
         # base_frame: the change detector input,
@@ -501,14 +1093,117 @@ class EventEmulator(object):
         # new_frame: the new intensity frame input
         # log_frame: the lowpass filtered brightness values
 
-        # like a DAVIS, write frame into the file if it's HDF5
-        if self.frame_h5_dataset is not None:
-            # save frame data
-            self.frame_h5_dataset[self.frame_counter] = \
-                new_frame.astype(np.uint8)
+        with stage('generate_events', frame=self.frame_counter):
+            # like a DAVIS, write frame into the file if it's HDF5
+            self._write_frame(new_frame)
+
+            # update frame counter
+            self.frame_counter += 1
 
-        # update frame counter
-        self.frame_counter += 1
+            # float64 frame on the device
+            with stage('stage_frame'):
+                self.new_frame = self._stage_frame(new_frame)
+
+            if self.compact_events:
+                self.event_arena.clear()
+
+            if self._active_pixel_update_ready():
+                events = self._emulate_frame_active_pixels(t_frame)
+            elif self._fused_pixel_pipeline_ready():
+                events = self._emulate_frame_fused(t_frame)
+            elif self._numba_backend_ready():
+                events = self._emulate_frame_numba(t_frame)
+            else:
+                with stage('lin_log'):
+                    # lin-log mapping
+                    log_new_frame = lin_log(self.new_frame)
+
+                    inten01 = None  # define for later
+                    if self.cutoff_hz > 0 or self.shot_noise_rate_hz > 0:  # will use later
+                        # Time constant of the filter is proportional to
+                        # the intensity value (with offset to deal with DN=0)
+                        # limit max time constant to ~1/10 of white intensity level
+                        inten01 = rescale_intensity_frame(self.new_frame)  # TODO assumes 8 bit
+
+                events = self._emulate_frame(log_new_frame, inten01, t_frame)
+
+            if self.compact_events:
+                events = self.event_arena.events() \
+                    if self.event_arena.num_events > 0 else None
+            elif events is not None and not self.device_events:
+                with stage('events_to_host'):
+                    events = events.cpu().numpy()
+            if events is not None:
+                self._write_events(events)
+
+            # save frame event idx
+            # determine after the events are added
+            self._write_frame_event_idx(self.frame_counter - 1)
+
+        return events
+
+    def add_events(self, events, num_events_to_frame, t_frame,
+                   num_events_on, num_events_off, new_frames=None,
+                   num_static_frames=0):
+        """Writes events of a block of frames that were emulated by
+        another emulator, e.g. in a worker process, to the outputs
+        and the event statistics, as if they were made by this emulator.
+
+        Parameters
+        ----------
+        events: np.ndarray
+            None or [N, 4] events or EVENT_DTYPE records,
+            see generate_events().
+        num_events_to_frame: np.ndarray
+            [M] number of events up to and including each frame.
+        t_frame: float
+            timestamp of the last frame in float seconds.
+        num_events_on, num_events_off: int
+            number of ON and OFF events.
+        new_frames: iterable
+            None or the M frames, to write them to the HDF5 frame dataset.
+        num_static_frames: int
+            number of static frames that skipped the event generation.
+        """
+        first_frame_number = self.frame_counter
+        if new_frames is not None:
+            for new_frame in new_frames:
+                self._write_frame(new_frame)
+                self.frame_counter += 1
+            self.frame_counter = first_frame_number
+        for i, n in enumerate(num_events_to_frame):
+            self._write_frame_event_idx(first_frame_number + i, int(n))
+        self.frame_counter += len(num_events_to_frame)
+
+        if events is not None and len(events) > 0:
+            self._write_events(events)
+        self.num_events_on += num_events_on
+        self.num_events_off += num_events_off
+        self.num_events_total += num_events_on + num_events_off
+        self.num_static_frames += num_static_frames
+        self.t_previous = t_frame
+
+    def _emulate_frame(self, log_new_frame, inten01, t_frame):
+        """Updates the pixel model with a new frame and computes its events.
+
+        Parameters
+        ----------
+        log_new_frame: torch.Tensor
+            [height, width] lin-log new frame.
+        inten01: torch.Tensor
+            [height, width] rescaled intensity of new frame,
+            or None if neither lowpass nor shot noise are enabled.
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the device, see generate_events().
+        """
+        if self.pixel_tiles is not None:
+            return self.pixel_tiles.emulate_frame(
+                self, log_new_frame, inten01, t_frame)
 
         if t_frame < self.t_previous:
             raise ValueError(
@@ -519,50 +1214,63 @@ class EventEmulator(object):
         delta_time = t_frame - self.t_previous
         # logger.debug('delta_time={}'.format(delta_time))
 
-        # convert into torch tensor
-        self.new_frame = torch.tensor(new_frame, dtype=torch.float64,
-                                      device=self.device)
-        # lin-log mapping
-        log_new_frame = lin_log(self.new_frame)
-
-        inten01 = None  # define for later
-        if self.cutoff_hz > 0 or self.shot_noise_rate_hz > 0:  # will use later
-            # Time constant of the filter is proportional to
-            # the intensity value (with offset to deal with DN=0)
-            # limit max time constant to ~1/10 of white intensity level
-            inten01 = rescale_intensity_frame(self.new_frame.clone().detach())  # TODO assumes 8 bit
-
         # Apply nonlinear lowpass filter here.
         # Filter is a 1st order lowpass IIR (can be 2nd order)
         # that uses two internal state variables
         # to store stages of cascaded first order RC filters.
         # Time constant of the filter is proportional to
         # the intensity value (with offset to deal with DN=0)
+        # DVS input of the previous frame, the start of the
+        # threshold crossings
+        previous_input = None
+        if self.threshold_crossing_timestamps \
+                and self.base_log_frame is not None:
+            previous_input = self.lp_log_frame1 if not self.csdvs_enabled \
+                else self.lp_log_frame1 - self.cs_surround_frame
         if self.base_log_frame is None:
             # initialize first stage of 2nd order IIR to first input
             self.lp_log_frame0 = log_new_frame
             # 2nd stage is initialized to same,
             # so diff will be zero for first frame
             self.lp_log_frame1 = log_new_frame
-        self.lp_log_frame0, self.lp_log_frame1 = low_pass_filter(
-            log_new_frame=log_new_frame,
-            lp_log_frame0=self.lp_log_frame0,
-            lp_log_frame1=self.lp_log_frame1,
-            inten01=inten01,
-            delta_time=delta_time,
-            cutoff_hz=self.cutoff_hz)
+        with stage('low_pass_filter'):
+            self.lp_log_frame0, self.lp_log_frame1 = low_pass_filter(
+                log_new_frame=log_new_frame,
+                lp_log_frame0=self.lp_log_frame0,
+                lp_log_frame1=self.lp_log_frame1,
+                inten01=inten01,
+                delta_time=delta_time,
+                cutoff_hz=self.cutoff_hz)
 
         # surround computations by time stepping the diffuser
         if self.csdvs_enabled:
-            self._update_csdvs(delta_time)
+            with stage('csdvs'):
+                self._update_csdvs(delta_time)
 
         if self.base_log_frame is None:
-            self._init(new_frame)
+            self._init(log_new_frame)
             if not self.csdvs_enabled:
                 self.base_log_frame = self.lp_log_frame1
             else:
                 self.base_log_frame = self.lp_log_frame1 - self.cs_surround_frame  # init base log frame (input to diff) to DC value, TODO check might not be correct to avoid transient
 
+            if self.active_pixel_update:
+                self._init_active_pixels()
+
+            if self.fused_pixel_pipeline:
+                self._init_fused_pixel_pipeline()
+
+            if self.numba_backend:
+                self._init_numba_backend()
+
+            if self.scheduled_leak and self.leak_rate_hz > 0:
+                self._init_scheduled_leak()
+
+            if self.tile_size > 0:
+                self.pixel_tiles = TiledPixelArray(
+                    *log_new_frame.shape, self.tile_size, self.tile_workers)
+                self.pixel_tiles.split_state(self)
+
             return None  # on first input frame we just setup the state of all internal nodes of pixels
 
         # Leak events: switch in diff change amp leaks at some rate
@@ -572,14 +1280,16 @@ class EventEmulator(object):
         # R_l=(dI/dt)/Theta_on, so
         # R_l*Theta_on=dI/dt, so
         # dI=R_l*Theta_on*dt
-        if self.leak_rate_hz > 0:
-            self.base_log_frame = subtract_leak_current(
-                base_log_frame=self.base_log_frame,
-                leak_rate_hz=self.leak_rate_hz,
-                delta_time=delta_time,
-                pos_thres=self.pos_thres,
-                leak_jitter_fraction=self.leak_jitter_fraction,
-                noise_rate_array=self.noise_rate_array)
+        if self.leak_rate_hz > 0 and not self.scheduled_leak:
+            with stage('leak'):
+                self.base_log_frame = subtract_leak_current(
+                    base_log_frame=self.base_log_frame,
+                    leak_rate_hz=self.leak_rate_hz,
+                    delta_time=delta_time,
+                    pos_thres=self.pos_thres,
+                    leak_jitter_fraction=self.leak_jitter_fraction,
+                    noise_rate_array=self.noise_rate_array,
+                    rand=self._leak_rand())
 
         # log intensity (brightness) change from memorized values is computed
         # from the difference between new input
@@ -590,6 +1300,48 @@ class EventEmulator(object):
             self.c_minus_s_frame = self.lp_log_frame1 - self.cs_surround_frame
             self.diff_frame = self.c_minus_s_frame - self.base_log_frame
 
+        # generate event map
+        with stage('event_map'):
+            pos_evts_frame, neg_evts_frame = compute_event_map(
+                self.diff_frame, self.pos_thres, self.neg_thres)
+        if self.leak_rate_hz > 0 and self.scheduled_leak:
+            with stage('leak'):
+                self._apply_scheduled_leak(
+                    t_frame, delta_time, pos_evts_frame, neg_evts_frame)
+        max_num_events_any_pixel = max(pos_evts_frame.max(),
+                                       neg_evts_frame.max())  # max number of events in any pixel for this interframe
+        return self._generate_frame_events(
+            pos_evts_frame, neg_evts_frame, max_num_events_any_pixel,
+            inten01, previous_input, delta_time, t_frame)
+
+    def _generate_frame_events(
+            self, pos_evts_frame, neg_evts_frame, max_num_events_any_pixel,
+            inten01, previous_input, delta_time, t_frame):
+        """Generates the events of a frame from its event counts
+        and updates the base log frame.
+
+        Parameters
+        ----------
+        pos_evts_frame, neg_evts_frame: torch.Tensor
+            [height, width] ON and OFF event counts.
+        max_num_events_any_pixel: torch.Tensor
+            largest count of any pixel.
+        inten01: torch.Tensor
+            [height, width] rescaled intensity of new frame,
+            or None if shot noise is disabled.
+        previous_input: torch.Tensor
+            [height, width] DVS input of the previous frame,
+            or None if threshold_crossing_timestamps is disabled.
+        delta_time: float
+            time since the previous frame in float seconds.
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the device, see generate_events().
+        """
         if not self.show_dvs_model_state is None:
             for s in self.show_dvs_model_state:
                 if not s in self.dont_show_list:
@@ -603,35 +1355,137 @@ class EventEmulator(object):
             if k == 27 or k == ord('x'):
                 v2e_quit()
 
-        # generate event map
-        pos_evts_frame, neg_evts_frame = compute_event_map(
-            self.diff_frame, self.pos_thres, self.neg_thres)
-        max_num_events_any_pixel = max(pos_evts_frame.max(),
-                                       neg_evts_frame.max())  # max number of events in any pixel for this interframe
+        if self._skip_static_frame(max_num_events_any_pixel, t_frame):
+            return None
+
+        max_num_events_any_pixel, ts_step, ts = self._iteration_timestamps(
+            max_num_events_any_pixel, delta_time, t_frame)
+
+        # NOISE: add temporal noise here by
+        # simple Poisson process that has a base noise rate
+        # self.shot_noise_rate_hz.
+        # If there is such noise event,
+        # then we output event from each such pixel
+
+        # the shot noise rate varies with intensity:
+        # for lowest intensity the rate rises to parameter.
+        # the noise is reduced by factor
+        # SHOT_NOISE_INTEN_FACTOR for brightest intensities
+
+        shot_on_cord, shot_off_cord = None, None
+
+        # This was in the loop, here we calculate loop-independent quantities
+        if self.shot_noise_rate_hz > 0:
+            with stage('shot_noise'):
+                shot_on_cord, shot_off_cord = self._generate_shot_noise(
+                    delta_time, max_num_events_any_pixel, inten01)
+
+        with stage('event_generation', iterations=ts.shape[0]):
+            if self.threshold_crossing_timestamps:
+                events, final_pos_evts_frame, final_neg_evts_frame = \
+                    self._generate_threshold_crossing_events(
+                        pos_evts_frame=pos_evts_frame,
+                        neg_evts_frame=neg_evts_frame,
+                        ts=ts,
+                        ts_step=ts_step,
+                        shot_on_cord=shot_on_cord,
+                        shot_off_cord=shot_off_cord,
+                        start_diff_frame=previous_input - self.base_log_frame,
+                        t_frame=t_frame)
+            elif self.vectorized_event_generation:
+                # build the event list of all iterations in one pass
+                events, final_pos_evts_frame, final_neg_evts_frame = \
+                    self._generate_event_fn()(
+                        pos_evts_frame=pos_evts_frame,
+                        neg_evts_frame=neg_evts_frame,
+                        ts=ts,
+                        shot_on_cord=shot_on_cord,
+                        shot_off_cord=shot_off_cord,
+                        timestamp_mem=self.timestamp_mem
+                        if self.refractory_period_s > ts_step else None,
+                        refractory_period_s=self.refractory_period_s,
+                        shuffle_keys=self._shuffle_keys_fn())
+                if self.compact_events:
+                    events = self._append_event_records(
+                        events, t_frame, ts.shape[0], pos_evts_frame.shape[1])
+            else:
+                events, final_pos_evts_frame, final_neg_evts_frame, \
+                    self.timestamp_mem = self._generate_events_loop(
+                        pos_evts_frame=pos_evts_frame,
+                        neg_evts_frame=neg_evts_frame,
+                        ts=ts,
+                        ts_step=ts_step,
+                        shot_on_cord=shot_on_cord,
+                        shot_off_cord=shot_off_cord,
+                        timestamp_mem=self.timestamp_mem,
+                        shuffle_keys=self._shuffle_keys_fn())
+
+        self._count_events(final_pos_evts_frame, final_neg_evts_frame)
+
+        # update base log frame according to the final
+        # number of output events
+        self.base_log_frame += final_pos_evts_frame * self.pos_thres
+        self.base_log_frame -= final_neg_evts_frame * self.neg_thres
+
+        # assign new time
+        self.t_previous = t_frame
+        return events
+
+    def _skip_static_frame(self, max_num_events_any_pixel, t_frame):
+        """Skips the event generation of a static frame, in which no pixel
+        crosses a threshold and there is no shot noise, so that there
+        are no events.
+
+        Parameters
+        ----------
+        max_num_events_any_pixel: torch.Tensor or int
+            largest event count of any pixel of the frame.
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        skipped: bool
+            True if the frame has no events and was skipped.
+        """
+        if max_num_events_any_pixel > 0 or self.shot_noise_rate_hz > 0:
+            return False
+        self.num_static_frames += 1
+        # assign new time
+        self.t_previous = t_frame
+        return True
+
+    def _iteration_timestamps(self, max_num_events_any_pixel, delta_time,
+                              t_frame):
+        """Returns the number of sub-frame iterations of a frame,
+        the time between them and their timestamps.
+
+        Parameters
+        ----------
+        max_num_events_any_pixel: torch.Tensor
+            largest event count of any pixel of the frame.
+        delta_time: float
+            time since the previous frame in float seconds.
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        num_iters, ts_step, ts: number of iterations, at least 1,
+            time between iterations and the [num_iters] float32
+            timestamps of the iterations.
+        """
         if max_num_events_any_pixel > 1000:
             logger.warning(f'num_iter={max_num_events_any_pixel}>1000 events')
 
         if max_num_events_any_pixel == 0:
-            logger.warning('no events generated for frame, generating any noise for this frame with 1 iteration')
+            if not self.no_events_warning_printed:
+                logger.warning(
+                    'no events generated for frame, generating any noise '
+                    'for this frame with 1 iteration, supressing further '
+                    'warnings')
+                self.no_events_warning_printed = True
             max_num_events_any_pixel = 1
-        # record final events update
-        final_pos_evts_frame = torch.zeros(
-            pos_evts_frame.shape, dtype=torch.int32, device=self.device)
-        final_neg_evts_frame = torch.zeros(
-            neg_evts_frame.shape, dtype=torch.int32, device=self.device)
-
-        # update the base frame, after we know how many events per pixel
-        # add to memorized brightness values just the events we emitted.
-        # don't add the remainder.
-        # the next aps frame might have sufficient value to trigger
-        # another event or it might not, but we are correct in not storing
-        # the current frame brightness
-        #  self.base_log_frame += pos_evts_frame*self.pos_thres
-        #  self.base_log_frame -= neg_evts_frame*self.neg_thres
-
-        # all events
-        events = []
-
         # event timestamps at each iteration
         # intermediate timestamps are linearly spaced
         # they start after the t_start to make sure
@@ -645,32 +1499,943 @@ class EventEmulator(object):
             start=self.t_previous + ts_step,
             end=t_frame,
             steps=max_num_events_any_pixel, dtype=torch.float32, device=self.device)
+        return max_num_events_any_pixel, ts_step, ts
 
-        # NOISE: add temporal noise here by
-        # simple Poisson process that has a base noise rate
-        # self.shot_noise_rate_hz.
-        # If there is such noise event,
-        # then we output event from each such pixel
-
-        # the shot noise rate varies with intensity:
-        # for lowest intensity the rate rises to parameter.
-        # the noise is reduced by factor
-        # SHOT_NOISE_INTEN_FACTOR for brightest intensities
+    def _generate_shot_noise(self, delta_time, num_iters, inten01):
+        """Generates the shot noise events of a frame.
 
-        shot_on_cord, shot_off_cord = None, None
+        Parameters
+        ----------
+        delta_time: float
+            time of the frame in seconds.
+        num_iters: int
+            number of sub-frame iterations.
+        inten01: torch.Tensor
+            [height, width] intensity of the frame in range 0-1.
 
-        # This was in the loop, here we calculate loop-independent quantities
-        if self.shot_noise_rate_hz > 0:
-            shot_on_cord, shot_off_cord = generate_shot_noise(
+        Returns
+        -------
+        shot_on_cord, shot_off_cord: torch.Tensor
+            [num_iters, height, width] ON and OFF shot noise events,
+            sparse COO tensors if sparse_shot_noise or counter_rng is set.
+        """
+        if self.counter_rng is not None:
+            return generate_shot_noise_counter(
+                counter_rng=self.counter_rng,
+                frame=self.frame_counter,
+                pixels=self._pixel_indices(),
                 shot_noise_rate_hz=self.shot_noise_rate_hz,
                 delta_time=delta_time,
-                num_iters=max_num_events_any_pixel,
+                num_iters=num_iters,
                 shot_noise_inten_factor=self.SHOT_NOISE_INTEN_FACTOR,
                 inten01=inten01,
                 pos_thres_pre_prob=self.pos_thres_pre_prob,
                 neg_thres_pre_prob=self.neg_thres_pre_prob)
+        if self.sparse_shot_noise:
+            shot_noise_fn = generate_shot_noise_sparse
+        else:
+            shot_noise_fn = generate_shot_noise
+        return shot_noise_fn(
+            shot_noise_rate_hz=self.shot_noise_rate_hz,
+            delta_time=delta_time,
+            num_iters=num_iters,
+            shot_noise_inten_factor=self.SHOT_NOISE_INTEN_FACTOR,
+            inten01=inten01,
+            pos_thres_pre_prob=self.pos_thres_pre_prob,
+            neg_thres_pre_prob=self.neg_thres_pre_prob)
+
+    def _pixel_indices(self):
+        """Returns the [height, width] flat pixel indices of the frame,
+        the pixel keys of the counter-based random numbers."""
+        shape = tuple(self.new_frame.shape)
+        if self.pixel_indices is None \
+                or tuple(self.pixel_indices.shape) != shape:
+            self.pixel_indices = torch.arange(
+                shape[0] * shape[1], device=self.device).view(shape)
+        return self.pixel_indices
+
+    def _leak_rand(self, pixels=None):
+        """Returns the standard normal leak jitter of this frame.
 
-        for i in range(max_num_events_any_pixel):
+        Parameters
+        ----------
+        pixels: torch.Tensor
+            flat indices of the pixels, or None for the
+            [height, width] frame.
+
+        Returns
+        -------
+        rand: torch.Tensor
+            float32 jitter of the pixels, from the counter-based random
+            numbers with counter_rng, else drawn like
+            subtract_leak_current().
+        """
+        if self.counter_rng is not None:
+            return self.counter_rng.normal(
+                self._pixel_indices() if pixels is None else pixels,
+                self.frame_counter, crng.LEAK_STREAM)
+        return torch.randn(
+            self.noise_rate_array.shape if pixels is None
+            else pixels.shape, dtype=torch.float32, device=self.device)
+
+    def _shuffle_keys_fn(self, pixels=None):
+        """Returns the shuffle_keys function of the events of this frame
+        for shuffle_event_columns(), or None without counter_rng.
+
+        Parameters
+        ----------
+        pixels: torch.Tensor
+            flat pixel indices of the columns' pixel numbers,
+            or None if they are flat pixel indices already.
+        """
+        if self.counter_rng is None:
+            return None
+        frame = self.frame_counter
+
+        def _shuffle_keys(columns):
+            iters, event_pixels, polarity = columns
+            if pixels is not None:
+                event_pixels = pixels[event_pixels]
+            return self.counter_rng.shuffle_keys(
+                frame, (iters, event_pixels, polarity))
+        return _shuffle_keys
+
+    def _generate_threshold_crossing_events(
+            self, pos_evts_frame, neg_evts_frame, ts, ts_step,
+            shot_on_cord, shot_off_cord, start_diff_frame, t_frame):
+        """Generates the events of a frame at the threshold crossings
+        of their pixels, see threshold_crossing_timestamps().
+
+        The events are time-ordered; events with the same timestamp are
+        shuffled like those of an iteration of the vectorized event
+        generation.
+
+        Parameters
+        ----------
+        pos_evts_frame, neg_evts_frame: torch.Tensor
+            [height, width] ON and OFF event counts.
+        ts: torch.Tensor
+            [num_iters] timestamps of the sub-frame iterations.
+        ts_step: float
+            time between the iterations.
+        shot_on_cord, shot_off_cord: torch.Tensor
+            None or shot noise events, see _generate_shot_noise().
+        start_diff_frame: torch.Tensor
+            [height, width] difference of the DVS input of the previous
+            frame from the memorized brightness.
+        t_frame: float
+            timestamp of the frame in float seconds.
+
+        Returns
+        -------
+        events, final_pos_evts_frame, final_neg_evts_frame:
+            see generate_event_list(); events is None with compact_events,
+            they are in the event arena.
+        """
+        columns, final_pos_evts_frame, final_neg_evts_frame = \
+            generate_event_columns(
+                pos_evts_frame=pos_evts_frame,
+                neg_evts_frame=neg_evts_frame,
+                ts=ts,
+                shot_on_cord=shot_on_cord,
+                shot_off_cord=shot_off_cord,
+                timestamp_mem=self.timestamp_mem
+                if self.refractory_period_s > ts_step else None,
+                refractory_period_s=self.refractory_period_s,
+                shuffle_keys=self._shuffle_keys_fn())
+        if columns is None:
+            return None, final_pos_evts_frame, final_neg_evts_frame
+
+        event_ts = threshold_crossing_timestamps(
+            columns, pos_evts_frame, neg_evts_frame,
+            start_diff_frame, self.diff_frame,
+            self.pos_thres, self.neg_thres,
+            ts, self.t_previous, t_frame - self.t_previous)
+        order = torch.argsort(event_ts, stable=True)
+        columns = tuple(c[order] for c in columns)
+        event_ts = event_ts[order]
+
+        width = pos_evts_frame.shape[1]
+        if self.compact_events:
+            _, pixels, polarity = columns
+            self.event_arena.append(
+                torch.round(1e6 * event_ts).long(), pixels % width,
+                pixels // width, polarity)
+            return None, final_pos_evts_frame, final_neg_evts_frame
+        return event_columns_to_list(columns, ts, width, event_ts), \
+            final_pos_evts_frame, final_neg_evts_frame
+
+    def _generate_event_fn(self):
+        """Returns the function of the vectorized event generation."""
+        if self.compact_events:
+            return generate_event_columns
+        return generate_event_list
+
+    def _append_event_records(self, columns, t_frame, num_iters, width,
+                              pixels=None):
+        """Appends the events of a frame to the event arena.
+
+        Parameters
+        ----------
+        columns: tuple
+            None or (iters, pixels, polarity) event columns,
+            see generate_event_columns().
+        t_frame: float
+            timestamp of the frame in float seconds.
+        num_iters: int
+            number of sub-frame iterations.
+        width: int
+            width of the frame.
+        pixels: torch.Tensor
+            flat pixel indices of the columns' pixel numbers,
+            or None if they are flat pixel indices already.
+
+        Returns
+        -------
+        None, the events are in the event arena.
+        """
+        if columns is None:
+            return None
+        iters, event_pixels, polarity = columns
+        if pixels is not None:
+            event_pixels = pixels[event_pixels]
+
+        # timestamps of the iterations in us, computed in float64
+        # so that they are exact also for long recordings
+        delta_time = t_frame - self.t_previous
+        ts_us = torch.round(1e6 * (
+            self.t_previous + delta_time * torch.arange(
+                1, num_iters + 1, dtype=torch.float64, device=self.device)
+            / num_iters)).long()
+
+        self.event_arena.append(
+            ts_us[iters], event_pixels % width, event_pixels // width,
+            polarity)
+        return None
+
+    def _count_events(self, final_pos_evts_frame, final_neg_evts_frame):
+        """Updates the event stats with the emitted events of a frame."""
+        num_pos_events = int(final_pos_evts_frame.sum())
+        num_neg_events = int(final_neg_evts_frame.sum())
+        self.num_events_on += num_pos_events
+        self.num_events_off += num_neg_events
+        self.num_events_total += num_pos_events + num_neg_events
+
+    def _fused_pixel_pipeline_ready(self):
+        """Returns True if the next frame uses the fused pixel pipeline."""
+        return self.fused_pixel_pipeline and self.base_log_frame is not None
+
+    def _init_fused_pixel_pipeline(self):
+        """Prepares the pixel states for the in place updates of the
+        fused pixel pipeline after the first frame has initialized them."""
+        # the states must not share memory with each other;
+        # the lowpass filter output is float64 like the intensity
+        lp_dtype = torch.float64 if self.cutoff_hz > 0 else torch.float32
+        self.lp_log_frame0 = self.lp_log_frame0.to(lp_dtype, copy=True)
+        self.lp_log_frame1 = self.lp_log_frame1.to(lp_dtype, copy=True)
+        self.base_log_frame = self.base_log_frame.clone()
+        self.diff_frame = torch.zeros_like(self.lp_log_frame1)
+
+    def _fused_pixel_update_fn(self):
+        """Returns fused_pixel_update() compiled with torch.compile(),
+        or the uncompiled function if torch.compile() is not available."""
+        if self._compiled_fused_pixel_update is None:
+            if hasattr(torch, 'compile'):
+                self._compiled_fused_pixel_update = torch.compile(
+                    fused_pixel_update, dynamic=False)
+            else:
+                logger.warning(
+                    'torch.compile() needs pytorch>=2.0, '
+                    'the pixel pipeline is not compiled')
+                self._compiled_fused_pixel_update = fused_pixel_update
+        return self._compiled_fused_pixel_update
+
+    @profiled('fused_pixel_pipeline')
+    def _emulate_frame_fused(self, t_frame):
+        """Updates the pixel model with the new frame self.new_frame and
+        computes its events like _emulate_frame(), with the per-frame
+        pixel pipeline in the kernel of fused_pixel_update().
+
+        Parameters
+        ----------
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the device, see generate_events().
+        """
+        if t_frame < self.t_previous:
+            raise ValueError(
+                "this frame time={} must be later than "
+                "previous frame time={}".format(t_frame, self.t_previous))
+        delta_time = t_frame - self.t_previous
+
+        # the states are updated in place, so keep the previous input
+        previous_input = self.lp_log_frame1.clone() \
+            if self.threshold_crossing_timestamps else None
+        # draw the leak jitter outside of the compiled kernel
+        # to use the same random numbers as _emulate_frame()
+        leak_rand = self._leak_rand() if self.leak_rate_hz > 0 else None
+
+        pos_evts_frame, neg_evts_frame, max_num_events_any_pixel, inten01 = \
+            self._fused_pixel_update_fn()(
+                new_frame=self.new_frame,
+                lp_log_frame0=self.lp_log_frame0,
+                lp_log_frame1=self.lp_log_frame1,
+                base_log_frame=self.base_log_frame,
+                diff_frame=self.diff_frame,
+                pos_thres=self.pos_thres,
+                neg_thres=self.neg_thres,
+                delta_time=delta_time,
+                cutoff_hz=self.cutoff_hz,
+                leak_rate_hz=self.leak_rate_hz,
+                leak_jitter_fraction=self.leak_jitter_fraction,
+                noise_rate_array=self.noise_rate_array
+                if self.leak_rate_hz > 0 else None,
+                leak_rand=leak_rand,
+                return_inten01=self.shot_noise_rate_hz > 0)
+        if self.cutoff_hz > 0:
+            self.lp_log_frame0, self.lp_log_frame1 = \
+                self.lp_log_frame1, self.lp_log_frame0
+        return self._generate_frame_events(
+            pos_evts_frame, neg_evts_frame, max_num_events_any_pixel,
+            inten01, previous_input, delta_time, t_frame)
+
+    def _numba_backend_ready(self):
+        """Returns True if the next frame uses the numba backend."""
+        return self.numba_backend and self.base_log_frame is not None
+
+    def _init_numba_backend(self):
+        """Prepares the pixel states for the numba kernels
+        after the first frame has initialized them."""
+        # the states are updated in place, so make sure that they do not
+        # share memory with each other;
+        # the lowpass filter output is float64 like the intensity
+        lp_dtype = torch.float64 if self.cutoff_hz > 0 else torch.float32
+        self.lp_log_frame0 = self.lp_log_frame0.to(lp_dtype, copy=True)
+        self.lp_log_frame1 = self.lp_log_frame1.to(lp_dtype, copy=True)
+        self.base_log_frame = self.base_log_frame.to(
+            torch.float32, copy=True)
+
+        # the kernels need the thresholds of each pixel
+        shape = self.base_log_frame.shape
+        self.pos_thres = torch.as_tensor(
+            self.pos_thres, dtype=torch.float32).expand(shape).contiguous()
+        self.neg_thres = torch.as_tensor(
+            self.neg_thres, dtype=torch.float32).expand(shape).contiguous()
+        self.pos_thres_pre_prob = self.pos_thres_nominal / self.pos_thres
+        self.neg_thres_pre_prob = self.neg_thres_nominal / self.neg_thres
+
+    @profiled('numba_backend')
+    def _emulate_frame_numba(self, t_frame):
+        """Updates the pixel model with the new frame self.new_frame and
+        computes its events like _emulate_frame(), with the kernels
+        of emulator_numba.
+
+        Parameters
+        ----------
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the CPU, see generate_events().
+        """
+        if t_frame < self.t_previous:
+            raise ValueError(
+                "this frame time={} must be later than "
+                "previous frame time={}".format(t_frame, self.t_previous))
+        delta_time = t_frame - self.t_previous
+        new_frame = self.new_frame.numpy()
+        height, width = new_frame.shape
+        unused = np.zeros((1, 1), dtype=np.float32)  # disabled state
+
+        pos_evts_frame = np.empty((height, width), dtype=np.int32)
+        neg_evts_frame = np.empty((height, width), dtype=np.int32)
+        max_num_events_any_pixel = emulator_numba.pixel_front_end(
+            new_frame, self.lp_log_frame0.numpy(),
+            self.lp_log_frame1.numpy(), self.base_log_frame.numpy(),
+            self.pos_thres.numpy(), self.neg_thres.numpy(),
+            self.noise_rate_array.numpy() if self.leak_rate_hz > 0
+            else unused,
+            emulator_numba.leak_noise(
+                self.numba_seed, self.frame_counter, (height, width))
+            if self.leak_rate_hz > 0 else unused,
+            pos_evts_frame, neg_evts_frame, delta_time, self.cutoff_hz,
+            self.leak_rate_hz, self.leak_jitter_fraction)
+        if self._skip_static_frame(max_num_events_any_pixel, t_frame):
+            return None
+
+        num_iters, ts_step, ts = self._iteration_timestamps(
+            torch.tensor(max_num_events_any_pixel, dtype=torch.int32),
+            delta_time, t_frame)
+        num_iters = int(num_iters)
+        # only filter when refractory_period_s is large enough,
+        # like the torch backend
+        refractory_period_s = self.refractory_period_s \
+            if self.refractory_period_s > ts_step else 0.
+        shot_noise_factor = \
+            (self.shot_noise_rate_hz/2)*delta_time/num_iters
+        kernel_args = (
+            new_frame, pos_evts_frame, neg_evts_frame, ts.numpy(),
+            self.timestamp_mem.numpy() if refractory_period_s > 0
+            else unused,
+            refractory_period_s, self.base_log_frame.numpy(),
+            self.pos_thres.numpy(), self.neg_thres.numpy(),
+            self.pos_thres_pre_prob.numpy(), self.neg_thres_pre_prob.numpy(),
+            shot_noise_factor, self.SHOT_NOISE_INTEN_FACTOR,
+            self.numba_seed, self.frame_counter)
+
+        # count the events of each row at each iteration, then write them
+        # in time order to an array of the exact size
+        row_iter_counts = np.empty((num_iters, height), dtype=np.int64)
+        num_emitted = np.empty((height, 2), dtype=np.int64)
+        emulator_numba.emit_events(
+            True, *kernel_args, row_iter_counts, row_iter_counts,
+            unused, num_emitted)
+        offsets = np.cumsum(row_iter_counts.ravel()).reshape(
+            row_iter_counts.shape) - row_iter_counts
+        num_events = int(offsets[-1, -1]+row_iter_counts[-1, -1])
+        events = np.empty((num_events, 4), dtype=np.float32)
+        iter_starts = np.append(offsets[:, 0], num_events)
+        emulator_numba.emit_events(
+            False, *kernel_args, row_iter_counts, offsets, events,
+            num_emitted)
+        emulator_numba.shuffle_iterations(
+            events, iter_starts, self.numba_seed, self.frame_counter)
+
+        num_pos_events, num_neg_events = (int(n) for n in num_emitted.sum(0))
+        self.num_events_on += num_pos_events
+        self.num_events_off += num_neg_events
+        self.num_events_total += num_pos_events + num_neg_events
+
+        if self.compact_events and num_events > 0:
+            iters = np.repeat(
+                np.arange(num_iters), row_iter_counts.sum(axis=1))
+            self._append_event_records(
+                (torch.from_numpy(iters),
+                 torch.from_numpy(events[:, 2].astype(np.int64)*width +
+                                  events[:, 1].astype(np.int64)),
+                 torch.from_numpy(events[:, 3].astype(np.int8))),
+                t_frame, num_iters, width)
+        self.t_previous = t_frame
+        if num_events == 0 or self.compact_events:
+            return None
+        return torch.from_numpy(events)
+
+    def _active_pixel_update_ready(self):
+        """Returns True if the next frame uses the active pixel update."""
+        return self.active_pixel_update and self.base_log_frame is not None
+
+    def _init_active_pixels(self):
+        """Initializes the state of the active pixel update
+        after the first frame has initialized all pixels."""
+        # the states are updated in place from now on, so make sure that
+        # they do not share memory with each other;
+        # the lowpass filter output is float64 like the intensity
+        lp_dtype = torch.float64 if self.cutoff_hz > 0 else torch.float32
+        self.lp_log_frame0 = self.lp_log_frame0.to(lp_dtype, copy=True)
+        self.lp_log_frame1 = self.lp_log_frame1.to(lp_dtype, copy=True)
+        self.base_log_frame = self.base_log_frame.clone()
+        self.diff_frame = torch.zeros_like(self.lp_log_frame1)
+
+        # flat states, for now all pixels are settled; the input is
+        # copied since the frame may be a reused staging buffer
+        self.active_pixels_input = self.new_frame.flatten().clone()
+        self.active_pixels_unsettled = torch.zeros(
+            self.active_pixels_input.shape, dtype=torch.bool,
+            device=self.device)
+
+        # the leak of inactive pixels is applied when they become active,
+        # starting from time of their last update
+        self.active_pixels_last_update = torch.full(
+            self.active_pixels_input.shape, float(self.t_previous),
+            dtype=torch.float64, device=self.device)
+        # sum of squared frame intervals, to compute the leak jitter of
+        # the frames that a pixel was inactive
+        self.active_pixels_sum_dt2 = 0.
+        self.active_pixels_last_sum_dt2 = torch.zeros_like(
+            self.active_pixels_last_update)
+        self.active_pixels_wake_time = torch.full_like(
+            self.active_pixels_last_update, math.inf)
+        if self.leak_rate_hz > 0:
+            all_pixels = torch.arange(
+                self.active_pixels_input.shape[0], device=self.device)
+            self._update_wake_time(
+                all_pixels,
+                (self.lp_log_frame1 - self.base_log_frame).view(-1),
+                self.t_previous)
+
+    def _pixel_values(self, x, pixels):
+        """Returns values of per-pixel parameter x (tensor or scalar)
+        at the flat pixel indices."""
+        if torch.is_tensor(x) and x.dim() > 0:
+            return x.reshape(-1)[pixels]
+        return x
+
+    def _update_wake_time(self, pixels, diff, t_frame):
+        """Sets the time when the leak may bring pixels near the
+        ON threshold.
+
+        Parameters
+        ----------
+        pixels: torch.Tensor
+            flat indices of the pixels.
+        diff: torch.Tensor
+            remaining log intensity change of the pixels after their events.
+        t_frame: float
+            time of the update.
+        """
+        pos_thres = self._pixel_values(self.pos_thres, pixels)
+        leak_rate = self.leak_rate_hz * \
+            self.noise_rate_array.view(-1)[pixels] * pos_thres * \
+            (1 + EventEmulator.ACTIVE_PIXEL_LEAK_WAKE_MARGIN)
+        self.active_pixels_wake_time[pixels] = \
+            t_frame + (pos_thres - diff).double() / leak_rate
+
+    def _subtract_pending_leak(self, base_log_frame, pixels, pos_thres,
+                               t_frame, last_update, sum_dt2,
+                               last_sum_dt2):
+        """Subtracts the leak of pixels since their last update,
+        with the jitter of the sum of the per-frame leaks over that time.
+
+        Parameters
+        ----------
+        base_log_frame: torch.Tensor
+            memorized log intensity of the pixels.
+        pixels: torch.Tensor
+            flat indices of the pixels.
+        pos_thres: torch.Tensor or float
+            ON thresholds of the pixels.
+        t_frame: float
+            time of the update.
+        last_update: torch.Tensor
+            flat time of the last update of each pixel.
+        sum_dt2: float
+            sum of the squared frame intervals up to t_frame.
+        last_sum_dt2: torch.Tensor
+            flat sum_dt2 at the last update of each pixel.
+
+        Returns
+        -------
+        base_log_frame: torch.Tensor
+            memorized log intensity of the pixels after the leak.
+        """
+        elapsed = t_frame - last_update[pixels]
+        jitter_dt = torch.sqrt(sum_dt2 - last_sum_dt2[pixels])
+        leak_jitter_fraction = self.leak_jitter_fraction * \
+            torch.where(elapsed > 0, jitter_dt / elapsed,
+                        torch.zeros_like(elapsed))
+        return subtract_leak_current(
+            base_log_frame=base_log_frame,
+            leak_rate_hz=self.leak_rate_hz,
+            delta_time=elapsed.float(),
+            pos_thres=pos_thres,
+            leak_jitter_fraction=leak_jitter_fraction.float(),
+            noise_rate_array=self.noise_rate_array.view(-1)[pixels],
+            rand=self._leak_rand(pixels))
+
+    def _init_scheduled_leak(self):
+        """Initializes the state of the scheduled leak after the first
+        frame has initialized all pixels."""
+        # the base is updated in place from now on
+        self.base_log_frame = self.base_log_frame.clone()
+        num_pixels = self.base_log_frame.numel()
+        # leak rate of each pixel that its jittered leak is unlikely to
+        # exceed, in log intensity per second
+        self.leak_rate_bound = (
+            self.leak_rate_hz * self.noise_rate_array.double() *
+            self.pos_thres * (1 + EventEmulator.SCHEDULED_LEAK_MARGIN)
+        ).reshape(-1)
+        self.leak_last_update = torch.full(
+            (num_pixels,), float(self.t_previous), dtype=torch.float64,
+            device=self.device)
+        # sum of squared frame intervals, for the jitter of the leak
+        self.leak_sum_dt2 = 0.
+        self.leak_last_sum_dt2 = torch.zeros_like(self.leak_last_update)
+        # pixels whose next leak time is before leak_bucket_end,
+        # found by the first frame
+        self.leak_bucket_end = -math.inf
+        self.leak_bucket_pixels: Optional[torch.Tensor] = None
+        # diff of each pixel when it was last found not to be due before
+        # leak_bucket_end; only a pixel whose diff rose since then can
+        # become due in the bucket
+        self.leak_bucket_diff: Optional[torch.Tensor] = None
+
+    def _leak_due(self, pixels, t):
+        """Returns True for the pixels whose leak may bring them to their
+        ON threshold by time t, i.e. whose next leak time
+        last_update+(pos_thres-diff)/leak_rate_bound is before t,
+        or that have OFF events."""
+        diff = self.diff_frame.view(-1)[pixels]
+        return (diff + self.leak_rate_bound[pixels] * (
+            t - self.leak_last_update[pixels]) >=
+            self._pixel_values(self.pos_thres, pixels)) | \
+            (diff <= -self._pixel_values(self.neg_thres, pixels))
+
+    def _apply_scheduled_leak(self, t_frame, delta_time, pos_evts_frame,
+                              neg_evts_frame):
+        """Subtracts the leak from the pixels that may make events in
+        this frame and updates their self.diff_frame and event counts.
+
+        The pixels whose next leak time is in the current time bucket of
+        SCHEDULED_LEAK_BUCKET_S are found once per bucket; each frame
+        then checks only these pixels, those with events and those whose
+        input brought them closer to the ON threshold since the bucket
+        was built, which join the bucket if they are due before its end.
+
+        Parameters
+        ----------
+        t_frame: float
+            timestamp of the frame in float seconds.
+        delta_time: float
+            time since the previous frame.
+        pos_evts_frame, neg_evts_frame: torch.Tensor
+            [height, width] ON and OFF event counts without the leak
+            since the last update of the pixels, updated in place.
+        """
+        self.leak_sum_dt2 += delta_time ** 2
+        diff = self.diff_frame.view(-1)
+        if t_frame > self.leak_bucket_end:
+            self.leak_bucket_end = \
+                t_frame + EventEmulator.SCHEDULED_LEAK_BUCKET_S
+            self.leak_bucket_pixels = self._leak_due(
+                slice(None), self.leak_bucket_end).nonzero(as_tuple=True)[0]
+            self.leak_bucket_diff = diff.clone()
+        else:
+            # the pixels outside the bucket whose diff rose may now be due
+            # before the end of the bucket; most frames have none, which
+            # the max finds faster than nonzero()
+            if (diff - self.leak_bucket_diff).max() > 0:
+                risen = (diff > self.leak_bucket_diff).nonzero(
+                    as_tuple=True)[0]
+                self.leak_bucket_diff[risen] = diff[risen]
+                risen = risen[self._leak_due(risen, self.leak_bucket_end)]
+                if risen.shape[0] > 0:
+                    self.leak_bucket_pixels = torch.unique(
+                        torch.cat((self.leak_bucket_pixels, risen)))
+        pixels = self.leak_bucket_pixels
+        if pos_evts_frame.max() > 0 or neg_evts_frame.max() > 0:
+            pixels = torch.cat((pixels, (
+                pos_evts_frame + neg_evts_frame).view(
+                    -1).nonzero(as_tuple=True)[0]))
+        pixels = pixels[self._leak_due(pixels, t_frame)]
+        if pixels.shape[0] == 0:
+            return
+        # a pixel with events may be in the bucket as well
+        pixels = torch.unique(pixels)
+
+        base_log_frame = self.base_log_frame.view(-1)
+        previous_base = base_log_frame[pixels]
+        new_base = self._subtract_pending_leak(
+            previous_base, pixels, self._pixel_values(self.pos_thres, pixels),
+            t_frame, self.leak_last_update, self.leak_sum_dt2,
+            self.leak_last_sum_dt2)
+        base_log_frame[pixels] = new_base
+        diff[pixels] += previous_base - new_base
+        self.leak_last_update[pixels] = t_frame
+        self.leak_last_sum_dt2[pixels] = self.leak_sum_dt2
+        self.leak_bucket_diff[pixels] = diff[pixels]
+
+        pos_evts_frame.view(-1)[pixels], neg_evts_frame.view(-1)[pixels] = \
+            compute_event_map(
+                diff[pixels], self._pixel_values(self.pos_thres, pixels),
+                self._pixel_values(self.neg_thres, pixels))
+
+    @profiled('active_pixel_update')
+    def _emulate_frame_active_pixels(self, t_frame):
+        """Updates only the active pixels with the new frame and computes
+        their events.
+
+        Active pixels are those whose input changed, whose lowpass filter
+        has not settled, that have a shot noise event in this frame, or
+        whose leak since their last update may have brought them near the
+        ON threshold. The other pixels cannot make events; their state
+        is left as it is and their leak is applied (with the jitter of the
+        skipped frames) once they become active.
+
+        The model is the same as _emulate_frame(), but random numbers are
+        drawn differently, so the events are only statistically equivalent.
+        Shot noise makes at most one ON and one OFF event per pixel and
+        frame.
+
+        Parameters
+        ----------
+        t_frame: float
+            timestamp of new frame self.new_frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the device, see generate_events().
+        """
+        if t_frame < self.t_previous:
+            raise ValueError(
+                "this frame time={} must be later than "
+                "previous frame time={}".format(t_frame, self.t_previous))
+
+        # compute time difference between this and the previous frame
+        delta_time = t_frame - self.t_previous
+        self.active_pixels_sum_dt2 += delta_time ** 2
+
+        height, width = self.new_frame.shape
+        new_frame = self.new_frame.flatten()
+
+        # find the active pixels
+        active = self.active_pixels_unsettled | \
+            (new_frame != self.active_pixels_input)
+        self.active_pixels_input.copy_(new_frame)
+        if self.leak_rate_hz > 0:
+            active |= self.active_pixels_wake_time <= t_frame
+
+        shot_on_pixels, shot_off_pixels = None, None
+        if self.shot_noise_rate_hz > 0:
+            # shot noise events of this frame,
+            # the iteration of each is drawn later
+            shot_on_cord, shot_off_cord = self._generate_shot_noise(
+                delta_time, 1, rescale_intensity_frame(self.new_frame))
+            shot_on_pixels, shot_off_pixels = [
+                (cord[0].to_dense() if cord.is_sparse else cord[0]).view(-1)
+                for cord in (shot_on_cord, shot_off_cord)]
+            active |= shot_on_pixels | shot_off_pixels
+
+        pixels = active.nonzero(as_tuple=True)[0]
+        num_pixels = pixels.shape[0]
+        self.num_pixel_updates += num_pixels
+        self.num_pixel_frames += new_frame.shape[0]
+        if num_pixels == 0:
+            self.num_static_frames += 1
+            self.t_previous = t_frame
+            return None
+
+        # lin-log mapping and lowpass filter of active pixels
+        new_frame = new_frame[pixels]
+        log_new_frame = lin_log(new_frame)
+        inten01 = rescale_intensity_frame(new_frame) \
+            if self.cutoff_hz > 0 else None
+        lp_log_frame0, lp_log_frame1 = low_pass_filter(
+            log_new_frame=log_new_frame,
+            lp_log_frame0=self.lp_log_frame0.view(-1)[pixels],
+            lp_log_frame1=self.lp_log_frame1.view(-1)[pixels],
+            inten01=inten01,
+            delta_time=delta_time,
+            cutoff_hz=self.cutoff_hz)
+        self.lp_log_frame0.view(-1)[pixels] = lp_log_frame0
+        self.lp_log_frame1.view(-1)[pixels] = lp_log_frame1
+        tolerance = EventEmulator.ACTIVE_PIXEL_SETTLED_TOLERANCE
+        self.active_pixels_unsettled[pixels] = \
+            ((lp_log_frame0 - log_new_frame).abs() > tolerance) | \
+            ((lp_log_frame1 - lp_log_frame0).abs() > tolerance)
+
+        pos_thres = self._pixel_values(self.pos_thres, pixels)
+        neg_thres = self._pixel_values(self.neg_thres, pixels)
+
+        # leak since the last update of each pixel
+        base_log_frame = self.base_log_frame.view(-1)[pixels]
+        if self.leak_rate_hz > 0:
+            base_log_frame = self._subtract_pending_leak(
+                base_log_frame, pixels, pos_thres, t_frame,
+                self.active_pixels_last_update, self.active_pixels_sum_dt2,
+                self.active_pixels_last_sum_dt2)
+        self.active_pixels_last_update[pixels] = t_frame
+        self.active_pixels_last_sum_dt2[pixels] = self.active_pixels_sum_dt2
+
+        diff_frame = lp_log_frame1 - base_log_frame
+        self.diff_frame.view(-1)[pixels] = diff_frame
+
+        # generate event map, as [1, num_pixels] frame of the active pixels
+        pos_evts_frame, neg_evts_frame = compute_event_map(
+            diff_frame, pos_thres, neg_thres)
+        num_iters = max(pos_evts_frame.max(), neg_evts_frame.max())
+        if num_iters == 0 and shot_on_pixels is None:
+            # no active pixel makes events, only keep their leak
+            self.num_static_frames += 1
+            self.base_log_frame.view(-1)[pixels] = base_log_frame
+            if self.leak_rate_hz > 0:
+                self._update_wake_time(pixels, diff_frame, t_frame)
+            self.t_previous = t_frame
+            return None
+        if num_iters == 0:
+            num_iters = 1
+        ts_step = delta_time / num_iters
+        ts = torch.linspace(
+            start=self.t_previous + ts_step,
+            end=t_frame,
+            steps=num_iters, dtype=torch.float32, device=self.device)
+
+        shot_on_cord, shot_off_cord = None, None
+        if shot_on_pixels is not None:
+            # put the shot noise events into random iterations
+            shot_on_cord = torch.zeros(
+                (num_iters, 1, num_pixels), dtype=torch.bool,
+                device=self.device)
+            shot_off_cord = torch.zeros_like(shot_on_cord)
+            for shot_pixels, shot_cord in ((shot_on_pixels, shot_on_cord),
+                                           (shot_off_pixels, shot_off_cord)):
+                shot_idx = shot_pixels[pixels].nonzero(as_tuple=True)[0]
+                if self.counter_rng is not None:
+                    # ON and OFF use iterations 0 and 1 of the stream
+                    u = self.counter_rng.uniform(
+                        pixels[shot_idx], self.frame_counter,
+                        crng.SHOT_ITER_STREAM,
+                        int(shot_cord is shot_off_cord))
+                    shot_iters = (u * int(num_iters)).long().clamp(
+                        max=int(num_iters) - 1)
+                else:
+                    shot_iters = torch.randint(
+                        int(num_iters), shot_idx.shape, device=self.device)
+                shot_cord[shot_iters, 0, shot_idx] = True
+
+        timestamp_mem = None
+        if self.timestamp_mem is not None:
+            timestamp_mem = self.timestamp_mem.view(1, -1)[:, pixels]
+        if self.vectorized_event_generation:
+            events, final_pos_evts_frame, final_neg_evts_frame = \
+                self._generate_event_fn()(
+                    pos_evts_frame=pos_evts_frame.view(1, -1),
+                    neg_evts_frame=neg_evts_frame.view(1, -1),
+                    ts=ts,
+                    shot_on_cord=shot_on_cord,
+                    shot_off_cord=shot_off_cord,
+                    timestamp_mem=timestamp_mem
+                    if self.refractory_period_s > ts_step else None,
+                    refractory_period_s=self.refractory_period_s,
+                    shuffle_keys=self._shuffle_keys_fn(pixels))
+            if self.compact_events:
+                events = self._append_event_records(
+                    events, t_frame, ts.shape[0], width, pixels)
+        else:
+            events, final_pos_evts_frame, final_neg_evts_frame, \
+                timestamp_mem = self._generate_events_loop(
+                    pos_evts_frame=pos_evts_frame.view(1, -1),
+                    neg_evts_frame=neg_evts_frame.view(1, -1),
+                    ts=ts,
+                    ts_step=ts_step,
+                    shot_on_cord=shot_on_cord,
+                    shot_off_cord=shot_off_cord,
+                    timestamp_mem=timestamp_mem,
+                    shuffle_keys=self._shuffle_keys_fn(pixels))
+        if timestamp_mem is not None:
+            self.timestamp_mem.view(-1)[pixels] = timestamp_mem.view(-1)
+        final_pos_evts_frame = final_pos_evts_frame.view(-1)
+        final_neg_evts_frame = final_neg_evts_frame.view(-1)
+
+        self._count_events(final_pos_evts_frame, final_neg_evts_frame)
+
+        # update base log frame according to the final
+        # number of output events
+        base_log_frame += final_pos_evts_frame * pos_thres
+        base_log_frame -= final_neg_evts_frame * neg_thres
+        self.base_log_frame.view(-1)[pixels] = base_log_frame
+
+        # pixels whose remaining change still crosses a threshold, e.g.
+        # after a shot noise event, make events in the next frame
+        diff_frame = lp_log_frame1 - base_log_frame
+        self.active_pixels_unsettled[pixels] |= \
+            (diff_frame >= pos_thres) | (diff_frame <= -neg_thres)
+
+        if self.leak_rate_hz > 0:
+            self._update_wake_time(pixels, diff_frame, t_frame)
+
+        if events is not None and not self.compact_events:
+            # map the active pixel numbers to x and y addresses
+            event_pixels = pixels[events[:, 1].long()]
+            events[:, 1] = event_pixels % width
+            events[:, 2] = event_pixels // width
+
+        # assign new time
+        self.t_previous = t_frame
+        return events
+
+    def _write_events(self, events):
+        """Writes events to the HDF5, AEDAT-2.0 and text outputs.
+
+        Parameters
+        ----------
+        events: np.ndarray
+            [N, 4] events or EVENT_DTYPE records, see generate_events(),
+            or [N, 4] torch.Tensor of device_events.
+        """
+        if torch.is_tensor(events):
+            if self.dvs_h5 is None and self.dvs_aedat2 is None \
+                    and self.dvs_text is None:
+                return
+            events = events.cpu().numpy()
+        if self.dvs_h5 is not None:
+            # convert data to uint32 (microsecs) format
+            if is_event_records(events):
+                temp_events = np.empty((events.shape[0], 4), dtype=np.uint32)
+                temp_events[:, 0] = events['t']
+                temp_events[:, 1] = events['x']
+                temp_events[:, 2] = events['y']
+                temp_events[:, 3] = events['p'] > 0
+            else:
+                temp_events = np.array(events, dtype=np.float32)
+                temp_events[:, 0] = temp_events[:, 0] * 1e6
+                temp_events[temp_events[:, 3] == -1, 3] = 0
+                temp_events = temp_events.astype(np.uint32)
+
+            # save events
+            with stage('h5_resize', events=temp_events.shape[0]):
+                self.dvs_h5_dataset.resize(
+                    self.dvs_h5_dataset.shape[0] + temp_events.shape[0],
+                    axis=0)
+
+                self.dvs_h5_dataset[-temp_events.shape[0]:] = temp_events
+
+        if self.dvs_aedat2 is not None:
+            with stage('aedat2_output', events=events.shape[0]):
+                self.dvs_aedat2.appendEvents(events)
+        if self.dvs_text is not None:
+            with stage('text_output', events=events.shape[0]):
+                self.dvs_text.appendEvents(events)
+
+    def _generate_events_loop(
+            self, pos_evts_frame, neg_evts_frame, ts, ts_step,
+            shot_on_cord, shot_off_cord, timestamp_mem, shuffle_keys=None):
+        """Generate events by iterating over the sub-frame iterations.
+
+        Parameters
+        ----------
+        pos_evts_frame, neg_evts_frame: torch.Tensor
+            [height, width] number of ON and OFF events of each pixel.
+        ts: torch.Tensor
+            timestamps of the iterations.
+        ts_step: float
+            time between iterations.
+        shot_on_cord, shot_off_cord: torch.Tensor
+            None or [num_iters, height, width] shot noise events,
+            dense or sparse COO.
+        timestamp_mem: torch.Tensor
+            [height, width] time of last event of each pixel,
+            or None if there is no refractory period.
+        shuffle_keys: function
+            None or function of event columns that returns random keys
+            to shuffle the events of each iteration with instead of
+            torch.randperm, see shuffle_event_columns().
+
+        Returns
+        -------
+        events: torch.Tensor or None
+            [N, 4] events, see generate_events().
+        final_pos_evts_frame, final_neg_evts_frame: torch.Tensor
+            [height, width] number of emitted ON and OFF events of each pixel.
+        timestamp_mem: torch.Tensor
+            updated time of last event of each pixel.
+        """
+        # record final events update
+        final_pos_evts_frame = torch.zeros(
+            pos_evts_frame.shape, dtype=torch.int32, device=self.device)
+        final_neg_evts_frame = torch.zeros(
+            neg_evts_frame.shape, dtype=torch.int32, device=self.device)
+
+        # all events
+        events = []
+
+        for i in range(ts.shape[0]):
             # events for this iteration
             events_curr_iter = None
 
@@ -684,19 +2449,24 @@ class EventEmulator(object):
             neg_cord = (neg_evts_frame >= i + 1)
 
             # generate shot noise
-            if self.shot_noise_rate_hz > 0:
+            if shot_on_cord is not None:
+                shot_on_cord_i, shot_off_cord_i = \
+                    shot_on_cord[i], shot_off_cord[i]
+                if shot_on_cord_i.is_sparse:
+                    shot_on_cord_i = shot_on_cord_i.to_dense()
+                    shot_off_cord_i = shot_off_cord_i.to_dense()
                 # update event list
-                pos_cord = torch.logical_or(pos_cord, shot_on_cord[i])
-                neg_cord = torch.logical_or(neg_cord, shot_off_cord[i])
+                pos_cord = torch.logical_or(pos_cord, shot_on_cord_i)
+                neg_cord = torch.logical_or(neg_cord, shot_off_cord_i)
 
             # filter events with refractory_period
             # only filter when refractory_period_s is large enough
             # otherwise, pass everything
             if self.refractory_period_s > ts_step:
                 pos_time_since_last_spike = (
-                        pos_cord * ts[i] - self.timestamp_mem)
+                        pos_cord * ts[i] - timestamp_mem)
                 neg_time_since_last_spike = (
-                        neg_cord * ts[i] - self.timestamp_mem)
+                        neg_cord * ts[i] - timestamp_mem)
 
                 # filter the events
                 pos_cord = (
@@ -705,10 +2475,10 @@ class EventEmulator(object):
                         neg_time_since_last_spike > self.refractory_period_s)
 
                 # assign new history
-                self.timestamp_mem = torch.where(
-                    pos_cord, ts[i], self.timestamp_mem)
-                self.timestamp_mem = torch.where(
-                    neg_cord, ts[i], self.timestamp_mem)
+                timestamp_mem = torch.where(
+                    pos_cord, ts[i], timestamp_mem)
+                timestamp_mem = torch.where(
+                    neg_cord, ts[i], timestamp_mem)
 
             # update the base log frame, along with the shot noise
             final_pos_evts_frame += pos_cord
@@ -719,15 +2489,10 @@ class EventEmulator(object):
             pos_event_xy = pos_cord.nonzero(as_tuple=True)
             neg_event_xy = neg_cord.nonzero(as_tuple=True)
 
-            # update event stats
             num_pos_events = pos_event_xy[0].shape[0]
             num_neg_events = neg_event_xy[0].shape[0]
             num_events = num_pos_events + num_neg_events
 
-            self.num_events_on += num_pos_events
-            self.num_events_off += num_neg_events
-            self.num_events_total += num_events
-
             if num_events > 0:
                 events_curr_iter = torch.ones(
                     (num_events, 4), dtype=torch.float32,
@@ -746,91 +2511,40 @@ class EventEmulator(object):
                 events_curr_iter[num_pos_events:, 3] *= -1
 
             # shuffle and append to the events collectors
-            if events_curr_iter is not None:
-                idx = torch.randperm(events_curr_iter.shape[0])
-                events_curr_iter = events_curr_iter[idx].view(
-                    events_curr_iter.size())
-                events.append(events_curr_iter)
-
-        # update base log frame according to the final
-        # number of output events
-        self.base_log_frame += final_pos_evts_frame * self.pos_thres
-        self.base_log_frame -= final_neg_evts_frame * self.neg_thres
-
-        if len(events) > 0:
-            events = torch.vstack(events).cpu().data.numpy()
-            if self.dvs_h5 is not None:
-                # convert data to uint32 (microsecs) format
-                temp_events = np.array(events, dtype=np.float32)
-                temp_events[:, 0] = temp_events[:, 0] * 1e6
-                temp_events[temp_events[:, 3] == -1, 3] = 0
-                temp_events = temp_events.astype(np.uint32)
-
-                # save events
-                self.dvs_h5_dataset.resize(
-                    self.dvs_h5_dataset.shape[0] + temp_events.shape[0],
-                    axis=0)
-
-                self.dvs_h5_dataset[-temp_events.shape[0]:] = temp_events
-
-            if self.dvs_aedat2 is not None:
-                self.dvs_aedat2.appendEvents(events)
-            if self.dvs_text is not None:
-                self.dvs_text.appendEvents(events)
+            if events_curr_iter is not None and shuffle_keys is not None:
+                with stage('shuffle', events=events_curr_iter.shape[0]):
+                    event_pixels = torch.cat((
+                        pos_event_xy[0] * pos_cord.shape[1]
+                        + pos_event_xy[1],
+                        neg_event_xy[0] * neg_cord.shape[1]
+                        + neg_event_xy[1]))
+                    keys = shuffle_keys((
+                        torch.full_like(event_pixels, i), event_pixels,
+                        events_curr_iter[:, 3].long()))
+                    idx = torch.sort(keys, stable=True)[1]
+                    events.append(events_curr_iter[idx])
+            elif events_curr_iter is not None:
+                with stage('shuffle', events=events_curr_iter.shape[0]):
+                    idx = torch.randperm(events_curr_iter.shape[0])
+                    events_curr_iter = events_curr_iter[idx].view(
+                        events_curr_iter.size())
+                    events.append(events_curr_iter)
 
-        if self.frame_ev_idx_dataset is not None:
-            # save frame event idx
-            # determine after the events are added
-            self.frame_ev_idx_dataset[self.frame_counter - 1] = \
-                self.dvs_h5_dataset.shape[0]
-
-        # assign new time
-        self.t_previous = t_frame
         if len(events) > 0:
-            return events
+            events = torch.vstack(events)
         else:
-            return None
+            events = None
+        return events, final_pos_evts_frame, final_neg_evts_frame, \
+            timestamp_mem
 
     def _update_csdvs(self, delta_time):
         if self.cs_surround_frame is None:
             self.cs_surround_frame = self.lp_log_frame1.clone().detach()  # detach makes true clone decoupled from torch computation tree
+        elif self.cs_solver == 'direct':
+            self.cs_surround_frame = self._csdvs_direct_solution(
+                self.cs_surround_frame, self.lp_log_frame1, delta_time)
         else:
-            # we still need to simulate dynamics even if "instantaneous", unfortunately it will be really slow with Euler stepping and
-            # no gear-shifting
-            # TODO change to compute steady-state 'instantaneous' solution by better method than Euler stepping
-            abs_min_tau_p = 1e-9
-            tau_p = abs_min_tau_p if (
-                    self.cs_tau_p_ms is None or self.cs_tau_p_ms == 0) else self.cs_tau_p_ms * 1e-3
-            tau_h = abs_min_tau_p / (self.cs_lambda_pixels ** 2) if (
-                    self.cs_tau_h_ms is None or self.cs_tau_h_ms == 0) else self.cs_tau_h_ms * 1e-3
-            min_tau = min(tau_p, tau_h)
-            # if min_tau < abs_min_tau_p:
-            #     min_tau = abs_min_tau_p
-            NUM_STEPS_PER_TAU = 5
-            num_steps = int(np.ceil((delta_time / min_tau) * NUM_STEPS_PER_TAU))
-            actual_delta_time = delta_time / num_steps
-            if num_steps > 1000 and not self.cs_steps_warning_printed:
-                if self.cs_tau_p_ms==0:
-                    logger.warning(f'You set time constant cs_tau_p_ms to zero which set the minimum tau of {abs_min_tau_p}s')
-                logger.warning(
-                    f'CSDVS timestepping of diffuser could take up to {num_steps} '
-                    f'steps per frame for Euler delta time {actual_delta_time:.3g}s; '
-                    f'simulation of each frame will terminate when max change is smaller than {EventEmulator.MAX_CHANGE_TO_TERMINATE_EULER_SURROUND_STEPPING}')
-                self.cs_steps_warning_printed = True
-
-            alpha_p = actual_delta_time / tau_p
-            alpha_h = actual_delta_time / tau_h
-            if alpha_p >= 1 or alpha_h >= 1:
-                logger.error(
-                    f'CSDVS update alpha (of IIR update) is too large; simulation would explode: '
-                    f'alpha_p={alpha_p:.3f} alpha_h={alpha_h:.3f}')
-                self.cs_alpha_warning_printed = True
-                v2e_quit(1)
-            if alpha_p > .25 or alpha_h > .25:
-                logger.warning(
-                    f'CSDVS update alpha (of IIR update) is too large; simulation will be inaccurate: '
-                    f'alpha_p={alpha_p:.3f} alpha_h={alpha_h:.3f}')
-                self.cs_alpha_warning_printed = True
+            num_steps, alpha_p, alpha_h = self._csdvs_step_parameters(delta_time)
             p_ten = torch.unsqueeze(torch.unsqueeze(self.lp_log_frame1, 0), 0)
             h_ten = torch.unsqueeze(torch.unsqueeze(self.cs_surround_frame, 0), 0)
             padding = torch.nn.ReplicationPad2d(1)
@@ -854,6 +2568,58 @@ class EventEmulator(object):
             self.cs_steps_taken.append(steps)
             self.cs_surround_frame = torch.squeeze(h_ten)
 
+    def _csdvs_direct_solution(self, surround_frame, photoreceptor_frame,
+                               delta_time):
+        """Returns the surround of the new frame of the 'direct'
+        cs_solver, see steady_state_surround() and integrate_surround()."""
+        if self.cs_tau_p_ms is None or self.cs_tau_p_ms == 0:
+            return steady_state_surround(
+                photoreceptor_frame, self.cs_lambda_pixels)
+        return integrate_surround(
+            surround_frame, photoreceptor_frame, self.cs_lambda_pixels,
+            self.cs_tau_p_ms * 1e-3, delta_time)
+
+    def _csdvs_step_parameters(self, delta_time):
+        """Returns the number of Euler steps of the surround diffuser for
+        a frame and the update factors alpha_p and alpha_h of a step."""
+        # we still need to simulate dynamics even if "instantaneous", unfortunately it will be really slow with Euler stepping and
+        # no gear-shifting
+        # the 'direct' cs_solver does not step the diffuser, see _csdvs_direct_solution()
+        abs_min_tau_p = 1e-9
+        tau_p = abs_min_tau_p if (
+                self.cs_tau_p_ms is None or self.cs_tau_p_ms == 0) else self.cs_tau_p_ms * 1e-3
+        tau_h = abs_min_tau_p / (self.cs_lambda_pixels ** 2) if (
+                self.cs_tau_h_ms is None or self.cs_tau_h_ms == 0) else self.cs_tau_h_ms * 1e-3
+        min_tau = min(tau_p, tau_h)
+        # if min_tau < abs_min_tau_p:
+        #     min_tau = abs_min_tau_p
+        NUM_STEPS_PER_TAU = 5
+        num_steps = int(np.ceil((delta_time / min_tau) * NUM_STEPS_PER_TAU))
+        actual_delta_time = delta_time / num_steps
+        if num_steps > 1000 and not self.cs_steps_warning_printed:
+            if self.cs_tau_p_ms==0:
+                logger.warning(f'You set time constant cs_tau_p_ms to zero which set the minimum tau of {abs_min_tau_p}s')
+            logger.warning(
+                f'CSDVS timestepping of diffuser could take up to {num_steps} '
+                f'steps per frame for Euler delta time {actual_delta_time:.3g}s; '
+                f'simulation of each frame will terminate when max change is smaller than {EventEmulator.MAX_CHANGE_TO_TERMINATE_EULER_SURROUND_STEPPING}')
+            self.cs_steps_warning_printed = True
+
+        alpha_p = actual_delta_time / tau_p
+        alpha_h = actual_delta_time / tau_h
+        if alpha_p >= 1 or alpha_h >= 1:
+            logger.error(
+                f'CSDVS update alpha (of IIR update) is too large; simulation would explode: '
+                f'alpha_p={alpha_p:.3f} alpha_h={alpha_h:.3f}')
+            self.cs_alpha_warning_printed = True
+            v2e_quit(1)
+        if alpha_p > .25 or alpha_h > .25:
+            logger.warning(
+                f'CSDVS update alpha (of IIR update) is too large; simulation will be inaccurate: '
+                f'alpha_p={alpha_p:.3f} alpha_h={alpha_h:.3f}')
+            self.cs_alpha_warning_printed = True
+        return num_steps, alpha_p, alpha_h
+
 
 if __name__ == "__main__":
     # define a emulator
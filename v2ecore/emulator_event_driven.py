@@ -0,0 +1,269 @@
+"""
+Event-driven DVS emulation of continuous-time inputs.
+
+The frame-based EventEmulator samples the input at the frame rate and
+interpolates the events of each frame. For inputs whose intensity is known
+at any time, e.g. the synthetic inputs in scripts/ that implement
+base_synthetic_input.intensity(t, ys, xs), EventDrivenEmulator instead
+finds the time of each threshold crossing of each pixel directly.
+
+Each pixel has a next check time. Pixels whose log intensity is far from
+their thresholds are checked after a long step, pixels that approach a
+threshold after a short one, so that the work follows the activity of the
+input rather than a frame rate. A crossing between two checks is located by
+bisection to within time_tolerance. The pixels are independent, so all
+pixels due for a check are advanced together, and the events of each time
+chunk are sorted by time at its end.
+
+The pixel is ideal apart from the threshold mismatch, the leak and the
+refractory period: there is no photoreceptor lowpass filter and no shot
+noise.
+"""
+import logging
+import math
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def lin_log_np(x, threshold=20):
+    """Float64 numpy version of emulator_utils.lin_log() without rounding.
+
+    :param x: np.ndarray of linear intensities 0-255
+    :param threshold: threshold 0-255 for transition from linear to log mapping
+    :returns: np.ndarray of log intensities
+    """
+    x = np.asarray(x, dtype=np.float64)
+    f = (1./threshold) * math.log(threshold)
+    return np.where(x <= threshold, x*f,
+                    np.log(np.maximum(x, threshold)))
+
+
+class EventDrivenEmulator(object):
+    """Computes the events of a continuous-time input with exact
+    threshold crossing times, see the module documentation.
+    """
+
+    def __init__(
+            self,
+            pos_thres=0.2,
+            neg_thres=0.2,
+            sigma_thres=0.03,
+            leak_rate_hz=0.1,
+            noise_rate_cov_decades=0.1,
+            refractory_period_s=0.0,
+            time_step=1e-3,
+            max_log_rate: Optional[float] = None,
+            time_tolerance=1e-9,
+            chunk_s=10e-3,
+            seed: int = 0):
+        """
+        Parameters
+        ----------
+        pos_thres, neg_thres, sigma_thres, leak_rate_hz,
+        noise_rate_cov_decades, refractory_period_s: float
+            pixel parameters, see EventEmulator. The leak rate of each
+            pixel is constant, the leak jitter is not modeled.
+        time_step: float
+            maximum time in seconds between two checks of a pixel.
+            Pulses of the input shorter than time_step can be missed.
+        max_log_rate: float
+            None or the maximum rate of change of the log intensity of the
+            input in log_e units per second. If given, a pixel whose log
+            intensity is a margin away from its thresholds is next checked
+            after margin/max_log_rate seconds, if this is less than
+            time_step, so that crossings that are closer than time_step
+            are not missed.
+        time_tolerance: float
+            the timestamps are located to within this time in seconds.
+        chunk_s: float
+            duration in seconds of the time-ordered event chunks
+            returned by emulate().
+        seed: int, default=0
+            seed for random threshold variations and leak rates,
+            fix it to nonzero value to get same mismatch every time
+        """
+        if time_step <= 0 or time_tolerance <= 0 or chunk_s <= 0:
+            raise ValueError(
+                'time_step={}, time_tolerance={} and chunk_s={} must be '
+                'positive'.format(time_step, time_tolerance, chunk_s))
+        if max_log_rate is not None and max_log_rate <= 0:
+            raise ValueError(
+                'max_log_rate={} must be None or positive'.format(
+                    max_log_rate))
+        self.pos_thres_nominal = pos_thres
+        self.neg_thres_nominal = neg_thres
+        self.sigma_thres = sigma_thres
+        self.leak_rate_hz = leak_rate_hz
+        self.noise_rate_cov_decades = noise_rate_cov_decades
+        self.refractory_period_s = refractory_period_s
+        self.time_step = time_step
+        self.max_log_rate = max_log_rate
+        self.time_tolerance = time_tolerance
+        self.chunk_s = chunk_s
+        self.rng = np.random.default_rng(seed if seed != 0 else None)
+
+        self.num_events_on = 0
+        self.num_events_off = 0
+        self.num_events_total = 0
+        self.num_checks = 0  # number of intensity evaluations of pixels
+
+    def _init(self, height, width):
+        """Draws the thresholds and leak rates of the pixels."""
+        shape = (height*width,)
+        if self.sigma_thres > 0:
+            self.pos_thres = np.maximum(self.rng.normal(
+                self.pos_thres_nominal, self.sigma_thres, shape), 0.01)
+            self.neg_thres = np.maximum(self.rng.normal(
+                self.neg_thres_nominal, self.sigma_thres, shape), 0.01)
+        else:
+            self.pos_thres = np.full(shape, float(self.pos_thres_nominal))
+            self.neg_thres = np.full(shape, float(self.neg_thres_nominal))
+        # rate of decrease of the base log intensity, in log_e units/s
+        if self.leak_rate_hz > 0:
+            noise_rate_array = np.exp(
+                math.log(10)*self.noise_rate_cov_decades *
+                self.rng.standard_normal(shape))
+            self.leak_slope = \
+                self.leak_rate_hz*noise_rate_array*self.pos_thres
+        else:
+            self.leak_slope = np.zeros(shape)
+
+    def emulate(
+            self, intensity: Callable, height: int, width: int,
+            t_start: float, t_stop: float) -> Iterator[np.ndarray]:
+        """Emulates the input from t_start to t_stop.
+
+        Parameters
+        ----------
+        intensity: callable
+            intensity(t, ys, xs) returns the np.ndarray of the intensities
+            0-255 of the pixels at rows ys and columns xs at times t in
+            float seconds, see base_synthetic_input.intensity().
+        height, width: int
+            size of the pixel array.
+        t_start, t_stop: float
+            start and stop time in float seconds. The base log intensity of
+            the pixels is their log intensity at t_start.
+
+        Returns
+        -------
+        iterator over the chunks of chunk_s seconds, each is the time-ordered
+        [N, 4] float64 np.ndarray of the events [t, x, y, p] with
+        timestamps in the chunk, p is 1 for ON and -1 for OFF events.
+        """
+        self._init(height, width)
+        pixels = np.arange(height*width)
+        ys, xs = pixels // width, pixels % width
+
+        def _input(t, pix):
+            self.num_checks += pix.shape[0]
+            return lin_log_np(intensity(t, ys[pix], xs[pix]))
+
+        # per pixel states: the base log intensity at time base_t, the
+        # time t_cur from which the pixel is checked next and whether its
+        # input at t_cur is known to be between its thresholds,
+        # then margin is its distance to the nearest threshold
+        base = _input(np.full(pixels.shape, float(t_start)), pixels)
+        base_t = np.full(pixels.shape, float(t_start))
+        t_cur = np.full(pixels.shape, float(t_start))
+        checked = np.zeros(pixels.shape, dtype=bool)
+        margin = np.zeros(pixels.shape)
+
+        num_chunks = max(1, math.ceil((t_stop-t_start)/self.chunk_s - 1e-9))
+        for chunk in range(num_chunks):
+            t_end = t_stop if chunk == num_chunks-1 \
+                else t_start+(chunk+1)*self.chunk_s
+            chunk_events = []
+            while True:
+                pix = np.nonzero(t_cur < t_end)[0]
+                if pix.shape[0] == 0:
+                    break
+                # pixels with unchecked t_cur are checked there,
+                # the others after a step that depends on their margin
+                step = np.full(pix.shape, self.time_step)
+                if self.max_log_rate is not None:
+                    step = np.clip(
+                        margin[pix] /
+                        (self.max_log_rate+self.leak_slope[pix]),
+                        self.time_tolerance, self.time_step)
+                t_check = np.where(
+                    checked[pix], np.minimum(t_cur[pix]+step, t_end),
+                    t_cur[pix])
+                diff = _input(t_check, pix) - \
+                    (base[pix]-self.leak_slope[pix]*(t_check-base_t[pix]))
+                crossed = (diff >= self.pos_thres[pix]) | \
+                    (diff <= -self.neg_thres[pix])
+
+                # advance the pixels that did not cross
+                idle = pix[~crossed]
+                t_cur[idle] = t_check[~crossed]
+                checked[idle] = True
+                margin[idle] = np.minimum(
+                    self.pos_thres[idle]-diff[~crossed],
+                    self.neg_thres[idle]+diff[~crossed])
+
+                # locate the crossings between t_cur and t_check
+                hit = pix[crossed]
+                t_event, diff_event = t_check[crossed], diff[crossed]
+                search = checked[hit]
+                if np.any(search):
+                    t_event[search], diff_event[search] = self._bisect(
+                        _input, hit[search], t_cur[hit[search]],
+                        t_event[search], base, base_t)
+                on = diff_event >= self.pos_thres[hit]
+                polarity = np.where(on, 1., -1.)
+
+                # the event moves the base by one threshold
+                base[hit] = base[hit] - \
+                    self.leak_slope[hit]*(t_event-base_t[hit]) + \
+                    np.where(on, self.pos_thres[hit], -self.neg_thres[hit])
+                base_t[hit] = t_event
+                t_cur[hit] = t_event+self.refractory_period_s
+                checked[hit] = False
+
+                chunk_events.append(
+                    np.stack((t_event, xs[hit], ys[hit], polarity), axis=1))
+
+            events = np.concatenate(chunk_events) if len(chunk_events) > 0 \
+                else np.zeros((0, 4))
+            events = events[np.argsort(events[:, 0], kind='stable')]
+            num_on = int(np.count_nonzero(events[:, 3] > 0))
+            self.num_events_on += num_on
+            self.num_events_off += events.shape[0]-num_on
+            self.num_events_total += events.shape[0]
+            yield events
+
+    def _bisect(self, _input, pix, t_low, t_high, base, base_t):
+        """Locates the threshold crossings of pixels pix between t_low,
+        where their input is between the thresholds, and t_high,
+        where it is not.
+
+        Returns
+        -------
+        the times of the crossings to within time_tolerance, and the
+        difference of the input to the base at these times.
+        """
+        t_low, t_high = t_low.copy(), t_high.copy()
+        diff_high = np.full(pix.shape, np.nan)
+        num_iters = math.ceil(math.log2(max(
+            np.max(t_high-t_low)/self.time_tolerance, 1.)))
+        for _ in range(num_iters):
+            t_mid = 0.5*(t_low+t_high)
+            diff = _input(t_mid, pix) - \
+                (base[pix]-self.leak_slope[pix]*(t_mid-base_t[pix]))
+            crossed = (diff >= self.pos_thres[pix]) | \
+                (diff <= -self.neg_thres[pix])
+            t_high = np.where(crossed, t_mid, t_high)
+            t_low = np.where(crossed, t_low, t_mid)
+            diff_high = np.where(crossed, diff, diff_high)
+        # pixels whose crossing was never bracketed crossed at t_high
+        unknown = np.isnan(diff_high)
+        if np.any(unknown):
+            t = t_high[unknown]
+            diff_high[unknown] = _input(t, pix[unknown]) - \
+                (base[pix[unknown]] -
+                 self.leak_slope[pix[unknown]]*(t-base_t[pix[unknown]]))
+        return t_high, diff_high
@@ -27,6 +27,8 @@ from screeninfo import get_monitors
 
 from v2ecore.emulator_utils import compute_event_map
 from v2ecore.emulator_utils import generate_shot_noise
+from v2ecore.emulator_utils import generate_shot_noise_sparse
+from v2ecore.emulator_utils import generate_uniform_events
 from v2ecore.emulator_utils import lin_log
 from v2ecore.emulator_utils import low_pass_filter
 from v2ecore.emulator_utils import rescale_intensity_frame
@@ -82,7 +84,8 @@ class EventEmulator(object):
             output_height: int = None,
             device: str = "cuda",
             cs_lambda_pixels: float = None,
-            cs_tau_p_ms: float = None
+            cs_tau_p_ms: float = None,
+            closed_form_scheduling: bool = True
     ):
         """
         Parameters
@@ -120,6 +123,11 @@ class EventEmulator(object):
             space constant of surround in pixels, or None to disable surround inhibition
         cs_tau_p_ms: float
             time constant of lowpass filter of surround in ms or 0 to make surround 'instantaneous'
+        closed_form_scheduling: bool
+            compute the uniformly spaced timestamps of the events of each
+            pixel directly, see generate_uniform_events(), in time linear
+            in the number of events, instead of iterating over the square
+            of the largest event count of any pixel.
         """
 
         logger.info(
@@ -148,6 +156,7 @@ class EventEmulator(object):
         self.leak_rate_hz = leak_rate_hz
         self.refractory_period_s = refractory_period_s
         self.shot_noise_rate_hz = shot_noise_rate_hz
+        self.closed_form_scheduling = closed_form_scheduling
 
         self.leak_jitter_fraction = leak_jitter_fraction
         self.noise_rate_cov_decades = noise_rate_cov_decades
@@ -449,6 +458,7 @@ class EventEmulator(object):
         self.c_minus_s_frame: Optional[np.ndarray] = None
         self.base_log_frame: Optional[np.ndarray] = None
         self.diff_frame: Optional[np.ndarray] = None
+        self.timestamp_mem: Optional[torch.Tensor] = None  # time of last event
 
         self.frame_counter = 0
 
@@ -616,6 +626,107 @@ class EventEmulator(object):
         # generate event map
         pos_evts_frame, neg_evts_frame = compute_event_map(
             self.diff_frame, self.pos_thres, self.neg_thres)
+
+        if self.closed_form_scheduling:
+            events, final_pos_evts_frame, final_neg_evts_frame = \
+                self._generate_uniform_events(
+                    pos_evts_frame, neg_evts_frame, inten01, delta_time)
+        else:
+            events, final_pos_evts_frame, final_neg_evts_frame = \
+                self._generate_iterative_events(
+                    pos_evts_frame, neg_evts_frame, inten01, delta_time,
+                    t_frame)
+
+        num_events = self.num_events_on + self.num_events_off
+        self.num_events_total += num_events
+
+        # update base log frame according to the final
+        # number of output events
+        self.base_log_frame += final_pos_evts_frame * self.pos_thres
+        self.base_log_frame -= final_neg_evts_frame * self.neg_thres
+
+        if events is not None:
+            events = events.cpu().data.numpy()
+            if self.dvs_h5 is not None:
+                # convert data to uint32 (microsecs) format
+                temp_events = np.array(events, dtype=np.float32)
+                temp_events[:, 0] = temp_events[:, 0] * 1e6
+                temp_events[temp_events[:, 3] == -1, 3] = 0
+                temp_events = temp_events.astype(np.uint32)
+
+                # save events
+                self.dvs_h5_dataset.resize(
+                    self.dvs_h5_dataset.shape[0] + temp_events.shape[0],
+                    axis=0)
+
+                self.dvs_h5_dataset[-temp_events.shape[0]:] = temp_events
+
+            if self.dvs_aedat2 is not None:
+                self.dvs_aedat2.appendEvents(events)
+            if self.dvs_text is not None:
+                self.dvs_text.appendEvents(events)
+
+        if self.frame_ev_idx_dataset is not None:
+            # save frame event idx
+            # determine after the events are added
+            self.frame_ev_idx_dataset[self.frame_counter - 1] = \
+                self.dvs_h5_dataset.shape[0]
+
+        # assign new time
+        self.t_previous = t_frame
+        return events
+
+    def _generate_uniform_events(
+            self, pos_evts_frame, neg_evts_frame, inten01, delta_time):
+        """Generates the events of the frame with the closed-form
+        uniform scheduler, see generate_uniform_events().
+
+        Returns
+        -------
+        events, final_pos_evts_frame, final_neg_evts_frame:
+            the time-ordered [N, 4] events or None, and the number of
+            emitted ON and OFF events of each pixel.
+        """
+        shot_on_cord, shot_off_cord = None, None
+        if self.shot_noise_rate_hz > 0:
+            # shot noise on a grid as fine as the densest pixel, so that
+            # noise events are also made in frames without changes
+            num_shot_iters = max(
+                int(pos_evts_frame.max()), int(neg_evts_frame.max()), 1)
+            shot_on_cord, shot_off_cord = generate_shot_noise_sparse(
+                shot_noise_rate_hz=self.shot_noise_rate_hz,
+                delta_time=delta_time,
+                num_iters=num_shot_iters,
+                shot_noise_inten_factor=self.SHOT_NOISE_INTEN_FACTOR,
+                inten01=inten01,
+                pos_thres_pre_prob=self.pos_thres_pre_prob,
+                neg_thres_pre_prob=self.neg_thres_pre_prob)
+
+        events, final_pos_evts_frame, final_neg_evts_frame = \
+            generate_uniform_events(
+                pos_evts_frame, neg_evts_frame, self.t_previous, delta_time,
+                shot_on_cord=shot_on_cord,
+                shot_off_cord=shot_off_cord,
+                timestamp_mem=self.timestamp_mem,
+                refractory_period_s=self.refractory_period_s)
+
+        num_pos_events = int(final_pos_evts_frame.sum())
+        self.num_events_on += num_pos_events
+        self.num_events_off += \
+            (0 if events is None else events.shape[0])-num_pos_events
+
+        return events, final_pos_evts_frame, final_neg_evts_frame
+
+    def _generate_iterative_events(
+            self, pos_evts_frame, neg_evts_frame, inten01, delta_time,
+            t_frame):
+        """Generates the events of the frame by iterating over
+        max_count**2 sub-frame iterations of each polarity.
+
+        Returns
+        -------
+        see _generate_uniform_events().
+        """
         pos_num_iters = pos_evts_frame.max().square()
         neg_num_iters = neg_evts_frame.max().square()
 
@@ -791,48 +902,10 @@ class EventEmulator(object):
             events = torch.vstack(events)
             events = events[events[:, 0].sort()[1]]
             # print(events.shape)
-
-        num_events = self.num_events_on + self.num_events_off
-        self.num_events_total += num_events
-
-        # update base log frame according to the final
-        # number of output events
-        self.base_log_frame += final_pos_evts_frame * self.pos_thres
-        self.base_log_frame -= final_neg_evts_frame * self.neg_thres
-
-        if len(events) > 0:
-            events = events.cpu().data.numpy()
-            if self.dvs_h5 is not None:
-                # convert data to uint32 (microsecs) format
-                temp_events = np.array(events, dtype=np.float32)
-                temp_events[:, 0] = temp_events[:, 0] * 1e6
-                temp_events[temp_events[:, 3] == -1, 3] = 0
-                temp_events = temp_events.astype(np.uint32)
-
-                # save events
-                self.dvs_h5_dataset.resize(
-                    self.dvs_h5_dataset.shape[0] + temp_events.shape[0],
-                    axis=0)
-
-                self.dvs_h5_dataset[-temp_events.shape[0]:] = temp_events
-
-            if self.dvs_aedat2 is not None:
-                self.dvs_aedat2.appendEvents(events)
-            if self.dvs_text is not None:
-                self.dvs_text.appendEvents(events)
-
-        if self.frame_ev_idx_dataset is not None:
-            # save frame event idx
-            # determine after the events are added
-            self.frame_ev_idx_dataset[self.frame_counter - 1] = \
-                self.dvs_h5_dataset.shape[0]
-
-        # assign new time
-        self.t_previous = t_frame
-        if len(events) > 0:
-            return events
         else:
-            return None
+            events = None
+
+        return events, final_pos_evts_frame, final_neg_evts_frame
 
     def _update_csdvs(self, delta_time):
         if self.cs_surround_frame is None:
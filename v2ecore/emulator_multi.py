@@ -0,0 +1,357 @@
+"""
+Multi-configuration DVS emulation.
+
+Emulates K sets of DVS parameters over the same frames in one pass,
+e.g. to sweep the thresholds to match the event count of a real DVS.
+The lin-log conversion and intensity of each frame are computed once,
+the pixel states of all configurations are kept in [K, height, width]
+tensors and updated together, and the random mismatch and noise are drawn
+once for all configurations (common random numbers), so that the
+configurations differ only by their parameters.
+"""
+import logging
+import math
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+from v2ecore.emulator_utils import compute_event_map
+from v2ecore.emulator_utils import event_columns_to_list
+from v2ecore.emulator_utils import generate_event_columns
+from v2ecore.emulator_utils import lin_log
+from v2ecore.emulator_utils import rescale_intensity_frame
+from v2ecore.emulator_utils import shot_noise_probabilities
+
+logger = logging.getLogger(__name__)
+
+
+class MultiConfigEventEmulator(object):
+    """Computes the events of K DVS parameter configurations
+    from the same input frames.
+
+    Each parameter is a scalar, shared by all configurations, or a
+    sequence with one value per configuration. Configuration k produces
+    the same events as an EventEmulator with vectorized_event_generation
+    and its parameters, except that the random numbers of the frames are
+    shared with the other configurations. The events of each frame are
+    shuffled with the random numbers that follow those of the previous
+    configurations, so the order of the events that have the same
+    timestamp differs from that of the EventEmulator, and so do the leak
+    jitter and shot noise of the following frames. Without leak and shot
+    noise, the events of each configuration are those of its EventEmulator
+    in another order. With a single configuration, the events and their
+    order are identical to the EventEmulator for the same seed.
+    The lowpass filter of the configurations with cutoff_hz=0 is computed
+    in float64 if other configurations have a cutoff_hz>0, so their events
+    may differ by rounding.
+
+    Center surround, active pixel update, tiles and the event output
+    files of EventEmulator are not supported.
+    """
+
+    SHOT_NOISE_INTEN_FACTOR = 0.25
+
+    # parameters that have one value per configuration
+    CONFIG_PARAMETERS = (
+        'pos_thres', 'neg_thres', 'sigma_thres', 'cutoff_hz',
+        'leak_rate_hz', 'refractory_period_s', 'shot_noise_rate_hz',
+        'leak_jitter_fraction', 'noise_rate_cov_decades')
+
+    def __init__(
+            self,
+            pos_thres=0.2,
+            neg_thres=0.2,
+            sigma_thres=0.03,
+            cutoff_hz=0.0,
+            leak_rate_hz=0.1,
+            refractory_period_s=0.0,
+            shot_noise_rate_hz=0.0,
+            leak_jitter_fraction=0.1,
+            noise_rate_cov_decades=0.1,
+            seed: int = 0,
+            device: str = "cuda",
+            return_events: bool = True):
+        """
+        Parameters
+        ----------
+        pos_thres, neg_thres, sigma_thres, cutoff_hz, leak_rate_hz,
+        refractory_period_s, shot_noise_rate_hz, leak_jitter_fraction,
+        noise_rate_cov_decades: float or sequence of float
+            parameters of the configurations, see EventEmulator.
+            The sequences must have the same length K.
+        seed: int, default=0
+            seed for random threshold variations and noise,
+            fix it to nonzero value to get same mismatch every time
+        device: str
+            device, either 'cpu' or 'cuda'
+        return_events: bool
+            if False, generate_events() only counts the events of each
+            configuration in num_events_on and num_events_off, which
+            skips building and shuffling the event lists
+        """
+        values = {'pos_thres': pos_thres, 'neg_thres': neg_thres,
+                  'sigma_thres': sigma_thres, 'cutoff_hz': cutoff_hz,
+                  'leak_rate_hz': leak_rate_hz,
+                  'refractory_period_s': refractory_period_s,
+                  'shot_noise_rate_hz': shot_noise_rate_hz,
+                  'leak_jitter_fraction': leak_jitter_fraction,
+                  'noise_rate_cov_decades': noise_rate_cov_decades}
+        lengths = {len(v) for v in values.values() if np.ndim(v) > 0}
+        if len(lengths) > 1:
+            raise ValueError(
+                'the parameter sequences have different lengths {}'.format(
+                    sorted(lengths)))
+        self.num_configs = lengths.pop() if len(lengths) > 0 else 1
+        if self.num_configs == 0:
+            raise ValueError('got no configurations')
+        for name in self.CONFIG_PARAMETERS:
+            # [K] float64 array of the parameter of each configuration
+            setattr(self, name, np.broadcast_to(np.asarray(
+                values[name], dtype=np.float64), (self.num_configs,)).copy())
+
+        logger.info(
+            '{} configurations of ON/OFF log_e temporal contrast '
+            'thresholds: {} / {} +/- {}'.format(
+                self.num_configs, self.pos_thres, self.neg_thres,
+                self.sigma_thres))
+
+        self.device = device
+        self.return_events = return_events
+
+        if seed != 0:
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+
+        self.reset()
+
+    def reset(self):
+        """Resets so that next use will reinitialize the pixel states."""
+        self.t_previous = 0  # time of previous frame
+        self.frame_counter = 0
+
+        # [K] event stats of the configurations
+        self.num_events_on = np.zeros(self.num_configs, dtype=np.int64)
+        self.num_events_off = np.zeros(self.num_configs, dtype=np.int64)
+        self.num_events_total = np.zeros(self.num_configs, dtype=np.int64)
+
+        # [K, height, width] pixel states, set on first frame
+        self.lp_log_frame0: Optional[torch.Tensor] = None
+        self.lp_log_frame1: Optional[torch.Tensor] = None
+        self.base_log_frame: Optional[torch.Tensor] = None
+        self.diff_frame: Optional[torch.Tensor] = None
+        self.timestamp_mem: Optional[torch.Tensor] = None
+        # [K, height, width] or [K, 1, 1] thresholds
+        self.pos_thres_frame: Optional[torch.Tensor] = None
+        self.neg_thres_frame: Optional[torch.Tensor] = None
+        self.pos_thres_pre_prob: Optional[torch.Tensor] = None
+        self.neg_thres_pre_prob: Optional[torch.Tensor] = None
+        self.noise_rate_array: Optional[torch.Tensor] = None
+
+    def _config_tensor(self, values, dtype=torch.float32):
+        """Returns the [K, 1, 1] tensor of per-configuration values,
+        which broadcasts with the [K, height, width] pixel states."""
+        return torch.tensor(
+            values, dtype=dtype, device=self.device).view(-1, 1, 1)
+
+    def _init(self, first_frame_linear):
+        """Initializes the thresholds, leak rates and refractory memory
+        of the pixels, in the order of EventEmulator._init()."""
+        shape = first_frame_linear.shape
+        pos_nominal = self._config_tensor(self.pos_thres)
+        neg_nominal = self._config_tensor(self.neg_thres)
+
+        self.pos_thres_frame = pos_nominal
+        self.neg_thres_frame = neg_nominal
+        if np.any(self.sigma_thres > 0):
+            # the same standard normal mismatch is scaled by the sigma
+            # of each configuration; the same as torch.normal()
+            sigma = self._config_tensor(self.sigma_thres)
+            pos_mismatch = torch.randn(shape, dtype=torch.float32).to(
+                self.device)
+            neg_mismatch = torch.randn(shape, dtype=torch.float32).to(
+                self.device)
+            self.pos_thres_frame = torch.where(
+                sigma > 0,
+                torch.clamp(torch.addcmul(
+                    pos_nominal, pos_mismatch, sigma), min=0.01),
+                pos_nominal)
+            self.neg_thres_frame = torch.where(
+                sigma > 0,
+                torch.clamp(torch.addcmul(
+                    neg_nominal, neg_mismatch, sigma), min=0.01),
+                neg_nominal)
+
+        # compute variable for shot-noise
+        self.pos_thres_pre_prob = torch.div(pos_nominal, self.pos_thres_frame)
+        self.neg_thres_pre_prob = torch.div(neg_nominal, self.neg_thres_frame)
+
+        if np.any(self.leak_rate_hz > 0):
+            # log-normal distribution of leak rates,
+            # with the spread of each configuration
+            noise_rate = torch.randn(
+                shape, dtype=torch.float32, device=self.device)
+            self.noise_rate_array = torch.exp(self._config_tensor(
+                math.log(10) * self.noise_rate_cov_decades) * noise_rate)
+
+        if np.any(self.refractory_period_s > 0):
+            self.timestamp_mem = torch.zeros(
+                (self.num_configs,) + tuple(shape), dtype=torch.float32,
+                device=self.device) - self._config_tensor(
+                    self.refractory_period_s)
+
+    def _low_pass_filter(self, log_new_frame, inten01, delta_time):
+        """Updates the lowpass filters of all configurations,
+        see low_pass_filter()."""
+        filtered = self.cutoff_hz > 0
+        if not np.any(filtered):
+            self.lp_log_frame0 = self.lp_log_frame1 = \
+                log_new_frame.expand(self.num_configs, *log_new_frame.shape)
+            return
+
+        tau = 1 / (math.pi * 2 * np.where(filtered, self.cutoff_hz, 1))
+        eps = torch.clamp(inten01 * self._config_tensor(
+            delta_time / tau, dtype=torch.float64), max=1)
+        lp_log_frame0 = (1 - eps) * self.lp_log_frame0 + eps * log_new_frame
+        lp_log_frame1 = self.lp_log_frame0
+        if not np.all(filtered):
+            filtered = self._config_tensor(filtered, dtype=torch.bool)
+            lp_log_frame0 = torch.where(
+                filtered, lp_log_frame0, log_new_frame.double())
+            lp_log_frame1 = torch.where(
+                filtered, lp_log_frame1, log_new_frame.double())
+        self.lp_log_frame0, self.lp_log_frame1 = lp_log_frame0, lp_log_frame1
+
+    def generate_events(self, new_frame, t_frame) -> Optional[List]:
+        """Compute the events of all configurations in new frame.
+
+        Parameters
+        ----------
+        new_frame: np.ndarray
+            [height, width] frame, see EventEmulator.generate_events().
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: list of np.ndarray
+            for each configuration, None or [N, 4] events with rows
+            [timestamp, x, y, polarity], see EventEmulator.generate_events().
+            None on the first frame or if return_events is False.
+        """
+        if t_frame < self.t_previous:
+            raise ValueError(
+                "this frame time={} must be later than "
+                "previous frame time={}".format(t_frame, self.t_previous))
+        self.frame_counter += 1
+
+        # shared by the configurations
+        new_frame = torch.tensor(new_frame, dtype=torch.float64,
+                                 device=self.device)
+        log_new_frame = lin_log(new_frame)
+        inten01 = rescale_intensity_frame(new_frame)
+        delta_time = t_frame - self.t_previous
+
+        if self.base_log_frame is None:
+            self.lp_log_frame0 = self.lp_log_frame1 = log_new_frame.expand(
+                self.num_configs, *log_new_frame.shape)
+            self._init(log_new_frame)
+            self.base_log_frame = self.lp_log_frame1.clone()
+            # like EventEmulator, the first frame only sets up the
+            # pixel states
+            return None
+
+        self._low_pass_filter(log_new_frame, inten01, delta_time)
+
+        # leak, with the same jitter of the pixels for all configurations
+        if np.any(self.leak_rate_hz > 0):
+            rand = torch.randn(
+                self.noise_rate_array.shape[1:], dtype=torch.float32,
+                device=self.device)
+            curr_leak_rate = self._config_tensor(self.leak_rate_hz) * \
+                self.noise_rate_array * (
+                    1 - self._config_tensor(self.leak_jitter_fraction) * rand)
+            self.base_log_frame = self.base_log_frame - \
+                delta_time * curr_leak_rate * self.pos_thres_frame
+
+        self.diff_frame = self.lp_log_frame1 - self.base_log_frame
+
+        # [K, height, width] event maps
+        pos_evts_frame, neg_evts_frame = compute_event_map(
+            self.diff_frame, self.pos_thres_frame, self.neg_thres_frame)
+        # [K] max number of events in any pixel of each configuration
+        max_num_events_any_pixel = torch.maximum(
+            pos_evts_frame.amax(dim=(1, 2)), neg_evts_frame.amax(dim=(1, 2)))
+        # number of iterations, at least 1 to generate any noise
+        num_iters = max_num_events_any_pixel.clamp(min=1).tolist()
+        if max(num_iters) > 1000:
+            logger.warning(f'num_iter={max(num_iters)}>1000 events')
+
+        # shot noise random numbers, shared by the configurations
+        rand01 = None
+        if np.any(self.shot_noise_rate_hz > 0):
+            rand01 = torch.rand(
+                size=[max(n for n, rate in zip(
+                    num_iters, self.shot_noise_rate_hz) if rate > 0)]
+                + list(inten01.shape),
+                dtype=torch.float32, device=self.device)
+
+        events = []
+        final_pos_evts_frame = torch.empty_like(pos_evts_frame)
+        final_neg_evts_frame = torch.empty_like(neg_evts_frame)
+        width = pos_evts_frame.shape[2]
+        for k in range(self.num_configs):
+            # divided by the int32 tensor like EventEmulator does, to get
+            # identical float32 timestamps
+            ts_step = delta_time / (max_num_events_any_pixel[k]
+                                    if max_num_events_any_pixel[k] > 0 else 1)
+            ts = torch.linspace(
+                start=self.t_previous + ts_step, end=t_frame,
+                steps=num_iters[k], dtype=torch.float32, device=self.device)
+
+            shot_on_cord, shot_off_cord = None, None
+            if self.shot_noise_rate_hz[k] > 0:
+                one_minus_shot_on_prob, shot_off_prob = \
+                    shot_noise_probabilities(
+                        shot_noise_rate_hz=float(self.shot_noise_rate_hz[k]),
+                        delta_time=delta_time,
+                        num_iters=num_iters[k],
+                        shot_noise_inten_factor=self.SHOT_NOISE_INTEN_FACTOR,
+                        inten01=inten01,
+                        pos_thres_pre_prob=self.pos_thres_pre_prob[k],
+                        neg_thres_pre_prob=self.neg_thres_pre_prob[k])
+                shot_on_cord = torch.gt(
+                    rand01[:num_iters[k]], one_minus_shot_on_prob.unsqueeze(0))
+                shot_off_cord = torch.lt(
+                    rand01[:num_iters[k]], shot_off_prob.unsqueeze(0))
+
+            refractory_period_s = float(self.refractory_period_s[k])
+            columns, final_pos_evts_frame[k], final_neg_evts_frame[k] = \
+                generate_event_columns(
+                    pos_evts_frame=pos_evts_frame[k],
+                    neg_evts_frame=neg_evts_frame[k],
+                    ts=ts,
+                    shot_on_cord=shot_on_cord,
+                    shot_off_cord=shot_off_cord,
+                    timestamp_mem=self.timestamp_mem[k]
+                    if refractory_period_s > ts_step else None,
+                    refractory_period_s=refractory_period_s,
+                    shuffle=self.return_events)
+            if self.return_events:
+                events.append(None if columns is None else
+                              event_columns_to_list(
+                                  columns, ts, width).cpu().data.numpy())
+
+        num_pos_events = final_pos_evts_frame.sum(dim=(1, 2)).cpu().numpy()
+        num_neg_events = final_neg_evts_frame.sum(dim=(1, 2)).cpu().numpy()
+        self.num_events_on += num_pos_events
+        self.num_events_off += num_neg_events
+        self.num_events_total += num_pos_events + num_neg_events
+
+        # update base log frame according to the final
+        # number of output events
+        self.base_log_frame += final_pos_evts_frame * self.pos_thres_frame
+        self.base_log_frame -= final_neg_evts_frame * self.neg_thres_frame
+
+        self.t_previous = t_frame
+        return events if self.return_events else None
@@ -0,0 +1,283 @@
+"""
+Numba CPU backend of the DVS pixel model.
+
+EventEmulator(device='numba') runs the per-frame pixel model in the numba
+kernels of this module instead of in eager torch ops, which avoids the
+dispatch overhead of the many small torch ops per frame on CPU.
+The pixel states stay the torch CPU tensors of EventEmulator, the kernels
+update them in place through numpy views.
+
+A frame takes three parallel passes over the pixel rows:
+
+1. pixel_front_end(): lin-log conversion, lowpass filter, leak and
+   the ON and OFF event counts of each pixel.
+2. emit_events(count_only=True): number of events of each row at each
+   sub-frame iteration, including shot noise and the refractory filter.
+3. emit_events(count_only=False): the same events again, written to
+   their time-ordered place in the event array, which was allocated with
+   the total from pass 2; the base log frame is updated.
+
+The random numbers of each row and frame come from a generator seeded by
+(seed, frame, row, stream), so the events do not depend on the number of
+threads and pass 3 repeats the random decisions of pass 2. The leak jitter
+of a frame is drawn in one numpy call keyed by (seed, frame), which is
+much faster than per-pixel normal variates in the kernel.
+The random numbers differ from the torch backend, so the leak and shot
+noise events are only statistically equivalent; without noise the events
+of each pixel are the same.
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+# streams of random numbers of a row
+LEAK_STREAM = 0
+EVENT_STREAM = 1
+SHUFFLE_STREAM = 2
+
+
+@njit(cache=True)
+def _stream_seed(seed, frame, row, stream):
+    """Mixes the key of a random stream into a 32 bit seed (splitmix64)."""
+    z = np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+    z ^= np.uint64(frame) * np.uint64(0xBF58476D1CE4E5B9)
+    z ^= np.uint64(row) * np.uint64(0x94D049BB133111EB)
+    z ^= np.uint64(stream) * np.uint64(0xD6E8FEB86659FD93)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return np.uint32(z & np.uint64(0xFFFFFFFF))
+
+
+@njit(cache=True)
+def _floor_div(a, b):
+    """Returns a // b for a, b > 0 like torch.div(rounding_mode='floor'),
+    which differs from floor(a/b) when a/b rounds to an integer."""
+    ratio = a/b
+    quotient = math.floor(ratio)
+    # far from an integer, the rounding of a/b does not matter
+    margin = 1e-5*max(ratio, 1.)
+    if ratio-quotient > margin and quotient+1-ratio > margin:
+        return np.int32(quotient)
+    return np.int32(a // b)
+
+
+def leak_noise(seed, frame, shape):
+    """Returns the float32 standard normal leak jitter of a frame,
+    keyed by (seed, frame) like the random numbers of the kernels."""
+    return np.random.Generator(np.random.PCG64(
+        [seed, frame, LEAK_STREAM])).standard_normal(shape, dtype=np.float32)
+
+
+@njit(parallel=True, cache=True)
+def pixel_front_end(
+        new_frame, lp_log_frame0, lp_log_frame1, base_log_frame,
+        pos_thres, neg_thres, noise_rate_array, leak_rand, pos_evts_frame,
+        neg_evts_frame, delta_time, cutoff_hz, leak_rate_hz,
+        leak_jitter_fraction):
+    """Updates the lowpass and base states of a frame in place and
+    computes the event counts of the pixels, see
+    emulator_utils.fused_pixel_update() for the model.
+
+    # Arguments
+        new_frame: [height, width] float64 new frame.
+        lp_log_frame0, lp_log_frame1: lowpass states, float64 if cutoff_hz>0.
+        base_log_frame: float32 memorized log intensity.
+        pos_thres, neg_thres: float32 thresholds.
+        noise_rate_array: float32 leak rate factors, used if leak_rate_hz>0.
+        leak_rand: float32 standard normal leak jitter, see leak_noise(),
+            used if leak_rate_hz>0.
+        pos_evts_frame, neg_evts_frame: int32 event counts, written.
+        delta_time: time since the previous frame.
+        cutoff_hz, leak_rate_hz, leak_jitter_fraction: see EventEmulator.
+
+    # Returns
+        the largest event count of any pixel.
+    """
+    height, width = new_frame.shape
+    lin_factor = (1./20)*math.log(20)
+    eps_factor = delta_time*(math.pi*2*cutoff_hz) if cutoff_hz <= 0 \
+        else delta_time/(1/(math.pi*2*cutoff_hz))  # delta_time/tau
+    leak_factor = np.float32(delta_time)
+    row_max = np.zeros(height, dtype=np.int32)
+    for y in prange(height):
+        for x in range(width):
+            intensity = new_frame[y, x]
+            if intensity <= 20:
+                log_intensity = intensity*lin_factor
+            else:
+                log_intensity = math.log(intensity)
+            log_intensity = np.float32(np.rint(log_intensity*1e8)/1e8)
+
+            if cutoff_hz > 0:
+                eps = min((intensity+20)/275.*eps_factor, 1.)
+                lp_log_frame1[y, x] = lp_log_frame0[y, x]
+                lp_log_frame0[y, x] = \
+                    (1-eps)*lp_log_frame0[y, x]+eps*log_intensity
+            else:
+                lp_log_frame0[y, x] = log_intensity
+                lp_log_frame1[y, x] = log_intensity
+
+            if leak_rate_hz > 0:
+                curr_leak_rate = np.float32(leak_rate_hz)*noise_rate_array[y, x]*(
+                    1-np.float32(leak_jitter_fraction) *
+                    leak_rand[y, x])
+                base_log_frame[y, x] -= \
+                    leak_factor*curr_leak_rate*pos_thres[y, x]
+
+            diff = lp_log_frame1[y, x]-base_log_frame[y, x]
+            num_on = 0
+            num_off = 0
+            if diff > 0:
+                num_on = _floor_div(diff, pos_thres[y, x])
+            elif diff < 0:
+                num_off = _floor_div(-diff, neg_thres[y, x])
+            pos_evts_frame[y, x] = num_on
+            neg_evts_frame[y, x] = num_off
+            row_max[y] = max(row_max[y], num_on, num_off)
+    return row_max.max()
+
+
+@njit(cache=True)
+def _next_shot(i, shot_prob, num_iters):
+    """Returns the next iteration after i with a shot noise event
+    of a pixel with probability shot_prob per iteration, or a large number
+    if there is none before num_iters."""
+    if shot_prob <= 0:
+        return np.iinfo(np.int64).max
+    if shot_prob >= 1:
+        return i+1
+    u = 1.-np.random.random()  # in (0, 1]
+    # (1-shot_prob)**k >= 1-k*shot_prob, so u below this bound means no
+    # shot before num_iters without taking the logarithms
+    if u <= 1.-(num_iters-i)*shot_prob:
+        return np.iinfo(np.int64).max
+    return i+1+np.int64(math.log(u)/math.log1p(-shot_prob))
+
+
+@njit(cache=True)
+def _write_event(events, offsets, i, y, t, x, polarity):
+    """Writes an event of row y at iteration i to its place in events."""
+    k = offsets[i, y]
+    events[k, 0] = t
+    events[k, 1] = x
+    events[k, 2] = y
+    events[k, 3] = polarity
+    offsets[i, y] = k+1
+
+
+@njit(parallel=True, cache=True)
+def emit_events(
+        count_only, new_frame, pos_evts_frame, neg_evts_frame, ts,
+        timestamp_mem, refractory_period_s, base_log_frame, pos_thres,
+        neg_thres, pos_thres_pre_prob, neg_thres_pre_prob, shot_noise_factor,
+        shot_noise_inten_factor, seed, frame, row_iter_counts, offsets,
+        events, num_emitted):
+    """Emits the events of a frame pixel by pixel.
+
+    At iteration i of the num_iters=len(ts) sub-frame iterations,
+    a pixel makes an ON event if i<pos_evts_frame or it has an ON shot
+    noise event, likewise for OFF events, and the events are dropped if
+    ts[i] is within refractory_period_s of the last event of the pixel.
+
+    # Arguments
+        count_only: if True, count the events of each row at each iteration
+            in row_iter_counts; if False, write the events to events at
+            offsets and update the pixel states.
+        new_frame: [height, width] float64 frame, for the shot noise rate.
+        pos_evts_frame, neg_evts_frame: int32 event counts.
+        ts: [num_iters] float32 timestamps of the iterations.
+        timestamp_mem: float32 time of last event of each pixel,
+            used if refractory_period_s>0.
+        refractory_period_s: refractory period, 0 to disable the filter.
+        base_log_frame, pos_thres, neg_thres: base and thresholds.
+        pos_thres_pre_prob, neg_thres_pre_prob: float32 shot noise
+            probability factors, see shot_noise_probabilities().
+        shot_noise_factor: shot noise probability per iteration of an
+            intensity 0 pixel with nominal thresholds, 0 to disable.
+        shot_noise_inten_factor: see EventEmulator.SHOT_NOISE_INTEN_FACTOR.
+        seed, frame: key of the random numbers.
+        row_iter_counts: [num_iters, height] int64 counts, written
+            if count_only.
+        offsets: [num_iters, height] int64 index of the first event of
+            each row at each iteration in events, advanced if not count_only.
+        events: [N, 4] float32 events [t, x, y, p], written if not
+            count_only.
+        num_emitted: [height, 2] int64 number of ON and OFF events of
+            each row, written if not count_only.
+    """
+    height, width = pos_evts_frame.shape
+    num_iters = ts.shape[0]
+    for y in prange(height):
+        np.random.seed(_stream_seed(seed, frame, y, EVENT_STREAM))
+        if count_only:
+            row_iter_counts[:, y] = 0
+        else:
+            num_emitted[y, 0] = 0
+            num_emitted[y, 1] = 0
+        for x in range(width):
+            num_on = pos_evts_frame[y, x]
+            num_off = neg_evts_frame[y, x]
+            num_regular = max(num_on, num_off)
+            shot_on_prob = 0.
+            shot_prob = 0.
+            if shot_noise_factor > 0:
+                factor = shot_noise_factor*(
+                    (shot_noise_inten_factor-1)*(new_frame[y, x]+20)/275.+1)
+                shot_on_prob = factor*pos_thres_pre_prob[y, x]
+                shot_prob = shot_on_prob+factor*neg_thres_pre_prob[y, x]
+            i_shot = _next_shot(-1, shot_prob, num_iters)
+            t_last = timestamp_mem[y, x] if refractory_period_s > 0 else 0.
+            emitted_on = 0
+            emitted_off = 0
+            # the iterations with regular or shot noise events
+            i = 0 if num_regular > 0 else i_shot
+            while i < num_iters:
+                on = i < num_on
+                off = i < num_off
+                if i == i_shot:
+                    if np.random.random()*shot_prob < shot_on_prob:
+                        on = True
+                    else:
+                        off = True
+                    i_shot = _next_shot(i, shot_prob, num_iters)
+                if refractory_period_s > 0:
+                    if ts[i]-t_last > refractory_period_s:
+                        t_last = ts[i]
+                    else:
+                        on = False
+                        off = False
+                if count_only:
+                    row_iter_counts[i, y] += on+off
+                else:
+                    if on:
+                        _write_event(events, offsets, i, y, ts[i], x, 1.)
+                        emitted_on += 1
+                    if off:
+                        _write_event(events, offsets, i, y, ts[i], x, -1.)
+                        emitted_off += 1
+                i = i+1 if i+1 < num_regular else i_shot
+            if not count_only:
+                if refractory_period_s > 0:
+                    timestamp_mem[y, x] = t_last
+                base_log_frame[y, x] += \
+                    np.float32(emitted_on)*pos_thres[y, x]
+                base_log_frame[y, x] -= \
+                    np.float32(emitted_off)*neg_thres[y, x]
+                num_emitted[y, 0] += emitted_on
+                num_emitted[y, 1] += emitted_off
+
+
+@njit(parallel=True, cache=True)
+def shuffle_iterations(events, starts, seed, frame):
+    """Shuffles the events of each iteration, which start at starts[i]
+    and end at starts[i+1], like the random arbitration of the torch
+    backend."""
+    for i in prange(starts.shape[0]-1):
+        np.random.seed(_stream_seed(seed, frame, i, SHUFFLE_STREAM))
+        start = starts[i]
+        for k in range(starts[i+1]-1, start, -1):
+            j = start+np.random.randint(0, k-start+1)
+            for c in range(4):
+                events[k, c], events[j, c] = events[j, c], events[k, c]
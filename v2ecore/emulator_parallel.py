@@ -0,0 +1,348 @@
+"""
+Temporal chunk-parallel DVS emulation.
+
+The (interpolated) frames are split into time segments that are emulated
+by EventEmulator instances in worker processes. Each worker first runs over
+an overlap window of frames before its segment (the warm-up),
+without emitting events, so that its lowpass filter and memorized
+brightness converge to those of a serial run.
+The segments emit events in disjoint, increasing time ranges, so the
+per-segment event streams are merged into time order by handing them
+to the outputs in segment order as they complete.
+"""
+import logging
+import math
+import multiprocessing
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+
+from v2ecore.event_arena import is_event_records
+from v2ecore.v2e_utils import read_image
+
+logger = logging.getLogger(__name__)
+
+
+class Segment(NamedTuple):
+    """Frames of a time segment.
+
+    The worker initializes its emulator with frame warmup_start,
+    runs frames up to start without emitting events and
+    emits the events of frames start to stop-1.
+    """
+    index: int
+    warmup_start: int
+    start: int
+    stop: int
+
+
+class SegmentResult(NamedTuple):
+    """Events and statistics of an emulated segment."""
+    index: int
+    events: Optional[np.ndarray]  # [N,4] events or EVENT_DTYPE records
+    num_events_to_frame: np.ndarray  # number of events up to each frame
+    num_events_on: int
+    num_events_off: int
+    num_static_frames: int  # frames without events, see EventEmulator
+    t_last: float  # time of the last frame
+    head_map: Optional[np.ndarray]  # net event count map of the last frames of the warm-up
+    tail_map: Optional[np.ndarray]  # net event count map of the same frames of the previous segment
+
+
+def split_segments(frame_times, num_segments, overlap_s) -> List[Segment]:
+    """Splits the frames into segments of equal number of frames.
+
+    Parameters
+    ----------
+    frame_times: np.ndarray
+        [N] increasing frame times in seconds.
+    num_segments: int
+        number of segments, reduced if there are too few frames.
+    overlap_s: float
+        duration in seconds of the warm-up of each segment after the
+        first one. The warm-up always has at least the frame before the
+        segment, whose change to the first frame of the segment makes
+        its first events.
+
+    Returns
+    -------
+    segments: list of Segment
+    """
+    num_frames = len(frame_times)
+    num_segments = max(1, min(num_segments, num_frames // 2))
+    bounds = np.linspace(0, num_frames, num_segments + 1).astype(int)
+    segments = []
+    for i in range(num_segments):
+        start, stop = int(bounds[i]), int(bounds[i + 1])
+        if start == 0:
+            warmup_start = 0
+        else:
+            warmup_start = min(start - 1, int(np.searchsorted(
+                frame_times, frame_times[start] - overlap_s, side='left')))
+        segments.append(Segment(i, warmup_start, start, stop))
+    return segments
+
+
+def lowpass_residual(overlap_s, cutoff_hz) -> Tuple[float, float]:
+    """Returns the fraction of the initial lowpass filter error of a
+    segment that remains after its warm-up.
+
+    The time constant of the photoreceptor lowpass filter is inversely
+    proportional to the intensity, see low_pass_filter().
+
+    Parameters
+    ----------
+    overlap_s: float
+        warm-up duration in seconds.
+    cutoff_hz: float
+        cutoff frequency of the lowpass filter for white pixels.
+
+    Returns
+    -------
+    white, black: float
+        remaining fraction for white (255) and black (0) pixels.
+    """
+    if cutoff_hz <= 0:
+        return 0., 0.
+    tau = 1 / (math.pi * 2 * cutoff_hz)
+    # intensity scaling of rescale_intensity_frame()
+    inten_white, inten_black = (255 + 20) / 275., 20 / 275.
+    return math.exp(-overlap_s * inten_white / tau), \
+        math.exp(-overlap_s * inten_black / tau)
+
+
+def _net_event_map(events, height, width):
+    """Returns the [height, width] sum of the event polarities."""
+    net_map = np.zeros((height, width), dtype=np.int32)
+    if events is None or len(events) == 0:
+        return net_map
+    if is_event_records(events):
+        x, y, p = events['x'], events['y'], events['p']
+    else:
+        x = events[:, 1].astype(np.int64)
+        y = events[:, 2].astype(np.int64)
+        p = events[:, 3]
+    np.add.at(net_map, (y, x), p.astype(np.int32))
+    return net_map
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _emulate_segment(job) -> SegmentResult:
+    """Emulates a segment in a worker process.
+
+    All workers use the same seed, so they draw the same threshold and
+    leak rate mismatch on their first frame. The workers of segments
+    after the first one are then reseeded so that their noise differs.
+    With counter_rng, the frames keep their number in the whole
+    recording instead, so their noise is the same as in a serial run.
+    """
+    from v2ecore.emulator import EventEmulator
+
+    segment, frame_files, frame_times, emulator_args, dvs_params, \
+        head_frames, tail_frames = job
+    seed = emulator_args['seed']
+    emulator = EventEmulator(**emulator_args)
+    if dvs_params is not None:
+        emulator.set_dvs_params(dvs_params)
+    if emulator.counter_rng is not None:
+        # the random numbers are keyed by the frame number
+        emulator.frame_counter = segment.warmup_start
+
+    # frames whose net event maps are compared with the neighbouring segment
+    head_window = (segment.start - head_frames, segment.start) \
+        if head_frames > 0 else None
+    tail_window = (segment.stop - tail_frames, segment.stop) \
+        if tail_frames > 0 else None
+
+    head_events, tail_events, events = [], [], []
+    num_events_on = num_events_off = num_static_frames = 0
+    with torch.no_grad():
+        for i in range(segment.warmup_start, segment.stop):
+            if i == segment.start:
+                # do not count the events of the warm-up
+                num_events_on = emulator.num_events_on
+                num_events_off = emulator.num_events_off
+                num_static_frames = emulator.num_static_frames
+            new_events = emulator.generate_events(
+                read_image(frame_files[i]), frame_times[i])
+            if i == segment.warmup_start and segment.index > 0 \
+                    and emulator.counter_rng is None:
+                # the first frame initialized the mismatch, decorrelate noise
+                torch.manual_seed(seed + segment.index)
+                np.random.seed(seed + segment.index)
+            if new_events is not None:
+                # the events may be a view of the event arena
+                new_events = np.array(new_events)
+                if head_window is not None and head_window[0] <= i < head_window[1]:
+                    head_events.append(new_events)
+                if tail_window is not None and tail_window[0] <= i:
+                    tail_events.append(new_events)
+                if segment.start <= i:
+                    events.append(new_events)
+
+    height, width = emulator.new_frame.shape
+    head_map = None if head_window is None else \
+        _net_event_map(_concatenate(head_events), height, width)
+    tail_map = None if tail_window is None else \
+        _net_event_map(_concatenate(tail_events), height, width)
+    events = _concatenate(events)
+    emulator.cleanup()
+    return SegmentResult(
+        index=segment.index, events=events,
+        num_events_to_frame=_num_events_to_frame(
+            events, frame_times[segment.start:segment.stop]),
+        num_events_on=emulator.num_events_on - num_events_on,
+        num_events_off=emulator.num_events_off - num_events_off,
+        num_static_frames=emulator.num_static_frames - num_static_frames,
+        t_last=float(frame_times[segment.stop - 1]),
+        head_map=head_map, tail_map=tail_map)
+
+
+def _num_events_to_frame(events, frame_times):
+    """Returns the number of time-ordered events up to and including
+    each frame, from the timestamps of the events."""
+    if events is None:
+        return np.zeros(len(frame_times), dtype=np.int64)
+    if is_event_records(events):
+        # as in EventEmulator._append_event_records()
+        return np.searchsorted(
+            events['t'], np.round(1e6 * np.asarray(frame_times)),
+            side='right')
+    return np.searchsorted(
+        events[:, 0], np.asarray(frame_times, dtype=events.dtype),
+        side='right')
+
+
+def _concatenate(events):
+    events = [e for e in events if e is not None and len(e) > 0]
+    if len(events) == 0:
+        return None
+    return np.concatenate(events)
+
+
+def _compare_frames(segments, k):
+    """Returns the number of frames before the start of segment k
+    whose events are compared with those of segment k-1.
+
+    These are the second half of the warm-up, where the state of
+    segment k has (mostly) converged.
+    """
+    if k <= 0 or k >= len(segments):
+        return 0
+    segment = segments[k]
+    return min((segment.start - segment.warmup_start) // 2,
+               segments[k - 1].stop - segments[k - 1].start)
+
+
+def emulate_frames_parallel(
+        frame_files, frame_times, emulator_args, num_workers,
+        overlap_s, dvs_params=None):
+    """Emulates the frames in time segments in worker processes.
+
+    Parameters
+    ----------
+    frame_files: list of str
+        [N] paths of the frames, read with read_image().
+    frame_times: np.ndarray
+        [N] increasing frame times in seconds.
+    emulator_args: dict
+        keyword arguments of the EventEmulator of the workers, without
+        outputs. A seed of 0 is replaced by a random seed, so that all
+        workers draw the same threshold mismatch.
+    num_workers: int
+        number of worker processes and segments.
+    overlap_s: float
+        warm-up duration of each segment after the first one.
+    dvs_params: str
+        None or model for EventEmulator.set_dvs_params().
+
+    Yields
+    -------
+    result: SegmentResult
+        the segments in time order, as they complete.
+    """
+    frame_times = np.asarray(frame_times)
+    emulator_args = dict(emulator_args)
+    if not emulator_args.get('seed'):
+        emulator_args['seed'] = int(np.random.randint(1, 2 ** 31 - 1))
+        logger.info(f'using DVS emulator seed {emulator_args["seed"]} '
+                    f'for all emulator processes')
+    segments = split_segments(frame_times, num_workers, overlap_s)
+    log_expected_deviation(
+        segments, frame_times, overlap_s, emulator_args.get('cutoff_hz', 0),
+        emulator_args.get('counter_rng', False))
+
+    jobs = [(segment, frame_files, frame_times, emulator_args, dvs_params,
+             _compare_frames(segments, k),
+             _compare_frames(segments, k + 1))
+            for k, segment in enumerate(segments)]
+    num_threads = max(1, (os.cpu_count() or 1) // len(segments))
+    # spawn, since forking a process that already runs torch threads
+    # may deadlock
+    context = multiprocessing.get_context('spawn')
+    previous = None
+    deviations = []
+    with context.Pool(len(segments), initializer=_init_worker,
+                      initargs=(num_threads,)) as pool:
+        for result in pool.imap(_emulate_segment, jobs):
+            if previous is not None and result.head_map is not None:
+                deviations.append(
+                    _map_deviation(previous.tail_map, result.head_map))
+            previous = result
+            yield result
+    if len(deviations) > 0:
+        logger.info(
+            f'measured deviation from the previous segment at the '
+            f'{len(deviations)} segment boundaries: '
+            f'{100 * np.mean(deviations):.1f}% of events '
+            f'(max {100 * np.max(deviations):.1f}%)')
+
+
+def _map_deviation(reference_map, segment_map):
+    """Returns the fraction of events that differ between two
+    net event count maps of the same frames."""
+    num_events = max(1, int(np.abs(reference_map).sum()))
+    return float(np.abs(segment_map - reference_map).sum()) / num_events
+
+
+def log_expected_deviation(segments, frame_times, overlap_s, cutoff_hz,
+                           counter_rng=False):
+    """Logs the expected deviation of the segmented emulation from
+    a serial run, to choose the overlap duration.
+
+    Three effects make the events of a segment differ from a serial run:
+
+    - the lowpass filter starts from the input at the start of the
+      warm-up instead of its filtered history; the error decays with the
+      intensity-dependent filter time constant.
+    - the memorized brightness of a pixel and that of a serial run are
+      both within a threshold of the input, but differ, and the
+      difference does not decay: each pixel can make up to 2 events more
+      or less of each polarity in each frame of the segment.
+    - the noise events are drawn from different random numbers,
+      like a serial run with another seed, unless counter_rng is set.
+    """
+    if len(segments) < 2:
+        return
+    warmups = [frame_times[s.start] - frame_times[s.warmup_start]
+               for s in segments[1:]]
+    white, black = lowpass_residual(min(warmups), cutoff_hz)
+    logger.info(
+        f'emulating {len(frame_times)} frames in {len(segments)} '
+        f'segments of about {len(frame_times) // len(segments)} frames, '
+        f'each after the first warmed up over at least '
+        f'{min(warmups) * 1e3:.3g}ms (--segment_overlap_s={overlap_s})\n'
+        f'expected deviation from a serial run at each of the '
+        f'{len(segments) - 1} segment boundaries:\n'
+        f'\tlowpass filter error remaining: {100 * white:.2g}% for white, '
+        f'{100 * black:.2g}% for black pixels\n'
+        f'\tmemorized brightness: up to 2 events more or less per pixel, '
+        f'polarity and frame, independent of the overlap\n'
+        + ('\tnoise random numbers: the same as a serial run (--counter_rng)'
+           if counter_rng else
+           '\tnoise events differ, as with another --dvs_emulator_seed'))
@@ -0,0 +1,457 @@
+"""
+Spatial tiling of the DVS pixel array of the EventEmulator.
+
+Apart from the center-surround diffuser, the DVS pixel model is
+independent per pixel. With tiling, the pixel states and thresholds are
+kept per rectangular tile and the tiles are updated by a pool of worker
+threads, so the [num_iters, height, width] temporaries of the event
+generation only exist per tile. The center-surround diffuser exchanges a
+one pixel halo between neighbouring tiles at every Euler step.
+
+The random numbers of the leak and shot noise are drawn for the full
+frame in the same order as the untiled emulator and the events of the
+tiles are merged into the order of the untiled emulator before they
+are shuffled, so the events are identical to an untiled run with the
+same seed. With the counter-based random numbers of
+EventEmulator(counter_rng=True), the random numbers of each tile are
+instead drawn by its worker, keyed by the pixels of the tile.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import torch
+
+from v2ecore.emulator_utils import compute_event_map
+from v2ecore.emulator_utils import event_columns_to_list
+from v2ecore.emulator_utils import generate_event_columns
+from v2ecore.emulator_utils import generate_shot_noise_counter
+from v2ecore.emulator_utils import generate_shot_noise_sparse
+from v2ecore.emulator_utils import low_pass_filter
+from v2ecore.emulator_utils import shot_noise_probabilities
+from v2ecore.emulator_utils import shuffle_event_columns
+from v2ecore.emulator_utils import subtract_leak_current
+
+logger = logging.getLogger(__name__)
+
+
+class PixelTile(object):
+    """State of the pixels of a rectangular tile of the sensor."""
+
+    # per-pixel state of a tile, slices of the EventEmulator attributes
+    STATE_ATTRIBUTES = (
+        'lp_log_frame0', 'lp_log_frame1', 'cs_surround_frame',
+        'base_log_frame', 'timestamp_mem',
+        'pos_thres', 'neg_thres', 'pos_thres_pre_prob', 'neg_thres_pre_prob',
+        'noise_rate_array')
+
+    def __init__(self, row: int, col: int, rows: slice, cols: slice):
+        """
+        Parameters
+        ----------
+        row, col: int
+            position of the tile in the grid of tiles.
+        rows, cols: slice
+            pixels of the tile.
+        """
+        self.row = row
+        self.col = col
+        self.rows = rows
+        self.cols = cols
+        for name in PixelTile.STATE_ATTRIBUTES:
+            setattr(self, name, None)
+
+    @property
+    def shape(self):
+        return (self.rows.stop - self.rows.start,
+                self.cols.stop - self.cols.start)
+
+    def slice_of(self, frame):
+        """Returns the tile of a [height, width] tensor,
+        or frame itself if it is a scalar or None."""
+        if torch.is_tensor(frame) and frame.dim() == 2:
+            return frame[self.rows, self.cols]
+        return frame
+
+    def global_pixels(self, pixels, width):
+        """Converts flat pixel indices of the tile to those of the frame."""
+        tile_width = self.shape[1]
+        return (pixels // tile_width + self.rows.start) * width \
+            + pixels % tile_width + self.cols.start
+
+
+class TiledPixelArray(object):
+    """Tiles of the pixel array of an EventEmulator and the worker pool
+    that updates them."""
+
+    def __init__(self, height, width, tile_size, num_workers=0):
+        """
+        Parameters
+        ----------
+        height, width: int
+            size of the pixel array.
+        tile_size: int
+            width and height of the tiles; the tiles at the right and
+            bottom border can be smaller.
+        num_workers: int
+            number of worker threads, 0 for the number of CPU cores.
+        """
+        self.height = height
+        self.width = width
+        self.tile_size = tile_size
+        self.grid: List[List[PixelTile]] = []
+        for row, r in enumerate(range(0, height, tile_size)):
+            self.grid.append([
+                PixelTile(row, col,
+                          slice(r, min(r + tile_size, height)),
+                          slice(c, min(c + tile_size, width)))
+                for col, c in enumerate(range(0, width, tile_size))])
+        self.tiles = [tile for grid_row in self.grid for tile in grid_row]
+        self.pool = ThreadPoolExecutor(
+            max_workers=num_workers if num_workers > 0 else None)
+        logger.info(
+            f'emulating {height}x{width} pixels in {len(self.grid)}x'
+            f'{len(self.grid[0])} tiles of up to {tile_size}x{tile_size} '
+            f'pixels')
+
+    def split_state(self, emulator):
+        """Moves the per-pixel state of the emulator into the tiles.
+
+        The state is initialized by the emulator on its first frame,
+        so the thresholds and noise rates are those of an untiled run.
+        The full-frame attributes of the emulator are set to None.
+        """
+        for name in PixelTile.STATE_ATTRIBUTES:
+            value = getattr(emulator, name, None)
+            for tile in self.tiles:
+                tile_value = tile.slice_of(value)
+                if torch.is_tensor(tile_value) and tile_value.dim() == 2:
+                    tile_value = tile_value.clone()
+                setattr(tile, name, tile_value)
+            if torch.is_tensor(value) and value.dim() == 2:
+                setattr(emulator, name, None)
+        emulator.diff_frame = None
+        emulator.c_minus_s_frame = None
+
+    def assemble(self, name):
+        """Returns the full [height, width] frame of a tile state,
+        or its value if it is a scalar."""
+        value = getattr(self.tiles[0], name)
+        if not (torch.is_tensor(value) and value.dim() == 2):
+            return value
+        return torch.cat([
+            torch.cat([getattr(tile, name) for tile in grid_row], dim=1)
+            for grid_row in self.grid], dim=0)
+
+    def state_dict(self):
+        """Returns copies of the tile states, see EventEmulator.state_dict()."""
+        return {
+            'shape': (self.height, self.width),
+            'tiles': [
+                {name: getattr(tile, name).clone()
+                    if torch.is_tensor(getattr(tile, name))
+                    else getattr(tile, name)
+                 for name in PixelTile.STATE_ATTRIBUTES}
+                for tile in self.tiles]}
+
+    def load_state_dict(self, state, device):
+        """Restores the tile states from state_dict()."""
+        for tile, tile_state in zip(self.tiles, state['tiles']):
+            for name, value in tile_state.items():
+                if torch.is_tensor(value):
+                    value = value.to(device)
+                setattr(tile, name, value)
+
+    def close(self):
+        self.pool.shutdown()
+
+    def _map(self, fn, *iterables):
+        return list(self.pool.map(fn, *iterables))
+
+    def emulate_frame(self, emulator, log_new_frame, inten01, t_frame):
+        """Updates the tiles with a new frame and computes its events,
+        like EventEmulator._emulate_frame().
+
+        Parameters
+        ----------
+        emulator: EventEmulator
+            the emulator, for its parameters, time and statistics.
+        log_new_frame: torch.Tensor
+            [height, width] lin-log new frame.
+        inten01: torch.Tensor
+            [height, width] rescaled intensity of new frame,
+            or None if neither lowpass nor shot noise are enabled.
+        t_frame: float
+            timestamp of new frame in float seconds
+
+        Returns
+        -------
+        events: torch.Tensor if any events, else None
+            [N, 4] events on the device, or None with compact_events,
+            see EventEmulator.generate_events().
+        """
+        if t_frame < emulator.t_previous:
+            raise ValueError(
+                "this frame time={} must be later than "
+                "previous frame time={}".format(t_frame, emulator.t_previous))
+        delta_time = t_frame - emulator.t_previous
+
+        def _lowpass(tile):
+            tile.lp_log_frame0, tile.lp_log_frame1 = low_pass_filter(
+                log_new_frame=tile.slice_of(log_new_frame),
+                lp_log_frame0=tile.lp_log_frame0,
+                lp_log_frame1=tile.lp_log_frame1,
+                inten01=tile.slice_of(inten01),
+                delta_time=delta_time,
+                cutoff_hz=emulator.cutoff_hz)
+        self._map(_lowpass, self.tiles)
+
+        if emulator.csdvs_enabled:
+            self._update_csdvs(emulator, delta_time)
+
+        # leak jitter of the full frame, drawn like subtract_leak_current()
+        leak_rand = None
+        if emulator.leak_rate_hz > 0 and emulator.counter_rng is None:
+            leak_rand = torch.randn(
+                (self.height, self.width), dtype=torch.float32,
+                device=log_new_frame.device)
+        pixel_indices = emulator._pixel_indices() \
+            if emulator.counter_rng is not None else None
+
+        def _event_map(tile):
+            if emulator.leak_rate_hz > 0:
+                tile.base_log_frame = subtract_leak_current(
+                    base_log_frame=tile.base_log_frame,
+                    leak_rate_hz=emulator.leak_rate_hz,
+                    delta_time=delta_time,
+                    pos_thres=tile.pos_thres,
+                    leak_jitter_fraction=emulator.leak_jitter_fraction,
+                    noise_rate_array=tile.noise_rate_array,
+                    rand=tile.slice_of(leak_rand) if leak_rand is not None
+                    else emulator._leak_rand(tile.slice_of(pixel_indices)))
+            if not emulator.csdvs_enabled:
+                diff_frame = tile.lp_log_frame1 - tile.base_log_frame
+            else:
+                diff_frame = tile.lp_log_frame1 - tile.cs_surround_frame \
+                    - tile.base_log_frame
+            return compute_event_map(diff_frame, tile.pos_thres, tile.neg_thres)
+        event_maps = self._map(_event_map, self.tiles)
+
+        max_num_events_any_pixel = torch.stack(
+            [torch.max(pos.max(), neg.max()) for pos, neg in event_maps]).max()
+        if emulator._skip_static_frame(max_num_events_any_pixel, t_frame):
+            return None
+
+        # event timestamps at each iteration, as in the untiled emulator
+        num_iters, ts_step, ts = emulator._iteration_timestamps(
+            max_num_events_any_pixel, delta_time, t_frame)
+        num_iters = ts.shape[0]
+
+        shot_cords = [(None, None)] * len(self.tiles)
+        if emulator.shot_noise_rate_hz > 0:
+            shot_cords = self._generate_shot_noise(
+                emulator, delta_time, num_iters, inten01)
+
+        use_refractory = emulator.refractory_period_s > ts_step
+
+        def _events(tile, event_map, shot_cord):
+            columns, final_pos_evts_frame, final_neg_evts_frame = \
+                generate_event_columns(
+                    pos_evts_frame=event_map[0],
+                    neg_evts_frame=event_map[1],
+                    ts=ts,
+                    shot_on_cord=shot_cord[0],
+                    shot_off_cord=shot_cord[1],
+                    timestamp_mem=tile.timestamp_mem
+                    if use_refractory else None,
+                    refractory_period_s=emulator.refractory_period_s,
+                    shuffle=False)
+            tile.base_log_frame += final_pos_evts_frame * tile.pos_thres
+            tile.base_log_frame -= final_neg_evts_frame * tile.neg_thres
+            if columns is not None:
+                iters, pixels, polarity = columns
+                columns = (iters, tile.global_pixels(pixels, self.width),
+                           polarity)
+            return columns, int(final_pos_evts_frame.sum()), \
+                int(final_neg_evts_frame.sum())
+        results = self._map(_events, self.tiles, event_maps, shot_cords)
+
+        for _, num_pos_events, num_neg_events in results:
+            emulator.num_events_on += num_pos_events
+            emulator.num_events_off += num_neg_events
+            emulator.num_events_total += num_pos_events + num_neg_events
+
+        events = None
+        tile_columns = [columns for columns, _, _ in results
+                        if columns is not None]
+        if len(tile_columns) > 0:
+            # merge the tiles and order their events like the untiled
+            # emulator does
+            columns = shuffle_event_columns(
+                tuple(torch.cat(c) for c in zip(*tile_columns)),
+                num_iters, self.height * self.width,
+                emulator._shuffle_keys_fn())
+            if emulator.compact_events:
+                emulator._append_event_records(
+                    columns, t_frame, num_iters, self.width)
+            else:
+                events = event_columns_to_list(columns, ts, self.width)
+
+        emulator.t_previous = t_frame
+        return events
+
+    def _generate_shot_noise(self, emulator, delta_time, num_iters, inten01):
+        """Returns the sparse (ON, OFF) shot noise events of each tile.
+
+        The random numbers are drawn for the full frame as in
+        generate_shot_noise() or generate_shot_noise_sparse().
+        The dense sampler draws them one iteration at a time,
+        which gives the same numbers on the CPU.
+        With counter_rng, the workers draw the shot noise of their tiles.
+        """
+        device = inten01.device
+        if emulator.counter_rng is not None:
+            pixel_indices = emulator._pixel_indices()
+
+            def _tile_shot_noise(tile):
+                return generate_shot_noise_counter(
+                    counter_rng=emulator.counter_rng,
+                    frame=emulator.frame_counter,
+                    pixels=tile.slice_of(pixel_indices),
+                    shot_noise_rate_hz=emulator.shot_noise_rate_hz,
+                    delta_time=delta_time,
+                    num_iters=num_iters,
+                    shot_noise_inten_factor=emulator.SHOT_NOISE_INTEN_FACTOR,
+                    inten01=tile.slice_of(inten01),
+                    pos_thres_pre_prob=tile.pos_thres_pre_prob,
+                    neg_thres_pre_prob=tile.neg_thres_pre_prob)
+            return self._map(_tile_shot_noise, self.tiles)
+        if emulator.sparse_shot_noise:
+            shot_on_cord, shot_off_cord = generate_shot_noise_sparse(
+                shot_noise_rate_hz=emulator.shot_noise_rate_hz,
+                delta_time=delta_time,
+                num_iters=num_iters,
+                shot_noise_inten_factor=emulator.SHOT_NOISE_INTEN_FACTOR,
+                inten01=inten01,
+                pos_thres_pre_prob=self.assemble('pos_thres_pre_prob'),
+                neg_thres_pre_prob=self.assemble('neg_thres_pre_prob'))
+            return [(self._tile_of_sparse(tile, shot_on_cord),
+                     self._tile_of_sparse(tile, shot_off_cord))
+                    for tile in self.tiles]
+
+        probabilities = [
+            shot_noise_probabilities(
+                emulator.shot_noise_rate_hz, delta_time, num_iters,
+                emulator.SHOT_NOISE_INTEN_FACTOR, tile.slice_of(inten01),
+                tile.pos_thres_pre_prob, tile.neg_thres_pre_prob)
+            for tile in self.tiles]
+        on_indices = [[] for _ in self.tiles]
+        off_indices = [[] for _ in self.tiles]
+        rand01 = None
+        if device.type != 'cpu':
+            # the random numbers of the GPU depend on the size of the draw
+            rand01 = torch.rand(
+                size=[num_iters, self.height, self.width],
+                dtype=torch.float32, device=device)
+        for i in range(num_iters):
+            rand01_iter = rand01[i] if rand01 is not None else torch.rand(
+                size=[self.height, self.width], dtype=torch.float32,
+                device=device)
+            for k, tile in enumerate(self.tiles):
+                one_minus_on_prob, off_prob = probabilities[k]
+                tile_rand = tile.slice_of(rand01_iter)
+                on_indices[k].append(
+                    self._iteration_indices(i, tile_rand > one_minus_on_prob))
+                off_indices[k].append(
+                    self._iteration_indices(i, tile_rand < off_prob))
+        return [(self._sparse_cord(tile, num_iters, on_indices[k]),
+                 self._sparse_cord(tile, num_iters, off_indices[k]))
+                for k, tile in enumerate(self.tiles)]
+
+    @staticmethod
+    def _iteration_indices(i, cord):
+        ys, xs = cord.nonzero(as_tuple=True)
+        return torch.stack((torch.full_like(ys, i), ys, xs))
+
+    @staticmethod
+    def _sparse_cord(tile, num_iters, indices):
+        indices = torch.cat(indices, dim=1)
+        return torch.sparse_coo_tensor(
+            indices,
+            torch.ones(indices.shape[1], dtype=torch.bool,
+                       device=indices.device),
+            size=(num_iters,) + tile.shape,
+            is_coalesced=True,
+            check_invariants=False)
+
+    @staticmethod
+    def _tile_of_sparse(tile, cord):
+        iters, ys, xs = cord.indices()
+        inside = (ys >= tile.rows.start) & (ys < tile.rows.stop) \
+            & (xs >= tile.cols.start) & (xs < tile.cols.stop)
+        indices = torch.stack((
+            iters[inside], ys[inside] - tile.rows.start,
+            xs[inside] - tile.cols.start))
+        return torch.sparse_coo_tensor(
+            indices,
+            torch.ones(indices.shape[1], dtype=torch.bool,
+                       device=indices.device),
+            size=(cord.shape[0],) + tile.shape,
+            is_coalesced=True,
+            check_invariants=False)
+
+    def _halo(self, tile) -> torch.Tensor:
+        """Returns the float32 surround of a tile padded with one pixel of
+        its neighbours, replicated at the border of the sensor like the
+        untiled emulator does."""
+        h = tile.cs_surround_frame.float()
+        row, col = tile.row, tile.col
+        top = self.grid[row - 1][col].cs_surround_frame[-1:].float() \
+            if row > 0 else h[:1]
+        bottom = self.grid[row + 1][col].cs_surround_frame[:1].float() \
+            if row < len(self.grid) - 1 else h[-1:]
+        left = self.grid[row][col - 1].cs_surround_frame[:, -1:].float() \
+            if col > 0 else h[:, :1]
+        right = self.grid[row][col + 1].cs_surround_frame[:, :1].float() \
+            if col < len(self.grid[row]) - 1 else h[:, -1:]
+        # the corners are not used by the 4-neighbour kernel
+        left = torch.cat((left[:1], left, left[-1:]))
+        right = torch.cat((right[:1], right, right[-1:]))
+        return torch.cat((left, torch.cat((top, h, bottom)), right), dim=1)
+
+    def _update_csdvs(self, emulator, delta_time):
+        """Euler steps of the surround diffuser of all tiles,
+        like EventEmulator._update_csdvs()."""
+        if self.tiles[0].cs_surround_frame is None:
+            for tile in self.tiles:
+                tile.cs_surround_frame = tile.lp_log_frame1.clone().detach()
+            return
+        if emulator.cs_solver == 'direct':
+            # the diffuser is solved for the whole frame
+            surround = emulator._csdvs_direct_solution(
+                self.assemble('cs_surround_frame'),
+                self.assemble('lp_log_frame1'), delta_time)
+            for tile in self.tiles:
+                tile.cs_surround_frame = tile.slice_of(surround).clone()
+            return
+        num_steps, alpha_p, alpha_h = \
+            emulator._csdvs_step_parameters(delta_time)
+        kernel = emulator.cs_k_hh.float()
+        max_change_to_terminate = \
+            emulator.MAX_CHANGE_TO_TERMINATE_EULER_SURROUND_STEPPING
+        max_change = 2 * max_change_to_terminate
+        steps = 0
+
+        def _step(tile, halo):
+            p_term = alpha_p * (tile.lp_log_frame1 - tile.cs_surround_frame)
+            h_conv = torch.conv2d(halo[None, None], kernel)[0, 0]
+            change = p_term + alpha_h * h_conv
+            tile.cs_surround_frame += change
+            return torch.max(torch.abs(change)).item()
+
+        while steps < num_steps and max_change > max_change_to_terminate:
+            # all halos are taken before any tile is updated
+            halos = [self._halo(tile) for tile in self.tiles]
+            max_change = max(self._map(_step, self.tiles, halos))
+            steps += 1
+        emulator.cs_steps_taken.append(steps)
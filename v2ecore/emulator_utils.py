@@ -8,6 +8,8 @@ import math
 import torch
 import torch.nn.functional as F
 
+from v2ecore.counter_rng import SHOT_STREAM
+
 
 def lin_log(x, threshold=20):
     """
@@ -98,12 +100,18 @@ def subtract_leak_current(base_log_frame,
                           delta_time,
                           pos_thres,
                           leak_jitter_fraction,
-                          noise_rate_array):
-    """Subtract leak current from base log frame."""
+                          noise_rate_array,
+                          rand=None):
+    """Subtract leak current from base log frame.
+
+    rand is the standard normal jitter of the pixels,
+    drawn here if it is None.
+    """
 
-    rand = torch.randn(
-        noise_rate_array.shape, dtype=torch.float32,
-        device=noise_rate_array.device)
+    if rand is None:
+        rand = torch.randn(
+            noise_rate_array.shape, dtype=torch.float32,
+            device=noise_rate_array.device)
 
     curr_leak_rate = \
         leak_rate_hz*noise_rate_array*(1-leak_jitter_fraction*rand)
@@ -116,6 +124,98 @@ def subtract_leak_current(base_log_frame,
     return base_log_frame-delta_leak
 
 
+def _mirrored_spectrum(frame):
+    """Returns the rfft2 of the [height, width] frame mirrored to
+    [2*height, 2*width] in float64, whose borders are periodic."""
+    frame = frame.double()
+    frame = torch.cat((frame, frame.flip(0)), dim=0)
+    frame = torch.cat((frame, frame.flip(1)), dim=1)
+    return torch.fft.rfft2(frame)
+
+
+def _mirrored_frame(spectrum, height, width, dtype):
+    """Returns the [height, width] frame of a mirrored spectrum,
+    see _mirrored_spectrum()."""
+    frame = torch.fft.irfft2(spectrum, s=(2*height, 2*width))
+    return frame[:height, :width].to(dtype)
+
+
+def _laplacian_eigenvalues(height, width, device):
+    """Returns the negated eigenvalues
+    4*sin^2(pi*ky/(2*height)) + 4*sin^2(pi*kx/(2*width)) >= 0
+    of the 4-neighbour Laplacian at the frequencies of
+    _mirrored_spectrum()."""
+    def _eigenvalues(n, num_freqs):
+        k = torch.arange(num_freqs, dtype=torch.float64, device=device)
+        return 4*torch.sin(math.pi*k/(2*n))**2
+
+    return _eigenvalues(height, 2*height).unsqueeze(1) + \
+        _eigenvalues(width, width+1).unsqueeze(0)
+
+
+def steady_state_surround(photoreceptor_frame, cs_lambda_pixels):
+    """Solve the steady state of the center surround diffuser directly.
+
+    The Euler steps of the instantaneous diffuser converge to the
+    surround h with (I - lambda^2 * L) h = p, where p is the photoreceptor
+    frame and L is the 4-neighbour Laplacian with replicated borders.
+    Mirroring p to a [2*height, 2*width] frame makes these borders
+    periodic, so the FFT diagonalizes L (a DCT of p) and the solution is
+    a division of the spectrum, in float64.
+
+    # Arguments
+        photoreceptor_frame: [height, width] tensor p.
+        cs_lambda_pixels: space constant of the surround in pixels.
+
+    # Returns
+        surround_frame: [height, width] tensor h, of the dtype of p.
+    """
+    height, width = photoreceptor_frame.shape
+    eigenvalues = _laplacian_eigenvalues(
+        height, width, photoreceptor_frame.device)
+    return _mirrored_frame(
+        _mirrored_spectrum(photoreceptor_frame) /
+        (1+cs_lambda_pixels**2*eigenvalues),
+        height, width, photoreceptor_frame.dtype)
+
+
+def integrate_surround(
+        surround_frame,
+        photoreceptor_frame,
+        cs_lambda_pixels,
+        cs_tau_p,
+        delta_time):
+    """Integrate the center surround diffuser over a frame exactly.
+
+    The diffuser dynamics
+    tau_p * dh/dt = p - h + lambda^2 * L h,
+    with the photoreceptor frame p held for the frame like the Euler steps
+    do, are a decoupled exponential decay of each frequency of h
+    to the steady state, see steady_state_surround():
+    h_k(t+dt) = hss_k + (h_k(t) - hss_k) * exp(-(1+lambda^2*l_k)*dt/tau_p).
+    This is stable for any time step and costs three FFTs per frame.
+
+    # Arguments
+        surround_frame: [height, width] tensor h at the previous frame.
+        photoreceptor_frame: [height, width] tensor p.
+        cs_lambda_pixels: space constant of the surround in pixels.
+        cs_tau_p: time constant of the photoreceptor center in seconds.
+        delta_time: time of the frame in seconds.
+
+    # Returns
+        surround_frame: [height, width] tensor h at the new frame,
+            of the dtype of surround_frame.
+    """
+    height, width = photoreceptor_frame.shape
+    rate = 1+cs_lambda_pixels**2*_laplacian_eigenvalues(
+        height, width, photoreceptor_frame.device)
+    steady_state = _mirrored_spectrum(photoreceptor_frame)/rate
+    decay = torch.exp(-rate*(delta_time/cs_tau_p))
+    return _mirrored_frame(
+        steady_state+(_mirrored_spectrum(surround_frame)-steady_state)*decay,
+        height, width, surround_frame.dtype)
+
+
 def compute_event_map(diff_frame, pos_thres, neg_thres):
     """Compute event map.
 
@@ -150,7 +250,605 @@ def compute_event_map(diff_frame, pos_thres, neg_thres):
     #  return pos_evts_cord_post, neg_evts_cord_post, max_events
 
 
-def generate_shot_noise(
+def fused_pixel_update(
+        new_frame,
+        lp_log_frame0,
+        lp_log_frame1,
+        base_log_frame,
+        diff_frame,
+        pos_thres,
+        neg_thres,
+        delta_time,
+        cutoff_hz=0,
+        leak_rate_hz=0,
+        leak_jitter_fraction=0,
+        noise_rate_array=None,
+        leak_rand=None,
+        return_inten01=False):
+    """Per-frame pixel front end in one function, to be compiled into
+    a fused kernel with torch.compile().
+
+    Does lin_log(), rescale_intensity_frame(), low_pass_filter(),
+    subtract_leak_current(), the difference to the base and
+    compute_event_map(), and updates the pixel states in place.
+
+    # Arguments
+        new_frame: [height, width] float64 new frame.
+        lp_log_frame0, lp_log_frame1: lowpass filter states, float64
+            if cutoff_hz>0, updated in place; if cutoff_hz>0 the new
+            states are lp_log_frame1, lp_log_frame0, i.e. the caller
+            must swap them.
+        base_log_frame: memorized log intensity, updated in place
+            by the leak.
+        diff_frame: difference of the input to base_log_frame,
+            written in place.
+        pos_thres, neg_thres: thresholds.
+        delta_time: time since the previous frame.
+        cutoff_hz, leak_rate_hz, leak_jitter_fraction, noise_rate_array:
+            see low_pass_filter() and subtract_leak_current().
+        leak_rand: standard normal leak jitter, see
+            subtract_leak_current(), not None if leak_rate_hz>0.
+        return_inten01: if True, also return the rescaled intensity.
+
+    # Returns
+        pos_evts_frame, neg_evts_frame: ON and OFF event counts,
+            see compute_event_map().
+        max_num_events: 0-dim tensor, the largest count of any pixel.
+        inten01: rescaled intensity if return_inten01 else None.
+    """
+    log_new_frame = lin_log(new_frame)
+    inten01 = rescale_intensity_frame(new_frame) \
+        if cutoff_hz > 0 or return_inten01 else None
+
+    new_lp_log_frame0, new_lp_log_frame1 = low_pass_filter(
+        log_new_frame=log_new_frame,
+        lp_log_frame0=lp_log_frame0,
+        lp_log_frame1=lp_log_frame1,
+        inten01=inten01,
+        delta_time=delta_time,
+        cutoff_hz=cutoff_hz)
+    if cutoff_hz > 0:
+        # the new 2nd stage is the previous 1st stage, so the new 1st stage
+        # goes to the buffer of the 2nd, and the caller swaps the buffers;
+        # copying the 1st stage to the 2nd in place is miscompiled by
+        # torch.compile() of pytorch 2.x
+        lp_log_frame1.copy_(new_lp_log_frame0)
+    else:
+        lp_log_frame0.copy_(new_lp_log_frame0)
+        lp_log_frame1.copy_(new_lp_log_frame1)
+
+    if leak_rate_hz > 0:
+        base_log_frame.copy_(subtract_leak_current(
+            base_log_frame=base_log_frame,
+            leak_rate_hz=leak_rate_hz,
+            delta_time=delta_time,
+            pos_thres=pos_thres,
+            leak_jitter_fraction=leak_jitter_fraction,
+            noise_rate_array=noise_rate_array,
+            rand=leak_rand))
+
+    diff_frame.copy_(
+        (lp_log_frame0 if cutoff_hz > 0 else lp_log_frame1)-base_log_frame)
+    pos_evts_frame, neg_evts_frame = compute_event_map(
+        diff_frame, pos_thres, neg_thres)
+    max_num_events = torch.maximum(pos_evts_frame.max(), neg_evts_frame.max())
+
+    return pos_evts_frame, neg_evts_frame, max_num_events, \
+        inten01 if return_inten01 else None
+
+
+def expand_event_counts(evts_frame):
+    """Expand a per-pixel event count map into one entry per event.
+
+    # Arguments
+        evts_frame: [height, width] int tensor of event counts per pixel.
+
+    # Returns
+        iters: int64 tensor, iteration index (0 .. count-1) of each event.
+        pixels: int64 tensor, flat (row-major) pixel index of each event.
+    """
+    counts = evts_frame.flatten()
+    pixels = counts.nonzero(as_tuple=True)[0]
+    counts = counts[pixels].long()
+
+    # e.g. counts=[2, 3] gives pixels=[p0, p0, p1, p1, p1]
+    # and iters=[0, 1, 0, 1, 2]
+    pixels = torch.repeat_interleave(pixels, counts)
+    starts = torch.cumsum(counts, dim=0)-counts
+    iters = torch.arange(pixels.shape[0], device=pixels.device) - \
+        torch.repeat_interleave(starts, counts)
+
+    return iters, pixels
+
+
+def shot_noise_keys(shot_cord):
+    """Returns the flat indices of the events of a dense or
+    sparse COO [num_iters, height, width] shot noise tensor."""
+    if not shot_cord.is_sparse:
+        return shot_cord.flatten().nonzero(as_tuple=True)[0]
+    _, height, width = shot_cord.shape
+    iters, ys, xs = shot_cord.coalesce().indices()
+    return (iters*height+ys)*width+xs
+
+
+def filter_refractory_events(
+        pos_iters,
+        pos_pixels,
+        neg_iters,
+        neg_pixels,
+        ts,
+        timestamp_mem,
+        refractory_period_s):
+    """Drop the events that are within the refractory period of the
+    previous event of their pixel.
+
+    Vectorized equivalent of the refractory filter of the iteration loop:
+    an event at iteration i is emitted only if
+    ts[i]-timestamp_mem > refractory_period_s, where timestamp_mem is the
+    time of the last emitted event of the pixel, carried over from
+    the previous frames. ON and OFF events of a pixel at the same
+    iteration are both emitted or both dropped.
+
+    The candidate iterations of each pixel form a segment of the sorted
+    (pixel, iteration) keys. Each candidate points to the first candidate
+    of its segment outside its refractory period, and the emitted
+    events are the chains of these pointers that start at the first
+    candidate outside the refractory period of timestamp_mem.
+    The chains are marked by pointer doubling, so the number of passes
+    grows with the logarithm of the number of candidates of a pixel.
+
+    # Arguments
+        pos_iters, pos_pixels: iteration and flat pixel index of
+            the ON events.
+        neg_iters, neg_pixels: iteration and flat pixel index of
+            the OFF events.
+        ts: [num_iters] float32 tensor of timestamps of the iterations.
+        timestamp_mem: float32 tensor of time of last event of each pixel,
+            updated in place.
+        refractory_period_s: refractory period in seconds.
+
+    # Returns
+        pos_iters, pos_pixels, neg_iters, neg_pixels of the emitted events.
+    """
+    num_iters = ts.shape[0]
+    device = ts.device
+    timestamp_mem = timestamp_mem.view(-1)
+
+    # candidate (pixel, iteration) nodes, sorted by pixel and iteration
+    keys, node_idx = torch.unique(torch.cat(
+        (pos_pixels*num_iters+pos_iters, neg_pixels*num_iters+neg_iters)),
+        return_inverse=True)
+    num_nodes = keys.shape[0]
+    if num_nodes == 0:
+        return pos_iters, pos_pixels, neg_iters, neg_pixels
+    node_pixels = keys // num_iters
+    node_iters = keys % num_iters
+
+    def _first_iter_after(t_last):
+        # first iteration k with ts[k]-t_last > refractory_period_s,
+        # the search is corrected to the exact float32 comparison
+        # of the loop
+        k = torch.searchsorted(ts, t_last+refractory_period_s, right=True)
+        while True:
+            prev = (k-1).clamp(min=0)
+            back = (k > 0) & (ts[prev]-t_last > refractory_period_s)
+            if not back.any():
+                break
+            k = torch.where(back, prev, k)
+        while True:
+            forward = (k < num_iters) & ~(
+                ts[k.clamp(max=num_iters-1)]-t_last > refractory_period_s)
+            if not forward.any():
+                break
+            k = torch.where(forward, k+1, k)
+        return k
+
+    def _next_node(pixels, k):
+        # first node of the pixel at or after iteration k,
+        # num_nodes if there is none
+        idx = torch.searchsorted(keys, pixels*num_iters+k)
+        found = (idx < num_nodes) & \
+            (node_pixels[idx.clamp(max=num_nodes-1)] == pixels)
+        return torch.where(found, idx, torch.full_like(idx, num_nodes))
+
+    # pointers to the next possible event, num_nodes is the end of chains
+    jump = torch.cat((
+        _next_node(node_pixels, _first_iter_after(ts[node_iters])),
+        torch.tensor([num_nodes], device=device)))
+
+    # first event of each pixel after its last event of previous frames
+    seg_first = torch.ones(num_nodes, dtype=torch.bool, device=device)
+    seg_first[1:] = node_pixels[1:] != node_pixels[:-1]
+    seg_pixels = node_pixels[seg_first]
+    start = _next_node(seg_pixels, _first_iter_after(timestamp_mem[seg_pixels]))
+
+    # after pass p, all nodes within 2**p-1 jumps of a start are marked
+    emitted = torch.zeros(num_nodes+1, dtype=torch.bool, device=device)
+    emitted[start] = True
+    seg_starts = seg_first.nonzero(as_tuple=True)[0]
+    max_seg_len = int(torch.diff(
+        seg_starts, append=torch.tensor([num_nodes], device=device)).max())
+    for _ in range(max_seg_len.bit_length()):
+        emitted[jump[emitted]] = True
+        jump = jump[jump]
+    emitted = emitted[:num_nodes]
+
+    # remember the last emitted event of each pixel
+    emitted_pixels = node_pixels[emitted]
+    emitted_iters = node_iters[emitted]
+    seg_last = torch.ones_like(emitted_pixels, dtype=torch.bool)
+    seg_last[:-1] = emitted_pixels[:-1] != emitted_pixels[1:]
+    timestamp_mem[emitted_pixels[seg_last]] = ts[emitted_iters[seg_last]]
+
+    keep = emitted[node_idx]
+    num_pos = pos_iters.shape[0]
+    keep_pos, keep_neg = keep[:num_pos], keep[num_pos:]
+    return pos_iters[keep_pos], pos_pixels[keep_pos], \
+        neg_iters[keep_neg], neg_pixels[keep_neg]
+
+
+def generate_event_columns(
+        pos_evts_frame,
+        neg_evts_frame,
+        ts,
+        shot_on_cord=None,
+        shot_off_cord=None,
+        timestamp_mem=None,
+        refractory_period_s=0,
+        shuffle=True,
+        shuffle_keys=None):
+    """Generate the events of all iterations of a frame in one pass,
+    as columns of iteration, pixel and polarity.
+
+    Vectorized equivalent of iterating over the
+    max_num_events_any_pixel sub-frame iterations:
+    ON events come before OFF events and each iteration is shuffled with
+    its own torch.randperm, so that the order is identical to the
+    iteration loop for the same random state.
+
+    The cost is proportional to the number of events rather than to the
+    number of iterations times the frame size.
+
+    # Arguments
+        pos_evts_frame: [height, width] int tensor of ON event counts.
+        neg_evts_frame: [height, width] int tensor of OFF event counts.
+        ts: [num_iters] float32 tensor of timestamps of the iterations.
+        shot_on_cord: None or [num_iters, height, width] bool tensor
+            (dense or sparse COO) of ON shot noise events.
+        shot_off_cord: None or [num_iters, height, width] bool tensor
+            (dense or sparse COO) of OFF shot noise events.
+        timestamp_mem: None or [height, width] float32 tensor of time of
+            last event of each pixel, to filter events with
+            refractory_period_s, see filter_refractory_events().
+        refractory_period_s: refractory period in seconds.
+        shuffle: if False, the events are not ordered and shuffled,
+            see shuffle_event_columns().
+        shuffle_keys: None or function of the columns that returns
+            random keys of the events, see shuffle_event_columns().
+
+    # Returns
+        columns: (iters, pixels, polarity) [N] int64 tensors of
+            iteration, flat pixel index and polarity (1 or -1)
+            of the events, or None if there are no events.
+        final_pos_evts_frame: [height, width] int32 tensor of
+            emitted ON events per pixel.
+        final_neg_evts_frame: [height, width] int32 tensor of
+            emitted OFF events per pixel.
+    """
+    height, width = pos_evts_frame.shape
+    num_pixels = height*width
+    num_iters = ts.shape[0]
+    device = pos_evts_frame.device
+
+    def _event_keys(evts_frame, shot_cord):
+        # key encodes (iteration, pixel) so that sorting the keys
+        # orders events like the iteration loop does
+        iters, pixels = expand_event_counts(evts_frame)
+        keys = iters*num_pixels+pixels
+        if shot_cord is not None:
+            # a shot noise event and a regular event at the same
+            # iteration result in only one event
+            keys = torch.cat((keys, shot_noise_keys(shot_cord)))
+            keys = torch.unique(keys)
+        return keys // num_pixels, keys % num_pixels
+
+    pos_iters, pos_pixels = _event_keys(pos_evts_frame, shot_on_cord)
+    neg_iters, neg_pixels = _event_keys(neg_evts_frame, shot_off_cord)
+
+    if timestamp_mem is not None:
+        pos_iters, pos_pixels, neg_iters, neg_pixels = \
+            filter_refractory_events(
+                pos_iters, pos_pixels, neg_iters, neg_pixels,
+                ts, timestamp_mem, refractory_period_s)
+
+    final_pos_evts_frame = torch.bincount(
+        pos_pixels, minlength=num_pixels).view(
+            height, width).type(torch.int32)
+    final_neg_evts_frame = torch.bincount(
+        neg_pixels, minlength=num_pixels).view(
+            height, width).type(torch.int32)
+
+    num_events = pos_pixels.shape[0]+neg_pixels.shape[0]
+    if num_events == 0:
+        return None, final_pos_evts_frame, final_neg_evts_frame
+
+    iters = torch.cat((pos_iters, neg_iters))
+    pixels = torch.cat((pos_pixels, neg_pixels))
+    polarity = torch.cat((
+        torch.ones_like(pos_pixels), -torch.ones_like(neg_pixels)))
+    columns = (iters, pixels, polarity)
+    if shuffle:
+        columns = shuffle_event_columns(
+            columns, num_iters, num_pixels, shuffle_keys)
+
+    return columns, final_pos_evts_frame, final_neg_evts_frame
+
+
+def shuffle_event_columns(columns, num_iters, num_pixels, shuffle_keys=None):
+    """Orders event columns like the iteration loop does.
+
+    The events are ordered by iteration, then ON before OFF, then pixel
+    (row-major), and the events of each iteration are shuffled with
+    their own torch.randperm (drawn on CPU like the iteration loop does),
+    or ordered by their random keys if shuffle_keys is given.
+
+    # Arguments
+        columns: (iters, pixels, polarity) [N] int64 tensors,
+            see generate_event_columns().
+        num_iters: number of sub-frame iterations.
+        num_pixels: number of pixels of the frame.
+        shuffle_keys: None or function of the ordered columns that returns
+            [N] int64 random keys in range 0..2**32-1, e.g.
+            CounterRNG.shuffle_keys(); events with equal keys keep
+            their order.
+
+    # Returns
+        columns: the ordered (iters, pixels, polarity).
+    """
+    iters, pixels, polarity = columns
+    order = torch.argsort(
+        (iters*2+(polarity < 0))*num_pixels+pixels)
+
+    if shuffle_keys is not None:
+        columns = iters[order], pixels[order], polarity[order]
+        order = torch.sort(
+            (columns[0] << 32)+shuffle_keys(columns), stable=True)[1]
+        return tuple(c[order] for c in columns)
+
+    iter_counts = torch.bincount(iters, minlength=num_iters).tolist()
+    perms = []
+    offset = 0
+    for n in iter_counts:
+        if n > 0:
+            perms.append(torch.randperm(n)+offset)
+            offset += n
+    order = order[torch.cat(perms).to(iters.device)]
+
+    return iters[order], pixels[order], polarity[order]
+
+
+def event_columns_to_list(columns, ts, width, event_ts=None):
+    """Returns the [N, 4] float32 tensor with rows
+    [timestamp, x, y, polarity] of event columns,
+    see generate_event_columns().
+    The timestamps are ts[iters], or event_ts if it is not None."""
+    iters, pixels, polarity = columns
+    events = torch.empty(
+        (iters.shape[0], 4), dtype=torch.float32, device=iters.device)
+    events[:, 0] = ts[iters] if event_ts is None else event_ts
+    events[:, 1] = pixels % width
+    events[:, 2] = pixels // width
+    events[:, 3] = polarity
+    return events
+
+
+def threshold_crossing_timestamps(
+        columns,
+        pos_evts_frame,
+        neg_evts_frame,
+        start_diff_frame,
+        diff_frame,
+        pos_thres,
+        neg_thres,
+        ts,
+        t_previous,
+        delta_time):
+    """Timestamps of events at the threshold crossings of their pixel.
+
+    The DVS input of a pixel is assumed to change linearly over the frame,
+    so its difference from the memorized brightness goes linearly from
+    start_diff_frame at t_previous to diff_frame at t_previous+delta_time.
+    The k'th event (iteration k-1) of a pixel with n ON events is at the
+    time this difference crosses k*pos_thres, and likewise for OFF events.
+    Events beyond the counts of the event maps are shot noise events, and
+    keep the timestamp ts of their iteration.
+
+    # Arguments
+        columns: (iters, pixels, polarity) event columns,
+            see generate_event_columns().
+        pos_evts_frame, neg_evts_frame: [height, width] int tensors of
+            ON and OFF event counts, see compute_event_map().
+        start_diff_frame: [height, width] tensor of the difference at
+            the previous frame.
+        diff_frame: [height, width] tensor of the difference at the frame.
+        pos_thres, neg_thres: scalar or [height, width] tensor thresholds.
+        ts: [num_iters] float32 tensor of timestamps of the iterations.
+        t_previous: time of the previous frame in float seconds.
+        delta_time: time of the frame in seconds.
+
+    # Returns
+        event_ts: [N] float64 tensor of the event timestamps,
+            between t_previous and t_previous+delta_time.
+    """
+    iters, pixels, polarity = columns
+    on = polarity > 0
+
+    def _of_events(on_value, off_value):
+        # per event value of the pixel maps of the polarity of the event
+        def _gather(value):
+            if torch.is_tensor(value) and value.dim() > 0:
+                return value.flatten()[pixels].double()
+            return torch.full_like(pixels, value, dtype=torch.float64)
+        return torch.where(on, _gather(on_value), -_gather(off_value))
+
+    # signed count and threshold level of the events
+    counts = _of_events(pos_evts_frame, neg_evts_frame)
+    levels = _of_events(pos_thres, neg_thres)*(iters+1)
+
+    start = start_diff_frame.flatten()[pixels].double()
+    change = diff_frame.flatten()[pixels].double()-start
+    # a level that was crossed already at the start, e.g. by the leak,
+    # is crossed at the start
+    crossing = (levels-start)/torch.where(
+        change != 0, change, torch.ones_like(change))
+    crossing = torch.where(change != 0, crossing.clamp(0, 1),
+                           torch.zeros_like(crossing))
+
+    event_ts = t_previous+delta_time*crossing
+    shot_noise = iters.double() >= counts.abs()
+    return torch.where(shot_noise, ts[iters].double(), event_ts)
+
+
+def generate_event_list(
+        pos_evts_frame,
+        neg_evts_frame,
+        ts,
+        shot_on_cord=None,
+        shot_off_cord=None,
+        timestamp_mem=None,
+        refractory_period_s=0,
+        shuffle_keys=None):
+    """Generate the events of all iterations of a frame in one pass.
+
+    The event of iteration i of a pixel gets timestamp ts[i],
+    the events are identical to the iteration loop for the same
+    random state. See generate_event_columns() for the arguments.
+
+    # Returns
+        events: [N, 4] float32 tensor with rows [timestamp, x, y, polarity],
+            or None if there are no events.
+        final_pos_evts_frame: [height, width] int32 tensor of
+            emitted ON events per pixel.
+        final_neg_evts_frame: [height, width] int32 tensor of
+            emitted OFF events per pixel.
+    """
+    width = pos_evts_frame.shape[1]
+    columns, final_pos_evts_frame, final_neg_evts_frame = \
+        generate_event_columns(
+            pos_evts_frame, neg_evts_frame, ts,
+            shot_on_cord=shot_on_cord,
+            shot_off_cord=shot_off_cord,
+            timestamp_mem=timestamp_mem,
+            refractory_period_s=refractory_period_s,
+            shuffle_keys=shuffle_keys)
+    if columns is None:
+        return None, final_pos_evts_frame, final_neg_evts_frame
+
+    events = event_columns_to_list(columns, ts, width)
+
+    return events, final_pos_evts_frame, final_neg_evts_frame
+
+
+def generate_uniform_events(
+        pos_evts_frame,
+        neg_evts_frame,
+        t_previous,
+        delta_time,
+        shot_on_cord=None,
+        shot_off_cord=None,
+        timestamp_mem=None,
+        refractory_period_s=0):
+    """Generate the events of a frame with the events of each pixel
+    spaced uniformly over the frame.
+
+    The k'th event (k=0..n-1) of a pixel with n ON events is at
+    t_previous+(k+1)*delta_time/n, and likewise for OFF events. The shot
+    noise event of iteration i of num_shot_iters=shot_on_cord.shape[0]
+    iterations is at t_previous+(i+1)*delta_time/num_shot_iters.
+    Time and memory are proportional to the number of events.
+
+    # Arguments
+        pos_evts_frame, neg_evts_frame: [height, width] int tensors of
+            ON and OFF event counts, see compute_event_map().
+        t_previous: time of the previous frame in float seconds.
+        delta_time: time of the frame in seconds.
+        shot_on_cord, shot_off_cord: None or dense or sparse COO
+            [num_shot_iters, height, width] bool tensors of
+            shot noise events, see generate_shot_noise_sparse().
+        timestamp_mem: float32 tensor of time of last event of each pixel,
+            updated in place if refractory_period_s>0.
+        refractory_period_s: refractory period in seconds,
+            see filter_refractory_events().
+
+    # Returns
+        events: [N, 4] float32 tensor with rows [timestamp, x, y, polarity],
+            sorted by time, or None if there are no events.
+        final_pos_evts_frame: [height, width] int32 tensor of
+            emitted ON events per pixel.
+        final_neg_evts_frame: [height, width] int32 tensor of
+            emitted OFF events per pixel.
+    """
+    height, width = pos_evts_frame.shape
+    num_pixels = height*width
+    device = pos_evts_frame.device
+
+    def _timestamps(evts_frame, shot_cord):
+        # pixels and float64 timestamps of the events of a polarity
+        iters, pixels = expand_event_counts(evts_frame)
+        counts = evts_frame.flatten()[pixels].double()
+        event_ts = t_previous+(iters+1).double()*delta_time/counts
+        if shot_cord is not None:
+            keys = shot_noise_keys(shot_cord)
+            shot_iters = keys // num_pixels
+            pixels = torch.cat((pixels, keys % num_pixels))
+            event_ts = torch.cat((
+                event_ts,
+                t_previous+(shot_iters+1).double() *
+                delta_time/shot_cord.shape[0]))
+        return pixels, event_ts.float()
+
+    pos_pixels, pos_ts = _timestamps(pos_evts_frame, shot_on_cord)
+    neg_pixels, neg_ts = _timestamps(neg_evts_frame, shot_off_cord)
+
+    if refractory_period_s > 0 and \
+            pos_pixels.shape[0]+neg_pixels.shape[0] > 0:
+        # the distinct event times serve as the iterations
+        # of the refractory filter
+        ts, iters = torch.unique(
+            torch.cat((pos_ts, neg_ts)), return_inverse=True)
+        num_pos = pos_pixels.shape[0]
+        pos_iters, pos_pixels, neg_iters, neg_pixels = \
+            filter_refractory_events(
+                iters[:num_pos], pos_pixels, iters[num_pos:], neg_pixels,
+                ts, timestamp_mem, refractory_period_s)
+        pos_ts, neg_ts = ts[pos_iters], ts[neg_iters]
+
+    final_pos_evts_frame = torch.bincount(
+        pos_pixels, minlength=num_pixels).int().view(height, width)
+    final_neg_evts_frame = torch.bincount(
+        neg_pixels, minlength=num_pixels).int().view(height, width)
+
+    num_events = pos_pixels.shape[0]+neg_pixels.shape[0]
+    if num_events == 0:
+        return None, final_pos_evts_frame, final_neg_evts_frame
+
+    events = torch.empty(
+        (num_events, 4), dtype=torch.float32, device=device)
+    pixels = torch.cat((pos_pixels, neg_pixels))
+    events[:, 0] = torch.cat((pos_ts, neg_ts))
+    events[:, 1] = pixels % width
+    events[:, 2] = pixels // width
+    events[:, 3] = 1
+    events[pos_pixels.shape[0]:, 3] = -1
+
+    # sort by time once, events at the same time in random order
+    events = events[torch.randperm(num_events, device=device)]
+    events = events[torch.sort(events[:, 0], stable=True)[1]]
+
+    return events, final_pos_evts_frame, final_neg_evts_frame
+
+
+def shot_noise_probabilities(
         shot_noise_rate_hz,
         delta_time,
         num_iters,
@@ -158,8 +856,11 @@ def generate_shot_noise(
         inten01,
         pos_thres_pre_prob,
         neg_thres_pre_prob):
-    """Generate shot noise.
+    """Returns the per-iteration shot noise probabilities of the pixels.
 
+    An ON event happens where a uniform random number is larger than
+    one_minus_shot_ON_prob, an OFF event where it is smaller than
+    shot_OFF_prob, see generate_shot_noise().
     """
     # new shot noise generator, generate for the entire batch
     shot_noise_factor = (
@@ -175,6 +876,25 @@ def generate_shot_noise(
         1 - shot_noise_factor*pos_thres_pre_prob
     shot_OFF_prob_this_sample = \
         shot_noise_factor*neg_thres_pre_prob
+    return one_minus_shot_ON_prob_this_sample, shot_OFF_prob_this_sample
+
+
+def generate_shot_noise(
+        shot_noise_rate_hz,
+        delta_time,
+        num_iters,
+        shot_noise_inten_factor,
+        inten01,
+        pos_thres_pre_prob,
+        neg_thres_pre_prob):
+    """Generate shot noise.
+
+    """
+    one_minus_shot_ON_prob_this_sample, shot_OFF_prob_this_sample = \
+        shot_noise_probabilities(
+            shot_noise_rate_hz, delta_time, num_iters,
+            shot_noise_inten_factor, inten01,
+            pos_thres_pre_prob, neg_thres_pre_prob)
 
     # for shot noise
     rand01 = torch.rand(
@@ -245,6 +965,197 @@ def generate_shot_noise(
     #  return shot_ON_cord, shot_OFF_cord
 
 
+def generate_shot_noise_sparse(
+        shot_noise_rate_hz,
+        delta_time,
+        num_iters,
+        shot_noise_inten_factor,
+        inten01,
+        pos_thres_pre_prob,
+        neg_thres_pre_prob):
+    """Generate shot noise by sampling only the noise events.
+
+    Same rates as generate_shot_noise(), but instead of drawing a random
+    number for each iteration and pixel, the number of candidate events is
+    drawn from a Poisson distribution with the largest rate of any pixel,
+    then only their iteration and pixel, which are accepted with the ratio
+    of the rate of the pixel to the largest rate (thinning).
+    ON and OFF events are thinned from the same candidates with one random
+    number, like the shared random number of generate_shot_noise(), so a
+    pixel makes at most one of them in an iteration.
+    Memory and time are proportional to the number of noise events.
+
+    # Arguments
+        shot_noise_rate_hz: shot noise rate in Hz.
+        delta_time: time of the frame in seconds.
+        num_iters: number of sub-frame iterations.
+        shot_noise_inten_factor: rate factor at intensity 1.
+        inten01: [height, width] tensor of intensity in range 0-1.
+        pos_thres_pre_prob, neg_thres_pre_prob: scalar or [height, width]
+            tensor of nominal to actual threshold ratio.
+
+    # Returns
+        shot_on_cord, shot_off_cord: sparse COO [num_iters, height, width]
+            bool tensors of ON and OFF shot noise events.
+    """
+    num_iters = int(num_iters)
+    height, width = inten01.shape
+    num_pixels = height*width
+    device = inten01.device
+
+    # probability of an event in one iteration of a pixel
+    # with intensity factor 1 and nominal threshold
+    shot_noise_prob = (shot_noise_rate_hz/2)*delta_time/num_iters
+
+    def _is_tensor(thres_pre_prob):
+        return torch.is_tensor(thres_pre_prob) and thres_pre_prob.dim() > 0
+
+    def _prob(thres_pre_prob, pixels, prob):
+        if _is_tensor(thres_pre_prob):
+            return prob*thres_pre_prob.reshape(-1)[pixels]
+        return prob*thres_pre_prob
+
+    # bound of the probability of an ON or OFF event of any pixel
+    max_prob = shot_noise_prob*max(shot_noise_inten_factor, 1)*sum(
+        float(thres_pre_prob.max()) if _is_tensor(thres_pre_prob)
+        else float(thres_pre_prob)
+        for thres_pre_prob in (pos_thres_pre_prob, neg_thres_pre_prob))
+
+    num_candidates = int(torch.poisson(torch.tensor(
+        max_prob*num_iters*num_pixels, dtype=torch.float64)))
+    iters = torch.randint(
+        num_iters, (num_candidates,), device=device)
+    pixels = torch.randint(
+        num_pixels, (num_candidates,), device=device)
+
+    prob = shot_noise_prob*(
+        (shot_noise_inten_factor-1)*inten01.reshape(-1)[pixels]+1)
+    on_prob = _prob(pos_thres_pre_prob, pixels, prob)
+    off_prob = _prob(neg_thres_pre_prob, pixels, prob)
+    u = torch.rand(
+        num_candidates, dtype=torch.float64, device=device)*max_prob
+    on = u < on_prob
+    accepted = u < on_prob+off_prob
+
+    # of the candidates at the same iteration and pixel, the first one
+    # makes the event
+    keys, inverse = torch.unique(
+        iters[accepted]*num_pixels+pixels[accepted], return_inverse=True)
+    first = torch.full(
+        keys.shape, inverse.shape[0], dtype=torch.long,
+        device=device).scatter_reduce(
+            0, inverse, torch.arange(inverse.shape[0], device=device),
+            reduce='amin')
+    on = on[accepted][first]
+
+    def _sparse_cord(polarity_keys):
+        event_pixels = polarity_keys % num_pixels
+        indices = torch.stack((
+            polarity_keys // num_pixels, event_pixels // width,
+            event_pixels % width))
+        return torch.sparse_coo_tensor(
+            indices,
+            torch.ones(indices.shape[1], dtype=torch.bool, device=device),
+            size=(num_iters, height, width),
+            is_coalesced=True,
+            check_invariants=False)
+
+    return _sparse_cord(keys[on]), _sparse_cord(keys[~on])
+
+
+def generate_shot_noise_counter(
+        counter_rng,
+        frame,
+        pixels,
+        shot_noise_rate_hz,
+        delta_time,
+        num_iters,
+        shot_noise_inten_factor,
+        inten01,
+        pos_thres_pre_prob,
+        neg_thres_pre_prob):
+    """Generate shot noise from counter-based random numbers.
+
+    Same rates as generate_shot_noise(), but the iterations of the events
+    of a pixel are sampled one after the other from geometrically
+    distributed gaps, where the j'th gap of the ON and OFF events of
+    a pixel come from the words 0 and 1 of block j of its SHOT_STREAM
+    random numbers of the frame. The events of a pixel thus depend only
+    on (seed, pixel, frame), not on the other pixels, and the cost is
+    proportional to the number of pixels plus noise events.
+    Unlike generate_shot_noise(), ON and OFF events are drawn
+    independently, so a pixel can make both in one iteration, with the
+    product of their small probabilities.
+
+    # Arguments
+        counter_rng: CounterRNG.
+        frame: frame number.
+        pixels: int64 tensor of the flat pixel indices of the full frame
+            of the pixels of inten01, the keys of their random numbers.
+        shot_noise_rate_hz, delta_time, num_iters, shot_noise_inten_factor,
+        inten01, pos_thres_pre_prob, neg_thres_pre_prob:
+            see generate_shot_noise_sparse().
+
+    # Returns
+        shot_on_cord, shot_off_cord: sparse COO [num_iters, height, width]
+            bool tensors of ON and OFF shot noise events.
+    """
+    num_iters = int(num_iters)
+    height, width = inten01.shape
+    num_pixels = height*width
+    device = inten01.device
+
+    one_minus_shot_ON_prob, shot_OFF_prob = shot_noise_probabilities(
+        shot_noise_rate_hz, delta_time, num_iters,
+        shot_noise_inten_factor, inten01,
+        pos_thres_pre_prob, neg_thres_pre_prob)
+    prob = torch.stack(torch.broadcast_tensors(
+        1-one_minus_shot_ON_prob, shot_OFF_prob)).reshape(2, -1)
+    # log of the probability of no event in an iteration
+    log_no_event = torch.log1p(-prob.double().clamp(0, 1))
+    no_noise = log_no_event == 0
+    pixels = pixels.reshape(-1)
+
+    # iteration of the last event of each polarity and pixel,
+    # num_iters or more once there are no more
+    last_iter = torch.full(
+        (2, num_pixels), -1., dtype=torch.float64, device=device)
+    candidates = torch.arange(num_pixels, device=device)
+    keys = [[], []]
+    block = 0
+    while candidates.shape[0] > 0:
+        u = counter_rng.uniform_block(
+            pixels[candidates], frame, SHOT_STREAM, block)[:2].double()
+        previous = last_iter[:, candidates]
+        gap = torch.floor(torch.log(u)/log_no_event[:, candidates])
+        gap.masked_fill_(no_noise[:, candidates], math.inf)
+        next_iter = torch.where(
+            previous < num_iters, previous+1+gap, previous)
+        last_iter[:, candidates] = next_iter
+        hits = next_iter < num_iters
+        for polarity in range(2):
+            hit = hits[polarity]
+            keys[polarity].append(
+                next_iter[polarity][hit].long()*num_pixels+candidates[hit])
+        candidates = candidates[hits.any(0)]
+        block += 1
+
+    def _sparse_cord(polarity_keys):
+        polarity_keys = torch.unique(torch.cat(polarity_keys))
+        event_pixels = polarity_keys % num_pixels
+        indices = torch.stack((
+            polarity_keys // num_pixels, event_pixels // width,
+            event_pixels % width))
+        return torch.sparse_coo_tensor(
+            indices,
+            torch.ones(indices.shape[1], dtype=torch.bool, device=device),
+            size=(num_iters, height, width),
+            is_coalesced=True,
+            check_invariants=False)
+
+    return _sparse_cord(keys[0]), _sparse_cord(keys[1])
+
+
 if __name__ == "__main__":
 
     temp_input = torch.randint(0, 256, (1280, 720), dtype=torch.float32).cuda()
@@ -0,0 +1,104 @@
+"""Reusable buffer of DVS events in a compact record format.
+
+The emulator writes the events of each frame (or block of frames) into an
+EventArena and hands views of it to the AEDAT-2.0, text and HDF5 outputs,
+instead of allocating [N, 4] float32 arrays.
+Timestamps are integer microseconds, so they stay exact for
+recordings of any duration.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# compact event record, 13 bytes instead of 16 bytes of [t, x, y, p] float32
+EVENT_DTYPE = np.dtype([
+    ('t', np.int64),  # timestamp in us
+    ('x', np.uint16),
+    ('y', np.uint16),
+    ('p', np.int8)])  # polarity, 1 for ON and -1 for OFF
+
+
+def is_event_records(events):
+    """Returns True if events is an array of EVENT_DTYPE records."""
+    return isinstance(events, np.ndarray) and events.dtype == EVENT_DTYPE
+
+
+def records_to_events(records):
+    """Converts EVENT_DTYPE records to the [N, 4] float64 array
+    with rows [timestamp in s, x, y, polarity] used by the renderer.
+    """
+    events = np.empty((records.shape[0], 4), dtype=np.float64)
+    events[:, 0] = records['t']*1e-6
+    events[:, 1] = records['x']
+    events[:, 2] = records['y']
+    events[:, 3] = records['p']
+    return events
+
+
+class EventArena:
+    """Growable buffer of EVENT_DTYPE records that is reused between frames.
+
+    The buffer grows by doubling and is never shrunk, so after the first
+    busy frames no more memory is allocated.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        """
+        Parameters
+        ----------
+        capacity: int
+            initial number of events that the arena can hold.
+        """
+        self._buffer = np.empty(capacity, dtype=EVENT_DTYPE)
+        self.num_events = 0
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    def clear(self):
+        """Empties the arena, keeping its memory."""
+        self.num_events = 0
+
+    def _reserve(self, num_events):
+        if num_events <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < num_events:
+            capacity *= 2
+        logger.debug(
+            f'growing event arena from {self.capacity} to {capacity} events')
+        buffer = np.empty(capacity, dtype=EVENT_DTYPE)
+        buffer[:self.num_events] = self._buffer[:self.num_events]
+        self._buffer = buffer
+
+    def append(self, t, x, y, p):
+        """Appends events given as columns.
+
+        Parameters
+        ----------
+        t: torch.Tensor or np.ndarray
+            [N] timestamps in us.
+        x, y: torch.Tensor or np.ndarray
+            [N] addresses.
+        p: torch.Tensor or np.ndarray
+            [N] polarities, 1 for ON and -1 for OFF.
+        """
+        n = t.shape[0]
+        self._reserve(self.num_events+n)
+        records = self._buffer[self.num_events:self.num_events+n]
+        for name, column in (('t', t), ('x', x), ('y', y), ('p', p)):
+            if not isinstance(column, np.ndarray):
+                column = column.cpu().numpy()
+            records[name] = column
+        self.num_events += n
+
+    def events(self, start=0):
+        """Returns a view of the events from start to the end.
+
+        The view is only valid until the arena is cleared or appended to,
+        copy it to keep the events.
+        """
+        return self._buffer[start:self.num_events]
@@ -0,0 +1,277 @@
+"""
+Streams of frames between the stages of v2e --streaming.
+
+With --streaming, the video frames are not written to the temporary
+source frame and interpolated frame folders: the decoding, the crop,
+resize and luma conversion, the SloMo interpolation, the emulation and
+the rendering of the events to the DVS video run at the same time,
+connected by bounded queues, so that the conversion takes about the time
+of the slowest stage instead of the sum of all stages:
+
+- FrameStream runs a source generator, e.g. the SloMo interpolation, in
+  a thread and hands its items to the next stage over a queue.
+- ordered_map() applies a function, e.g. the luma conversion, to the
+  items of a stream in several threads and yields the results in the
+  order of the items, i.e. by frame number.
+- FrameSink consumes items, e.g. the events to render, in a thread.
+
+Each queue holds at most max_size items: a stage whose queue is full
+waits (backpressure), so at most max_size frames of each stage wait in
+memory. The threads run the torch, numpy and OpenCV code, which release
+the GIL.
+
+Each queue counts its items, its depth after each hand-off, the time
+the producer waited because the queue was full and the time the consumer
+waited because it was empty. log_stream_metrics() logs them: the stage
+after a queue whose producer waits most of the time is the bottleneck,
+and so is the stage before a queue whose consumer waits. With
+--profile_stages, the queue depths are also recorded as counters.
+"""
+import collections
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from v2ecore.stage_profiler import counter
+
+logger = logging.getLogger(__name__)
+
+# marks the end of the frames of a stream
+_END = object()
+
+
+class _StreamError(object):
+    """Exception raised by the source of a stream, raised again in the
+    consumer."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _BoundedQueue(object):
+    """Queue between two stages that records its metrics."""
+
+    def __init__(self, name, max_size):
+        if max_size < 1:
+            raise ValueError(
+                'max_size={} of stream {} must be at least 1'.format(
+                    max_size, name))
+        self.name = name
+        self.max_size = max_size
+        self.queue = queue.Queue(maxsize=max_size)
+        self.stopped = threading.Event()
+        self.num_items = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.put_wait_s = 0.
+        self.get_wait_s = 0.
+
+    def _put(self, item):
+        """Puts item in the queue, waits while it is full.
+
+        Returns
+        -------
+        False if the stream was closed.
+        """
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self.put_wait_s += time.perf_counter() - start
+            if item is not _END:
+                depth = self.queue.qsize()
+                self.num_items += 1
+                self.depth_sum += depth
+                self.max_depth = max(self.max_depth, depth)
+                counter(self.name + '_queue', depth=depth)
+            return True
+        return False
+
+    def _get(self):
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.get_wait_s += time.perf_counter() - start
+        return item
+
+    def metrics(self):
+        """Returns the metrics of the queue.
+
+        Returns
+        -------
+        dict
+            name, items: number of items, mean_depth and max_depth:
+            number of items in the queue after each hand-off, max_size,
+            producer_wait_s: time the producer waited for room in the
+            queue, consumer_wait_s: time the consumer waited for items.
+        """
+        return {
+            'name': self.name, 'items': self.num_items,
+            'mean_depth':
+                self.depth_sum / self.num_items if self.num_items else 0.,
+            'max_depth': self.max_depth, 'max_size': self.max_size,
+            'producer_wait_s': self.put_wait_s,
+            'consumer_wait_s': self.get_wait_s}
+
+
+class FrameStream(_BoundedQueue):
+    """Iterates the items of a source in a thread, see the module
+    documentation.
+    """
+
+    def __init__(self, name, source, max_size=64):
+        """
+        Parameters
+        ----------
+        name: str
+            stage name, for the thread name, logging and metrics.
+        source: iterable
+            the items of the stream, e.g. a generator of frames.
+        max_size: int
+            the number of items that can wait in the queue; the source
+            blocks when the queue is full.
+        """
+        super().__init__(name, max_size)
+        self.source = source
+        self.thread = threading.Thread(
+            target=self._run, name='v2e-{}'.format(name), daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for item in self.source:
+                if not self._put(item):
+                    return
+        except BaseException as e:  # also SystemExit of v2e_quit()
+            self._put(_StreamError(e))
+            return
+        self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._get()
+            if item is _END:
+                return
+            if isinstance(item, _StreamError):
+                logger.error('stream {} failed: {}'.format(
+                    self.name, item.exception))
+                raise item.exception
+            yield item
+
+    def close(self):
+        """Stops the source thread, e.g. when the consumer stops early."""
+        self.stopped.set()
+        self.thread.join(timeout=1)
+
+
+class FrameSink(_BoundedQueue):
+    """Passes items to a consumer function that runs in a thread, see the
+    module documentation.
+    """
+
+    def __init__(self, name, consumer, max_size=64):
+        """
+        Parameters
+        ----------
+        name: str
+            stage name, for the thread name, logging and metrics.
+        consumer: callable
+            called with each item, in the order of put().
+        max_size: int
+            the number of items that can wait in the queue; put() blocks
+            when the queue is full.
+        """
+        super().__init__(name, max_size)
+        self.consumer = consumer
+        self.error = None
+        self.thread = threading.Thread(
+            target=self._run, name='v2e-{}'.format(name), daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._get()
+                if item is _END:
+                    return
+                self.consumer(item)
+        except BaseException as e:
+            self.error = e
+            # unblock put() and close()
+            self.stopped.set()
+
+    def put(self, item):
+        """Passes item to the consumer, waits while the queue is full.
+
+        Raises the exception of the consumer if it failed.
+        """
+        if not self._put(item):
+            self._raise()
+
+    def close(self):
+        """Waits until the consumer has consumed all items and stops its
+        thread. Raises the exception of the consumer if it failed."""
+        if self._put(_END):
+            self.thread.join()
+        self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            logger.error('stream {} failed: {}'.format(self.name, self.error))
+            raise self.error
+
+
+def ordered_map(fn, items, workers=1, max_size=64):
+    """Applies fn to the items in worker threads.
+
+    Parameters
+    ----------
+    fn: callable
+        called with each item.
+    items: iterable
+        the items, e.g. a FrameStream.
+    workers: int
+        number of threads; with 1, fn is called in the thread that
+        iterates the results.
+    max_size: int
+        maximum number of items that are submitted to the workers and
+        not yet yielded.
+
+    Returns
+    -------
+    generator
+        the results of fn in the order of the items.
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='v2e-map') as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= max_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def log_stream_metrics(streams):
+    """Logs the metrics of the queues between the stages, see
+    _BoundedQueue.metrics()."""
+    lines = ['{:>10s} {:>8s} {:>11s} {:>10s} {:>15s} {:>15s}'.format(
+        'queue', 'items', 'mean depth', 'max depth', 'producer wait',
+        'consumer wait')]
+    for stream in streams:
+        m = stream.metrics()
+        lines.append(
+            '{:>10s} {:8d} {:11.1f} {:>10s} {:14.3f}s {:14.3f}s'.format(
+                m['name'], m['items'], m['mean_depth'],
+                '{}/{}'.format(m['max_depth'], m['max_size']),
+                m['producer_wait_s'], m['consumer_wait_s']))
+    logger.info('frames waiting between the streaming stages:\n{}'.format(
+        '\n'.join(lines)))
@@ -3,6 +3,8 @@ import logging
 from engineering_notation import EngNumber  # only from pip
 import atexit
 
+from v2ecore.event_arena import is_event_records
+
 logger = logging.getLogger(__name__)
 
 class DVSTextOutput:
@@ -22,13 +24,17 @@ class DVSTextOutput:
         0.000148001 192 79 1
     '''
 
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, append=False):
         self.filepath = filepath
         # edit below to match your device from https://inivation.com/support/software/fileformat/#aedat-20
         self.numEventsWritten = 0
         logging.info('opening text DVS output file {}'.format(filepath))
-        self.file = open(filepath, 'w')
-        self._writeHeader()
+        if append: # existing file, e.g. to truncate() it to a checkpoint offset
+            self.file = open(filepath, 'r+')
+            self.file.seek(0, 2)  # to end of file
+        else:
+            self.file = open(filepath, 'w')
+            self._writeHeader()
         atexit.register(self.cleanup)
         self.flipx=False # set both flipx and flipy to rotate TODO replace with rotate180
         self.flipy=False
@@ -44,6 +50,17 @@ class DVSTextOutput:
             self.file.close()
             self.file = None
 
+    def offset(self):
+        """Returns the current end of the file and the event count, to truncate() to later"""
+        self.file.flush()
+        return {'position': self.file.tell(), 'numEventsWritten': self.numEventsWritten}
+
+    def truncate(self, offset):
+        """Drops all data written after offset()"""
+        self.file.seek(offset['position'])
+        self.file.truncate()
+        self.numEventsWritten = offset['numEventsWritten']
+
     def _writeHeader(self):
         import datetime, time, getpass
         date = datetime.datetime.now().strftime('# Creation time: %I:%M%p %B %d %Y\n')  # Tue Jan 26 13:57:06 CET 2016
@@ -65,12 +82,19 @@ class DVSTextOutput:
         if len(events) == 0:
             return
         n = events.shape[0]
-        t = (events[:, 0]).astype(np.float)
-        x = events[:, 2].astype(np.int32) # Issue #37, thanks Mohsi Jawaid
+        if is_event_records(events):
+            # compact records from the emulator's event arena, t in us
+            t = events['t'] * 1e-6
+            x = events['y'].astype(np.int32) # same columns as below
+            y = events['x'].astype(np.int32)
+            p = (events['p'] > 0).astype(np.int32)
+        else:
+            t = (events[:, 0]).astype(np.float64)
+            x = events[:, 2].astype(np.int32) # Issue #37, thanks Mohsi Jawaid
+            y = events[:, 1].astype(np.int32)
+            p = ((events[:, 3] + 1) / 2).astype(np.int32) # go from -1/+1 to 0,1
         if self.flipx: x = (self.sizex - 1) - x  # 0 goes to sizex-1
-        y = events[:, 1].astype(np.int32)
         if self.flipy: y = (self.sizey - 1) - y
-        p = ((events[:, 3] + 1) / 2).astype(np.int32) # go from -1/+1 to 0,1
         for i in range(n):
             self.file.write('{} {} {} {}\n'.format(t[i],x[i],y[i],p[i])) # todo there must be vector way
         self.numEventsWritten += n
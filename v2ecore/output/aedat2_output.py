@@ -4,6 +4,7 @@ from engineering_notation import EngNumber  # only from pip
 import atexit
 import struct
 
+from v2ecore.event_arena import is_event_records
 from v2ecore.v2e_utils import v2e_quit
 
 logger = logging.getLogger(__name__)
@@ -16,7 +17,7 @@ class AEDat2Output:
 
     SUPPORTED_SIZES=((640,480),(346,260),(240,180))
 
-    def __init__(self, filepath: str, output_width=346, output_height=240):
+    def __init__(self, filepath: str, output_width=346, output_height=240, append=False):
         """
 
         Parameters
@@ -24,6 +25,7 @@ class AEDat2Output:
         filepath - full path to output AEDAT file, including ".aedat" or ".aedat2" extension
         output_width - the width of output address space
         output_height - the height of output address space
+        append - open existing file for appending, e.g. to truncate() it to a checkpoint offset
         """
         self.filepath = filepath
         self.file=None
@@ -76,8 +78,12 @@ class AEDat2Output:
         self.numOffEvents=0
         logging.info('opening AEDAT-2.0 output file {} in binary mode'.format(filepath))
         try:
-            self.file = open(filepath, 'wb')
-            self._writeHeader()
+            if append:
+                self.file = open(filepath, 'r+b')
+                self.file.seek(0, 2)  # to end of file
+            else:
+                self.file = open(filepath, 'wb')
+                self._writeHeader()
             atexit.register(self.cleanup)
             logger.info('opened {} for DVS output data for jAER'.format(filepath))
         except OSError as err:
@@ -98,6 +104,22 @@ class AEDat2Output:
             self.file.close()
             self.file = None
 
+    def offset(self):
+        """Returns the current end of the file and the event counts, to truncate() to later"""
+        self.file.flush()
+        return {'position': self.file.tell(),
+                'numEventsWritten': self.numEventsWritten,
+                'numOnEvents': self.numOnEvents,
+                'numOffEvents': self.numOffEvents}
+
+    def truncate(self, offset):
+        """Drops all data written after offset()"""
+        self.file.seek(offset['position'])
+        self.file.truncate()
+        self.numEventsWritten = offset['numEventsWritten']
+        self.numOnEvents = offset['numOnEvents']
+        self.numOffEvents = offset['numOffEvents']
+
     def _writeHeader(self):
         import datetime, time, getpass
         # CRLF \r\n is needed to not break header parsing in jAER
@@ -122,12 +144,19 @@ class AEDat2Output:
         if len(events) == 0:
             return
         n = events.shape[0]
-        t = (1e6 * events[:, 0]).astype(np.int32)   # to us from seconds
-        x = events[:, 1].astype(np.int32)
+        if is_event_records(events):
+            # compact records from the emulator's event arena, already in us
+            t = events['t'].astype(np.int32)
+            x = events['x'].astype(np.int32)
+            y = events['y'].astype(np.int32)
+            p = (events['p'] > 0).astype(np.int32)
+        else:
+            t = np.round(1e6 * events[:, 0]).astype(np.int32)   # to us from seconds, rounded like the records
+            x = events[:, 1].astype(np.int32)
+            y = events[:, 2].astype(np.int32)
+            p = ((events[:, 3] + 1) / 2).astype(np.int32) # 0=off, 1=on
         if self.flipx: x = (self.sizex - 1) - x  # 0 goes to sizex-1
-        y = events[:, 2].astype(np.int32)
         if self.flipy: y = (self.sizey - 1) - y
-        p = ((events[:, 3] + 1) / 2).astype(np.int32) # 0=off, 1=on
 
         a = (x << self.xShiftBits | y << self.yShiftBits | p << self.polShiftBits)
         out = np.empty(2 * n, dtype=np.int32)
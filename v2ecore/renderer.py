@@ -10,6 +10,7 @@ from enum import Enum
 from numba import jit, njit
 
 from v2ecore.emulator import EventEmulator
+from v2ecore.stage_profiler import profiled
 from v2ecore.v2e_utils import video_writer, read_image, checkAddSuffix, v2e_quit
 from v2ecore.v2e_utils import hist2d_numba_seq
 
@@ -158,6 +159,7 @@ class EventRenderer(object):
                 self.video_output_file_name)
             self.frame_times_output_file.write(s)
 
+    @profiled('render_events')
     def render_events_to_frames(self, event_arr: np.ndarray,
                                 height: int, width: int,
                                 return_frames=False) -> np.ndarray:
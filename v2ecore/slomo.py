@@ -20,6 +20,7 @@ import torchvision.transforms as transforms
 from v2ecore.v2e_utils import video_writer, v2e_quit
 import v2ecore.dataloader as dataloader
 import v2ecore.model as model
+from v2ecore.stage_profiler import profiled, stage
 
 from PIL import Image
 import logging
@@ -262,6 +263,113 @@ class SuperSloMo(object):
 
         return flow_estimator, warper, interpolator
 
+    def _upsampling_factor(self, flowOut):
+        """Return the upsampling factor of a batch of frames.
+
+        Parameters
+        ----------
+        flowOut: torch.Tensor
+            [batch, 4, H, W] optical flow from frame0 to frame1
+            and from frame1 to frame0.
+
+        Returns
+        -------
+        int, at least 2.
+        """
+        if self.auto_upsample:
+            # compute automatic sample time from maximum flow magnitude such that
+            #                 #  dt(s)*speed(pix/s)=1pix,
+            #                 #  i.e., dt(s)=1pix/speed(pix/s)
+            # we have no time here, so our flow is computed in pixels of motion between frames
+            # we need to compute speed, so first compute the sum square of x and y vel components
+            vFlat=torch.flatten(flowOut,2,3) # [batch, [v01x, v01y, v10x, v10y] ]
+            vx0=vFlat[:,0,:]
+            vx1=vFlat[:,2,:]
+            vy0=vFlat[:,1,:]
+            vy1=vFlat[:,3,:]
+            sp0=torch.sqrt(vx0*vx0+vy0*vy0)
+            sp1=torch.sqrt(vx1*vx1+vy1*vy1)
+            sp=torch.cat((sp0,sp1),1)
+            maxSpeed= torch.max(torch.max(sp,dim=1)[0]).cpu().item() # this is maximimum movement between frames in pixels dim [batch]
+            # dim=1 gets max over all pixels
+            # [0] gets value of max, rather than idx which would be 1
+            # outer max get max over entire batch
+            # .cpu() moves to cpu to get actual value as float
+            # outer .item() gets first element of 0-dim tensor which is the speed
+            upsampling_factor=int(np.ceil(maxSpeed)) # use ceil to ensure oversampling. compute overall maximum needed upsampling ratio
+            # it is shared over all frames in batch so just use max value for all of them
+            # logger.info('upsampling factor={}'.format(upsampling_factor))
+            if self.upsampling_factor is not None and self.upsampling_factor>upsampling_factor:
+                upsampling_factor=self.upsampling_factor
+            if self.upsampling_reports_left>0:
+                logger.info('upsampled by factor {}'.format(upsampling_factor))
+                self.upsampling_reports_left-=1
+        else:
+            upsampling_factor=self.upsampling_factor
+
+        if upsampling_factor<2:
+            logger.warning('upsampling_factor was less than 2 (maybe very slow motion caused this); set it to 2')
+            upsampling_factor=2
+        return upsampling_factor
+
+    def _intermediate_frames(self, I0, I1, F_0_1, F_1_0, upsampling_factor):
+        """Generate the intermediate frames of a batch of frame pairs.
+
+        Parameters
+        ----------
+        I0, I1: torch.Tensor
+            [batch, 1, H, W] frame0 and frame1 batches.
+        F_0_1, F_1_0: torch.Tensor
+            [batch, 2, H, W] optical flows from frame0 to frame1
+            and from frame1 to frame0.
+        upsampling_factor: int
+            number of intermediate frames of each pair.
+
+        Returns
+        -------
+        generator of (intermediateIndex, Ft_p), Ft_p is the
+            [batch, 1, H, W] batch of intermediate frames.
+        """
+        for intermediateIndex in range(0, upsampling_factor):
+            t = (intermediateIndex + 0.5) / upsampling_factor
+            temp = -t * (1 - t)
+            fCoeff = [temp, t * t, (1 - t) * (1 - t), temp]
+
+            F_t_0 = fCoeff[0] * F_0_1 + fCoeff[1] * F_1_0
+            F_t_1 = fCoeff[2] * F_0_1 + fCoeff[3] * F_1_0
+
+            g_I0_F_t_0 = self.warper(I0, F_t_0)
+            g_I1_F_t_1 = self.warper(I1, F_t_1)
+
+            intrpOut = self.interpolator(
+                torch.cat(
+                    (I0, I1, F_0_1, F_1_0,
+                     F_t_1, F_t_0, g_I1_F_t_1,
+                     g_I0_F_t_0), dim=1))
+
+            F_t_0_f = intrpOut[:, :2, :, :] + F_t_0
+            F_t_1_f = intrpOut[:, 2:4, :, :] + F_t_1
+            V_t_0 = torch.sigmoid(intrpOut[:, 4:5, :, :])
+            V_t_1 = 1 - V_t_0
+
+            g_I0_F_t_0_f = self.warper(I0, F_t_0_f)
+            g_I1_F_t_1_f = self.warper(I1, F_t_1_f)
+
+            wCoeff = [1 - t, t]
+
+            Ft_p = (wCoeff[0] * V_t_0 * g_I0_F_t_0_f +
+                    wCoeff[1] * V_t_1 * g_I1_F_t_1_f) / \
+                   (wCoeff[0] * V_t_0 + wCoeff[1] * V_t_1)
+
+            yield intermediateIndex, Ft_p
+
+    def _output_image(self, frame, ori_dim):
+        """Return an interpolated [1, H, W] frame as PIL image
+        of the original size ori_dim (width, height)."""
+        img = self.to_image(frame.cpu().detach())
+        return img.resize(ori_dim, Image.BILINEAR)
+
+    @profiled('slomo_interpolate')
     def interpolate(self, source_frame_path, output_folder, frame_size):
         """Run interpolation. \
             Interpolated frames will be saved in folder self.output_folder.
@@ -336,7 +444,7 @@ class SuperSloMo(object):
                 ori_dim[0], frame_rate=self.avi_frame_rate
             )
 
-        numUpsamplingReportsLeft=3 # number of times to report automatic upsampling
+        self.upsampling_reports_left=3 # number of times to report automatic upsampling
 
         # prepare preview
         if self.preview:
@@ -374,7 +482,8 @@ class SuperSloMo(object):
                 # actual number of frames, account for < batch_size
                 num_batch_frames = I0.shape[0]
 
-                flowOut = self.flow_estimator(torch.cat((I0, I1), dim=1))
+                with stage('slomo_flow', batch_frames=num_batch_frames):
+                    flowOut = self.flow_estimator(torch.cat((I0, I1), dim=1))
                 F_0_1 = flowOut[:, :2, :, :] # flow from 0 to 1
                 F_1_0 = flowOut[:, 2:, :, :] # flow from 1 to 0
                 # dimensions [batch, flow[vx,vy], loc_x,loc_y]
@@ -382,41 +491,7 @@ class SuperSloMo(object):
                 if self.preview:
                     start_frame_count = outputFrameCounter
 
-                # compute the upsampling factor
-                if self.auto_upsample:
-                    # compute automatic sample time from maximum flow magnitude such that
-                    #                 #  dt(s)*speed(pix/s)=1pix,
-                    #                 #  i.e., dt(s)=1pix/speed(pix/s)
-                    # we have no time here, so our flow is computed in pixels of motion between frames
-                    # we need to compute speed, so first compute the sum square of x and y vel components
-                    vFlat=torch.flatten(flowOut,2,3) # [batch, [v01x, v01y, v10x, v10y] ]
-                    vx0=vFlat[:,0,:]
-                    vx1=vFlat[:,2,:]
-                    vy0=vFlat[:,1,:]
-                    vy1=vFlat[:,3,:]
-                    sp0=torch.sqrt(vx0*vx0+vy0*vy0)
-                    sp1=torch.sqrt(vx1*vx1+vy1*vy1)
-                    sp=torch.cat((sp0,sp1),1)
-                    maxSpeed= torch.max(torch.max(sp,dim=1)[0]).cpu().item() # this is maximimum movement between frames in pixels dim [batch]
-                    # dim=1 gets max over all pixels
-                    # [0] gets value of max, rather than idx which would be 1
-                    # outer max get max over entire batch
-                    # .cpu() moves to cpu to get actual value as float
-                    # outer .item() gets first element of 0-dim tensor which is the speed
-                    upsampling_factor=int(np.ceil(maxSpeed)) # use ceil to ensure oversampling. compute overall maximum needed upsampling ratio
-                    # it is shared over all frames in batch so just use max value for all of them
-                    # logger.info('upsampling factor={}'.format(upsampling_factor))
-                    if self.upsampling_factor is not None and self.upsampling_factor>upsampling_factor:
-                        upsampling_factor=self.upsampling_factor
-                    if numUpsamplingReportsLeft>0:
-                        logger.info('upsampled by factor {}'.format(upsampling_factor))
-                        numUpsamplingReportsLeft-=1
-                else:
-                    upsampling_factor=self.upsampling_factor
-
-                if upsampling_factor<2:
-                    logger.warning('upsampling_factor was less than 2 (maybe very slow motion caused this); set it to 2')
-                    upsampling_factor=2
+                upsampling_factor = self._upsampling_factor(flowOut)
 
                 nUpsamplingSamples+=1
                 upsamplingSum+=upsampling_factor
@@ -433,49 +508,22 @@ class SuperSloMo(object):
                 else:
                     interpTimes=np.concatenate((interpTimes,interframeTimes))
 
-                # Generate intermediate frames using upsampling_factor
-                # this part is also done in batch mode
-                for intermediateIndex in range(0, upsampling_factor):
-                    t = (intermediateIndex + 0.5) / upsampling_factor
-                    temp = -t * (1 - t)
-                    fCoeff = [temp, t * t, (1 - t) * (1 - t), temp]
-
-                    F_t_0 = fCoeff[0] * F_0_1 + fCoeff[1] * F_1_0
-                    F_t_1 = fCoeff[2] * F_0_1 + fCoeff[3] * F_1_0
-
-                    g_I0_F_t_0 = self.warper(I0, F_t_0)
-                    g_I1_F_t_1 = self.warper(I1, F_t_1)
-
-                    intrpOut = self.interpolator(
-                        torch.cat(
-                            (I0, I1, F_0_1, F_1_0,
-                             F_t_1, F_t_0, g_I1_F_t_1,
-                             g_I0_F_t_0), dim=1))
-
-                    F_t_0_f = intrpOut[:, :2, :, :] + F_t_0
-                    F_t_1_f = intrpOut[:, 2:4, :, :] + F_t_1
-                    V_t_0 = torch.sigmoid(intrpOut[:, 4:5, :, :])
-                    V_t_1 = 1 - V_t_0
-
-                    g_I0_F_t_0_f = self.warper(I0, F_t_0_f)
-                    g_I1_F_t_1_f = self.warper(I1, F_t_1_f)
-
-                    wCoeff = [1 - t, t]
-
-                    Ft_p = (wCoeff[0] * V_t_0 * g_I0_F_t_0_f +
-                            wCoeff[1] * V_t_1 * g_I1_F_t_1_f) / \
-                           (wCoeff[0] * V_t_0 + wCoeff[1] * V_t_1)
-
-                    # Save intermediate frames from this particular upsampling point between src frames
-                    for batchIndex in range(num_batch_frames):
-                        img = self.to_image(Ft_p[batchIndex].cpu().detach())
-                        img_resize = img.resize(ori_dim, Image.BILINEAR)
-                        # the output frame index is computed
-                        outputFrameIdx=outputFrameCounter + upsampling_factor * batchIndex + intermediateIndex
-                        save_path = os.path.join(
-                            output_folder,
-                            str(outputFrameIdx) + ".png")
-                        img_resize.save(save_path)
+                with stage('slomo_synthesis', batch_frames=num_batch_frames,
+                           upsampling_factor=upsampling_factor):
+                    # Generate intermediate frames using upsampling_factor
+                    # this part is also done in batch mode
+                    for intermediateIndex, Ft_p in self._intermediate_frames(
+                            I0, I1, F_0_1, F_1_0, upsampling_factor):
+                        # Save intermediate frames from this particular upsampling point between src frames
+                        for batchIndex in range(num_batch_frames):
+                            img_resize = self._output_image(
+                                Ft_p[batchIndex], ori_dim)
+                            # the output frame index is computed
+                            outputFrameIdx=outputFrameCounter + upsampling_factor * batchIndex + intermediateIndex
+                            save_path = os.path.join(
+                                output_folder,
+                                str(outputFrameIdx) + ".png")
+                            img_resize.save(save_path)
 
                 # for preview
                 if self.preview:
@@ -528,6 +576,133 @@ class SuperSloMo(object):
         logger.info('Wrote {} frames and returning {} frame times.\nAverage upsampling factor={:5.1f}'.format(nFramesWritten,nTimePoints,avgUpsampling))
         return interpTimes, avgUpsampling
 
+    def interpolate_stream(self, frames, frame_size):
+        """Run interpolation of a stream of frames.
+
+        Like interpolate(), but the frames come from an iterable and the
+        interpolated frames are yielded as they are made, without the
+        source and interpolated frame folders.
+
+        Parameters
+        ----------
+        frames: iterable of np.ndarray
+            [H, W] uint8 luma frames of size frame_size.
+        frame_size: tuple (width, height)
+
+        Returns
+        -------
+        generator of (float, np.ndarray)
+            the time of each interpolated frame, in units of source
+            frame intervals from the first frame, and the [H, W] uint8
+            frame, in time order. These are the frames and times that
+            interpolate() writes and returns.
+        """
+        ori_dim = frame_size
+        frame_pairs = dataloader.FramePairs(
+            self.__write_orig_frames(frames), ori_dim,
+            batch_size=self.batch_size, transform=self.to_tensor)
+        # load the model now, in the calling thread: its initialization
+        # draws from the torch random numbers, which the DVS emulator
+        # draws from at the same time as the interpolation
+        if not self.model_loaded:
+            (self.flow_estimator, self.warper,
+             self.interpolator) = self.__model(frame_pairs.dim)
+            self.model_loaded = True
+        # the DataLoader iterator of interpolate() draws its base seed from
+        # the torch random numbers; draw it too, so that the DVS noise
+        # drawn after it is the same
+        torch.empty((), dtype=torch.int64).random_()
+        return self.__interpolate_stream(frame_pairs, ori_dim)
+
+    def __interpolate_stream(self, frame_pairs, ori_dim):
+        """Yields the interpolated frames of interpolate_stream()."""
+
+        # construct AVI video output writers now that we know the frame size
+        if self.video_path is not None and self.vid_orig is not None and \
+                self.ori_writer is None:
+            self.ori_writer = video_writer(
+                os.path.join(self.video_path, self.vid_orig),
+                ori_dim[1],
+                ori_dim[0], frame_rate=self.avi_frame_rate
+            )
+
+        if self.video_path is not None and self.vid_slomo is not None and \
+                self.slomo_writer is None:
+            self.slomo_writer = video_writer(
+                os.path.join(self.video_path, self.vid_slomo),
+                ori_dim[1],
+                ori_dim[0], frame_rate=self.avi_frame_rate
+            )
+
+        if self.preview:
+            logger.info(
+                'the SloMo preview is not shown with streaming frames')
+
+        self.upsampling_reports_left=3 # number of times to report automatic upsampling
+        inputFrameCounter=0 # counts source video input frames
+        upsamplingSum=0 #stats
+        nUpsamplingSamples=0
+        logger.info(f'interpolating batches of frames using batch_size={self.batch_size} with auto_upsample={self.auto_upsample} and minimum upsampling_factor={self.upsampling_factor}')
+        with torch.no_grad():
+            for frame0, frame1 in frame_pairs:
+                I0 = frame0.to(self.device)
+                I1 = frame1.to(self.device)
+                # actual number of frames, account for < batch_size
+                num_batch_frames = I0.shape[0]
+
+                with stage('slomo_flow', batch_frames=num_batch_frames):
+                    flowOut = self.flow_estimator(torch.cat((I0, I1), dim=1))
+                F_0_1 = flowOut[:, :2, :, :] # flow from 0 to 1
+                F_1_0 = flowOut[:, 2:, :, :] # flow from 1 to 0
+
+                upsampling_factor = self._upsampling_factor(flowOut)
+
+                nUpsamplingSamples+=1
+                upsamplingSum+=upsampling_factor
+                # the same normalized frame times as interpolate()
+                numOutputFramesThisBatch= upsampling_factor*num_batch_frames
+                interframeTime = 1/upsampling_factor
+                interframeTimes = inputFrameCounter + np.array(range(numOutputFramesThisBatch))*interframeTime
+
+                # the intermediate frames are made for all pairs of the
+                # batch at once, keep them to yield them in time order
+                with stage('slomo_synthesis', batch_frames=num_batch_frames,
+                           upsampling_factor=upsampling_factor):
+                    batchFrames = [[None] * upsampling_factor
+                                   for _ in range(num_batch_frames)]
+                    for intermediateIndex, Ft_p in self._intermediate_frames(
+                            I0, I1, F_0_1, F_1_0, upsampling_factor):
+                        for batchIndex in range(num_batch_frames):
+                            batchFrames[batchIndex][intermediateIndex] = \
+                                np.asarray(self._output_image(
+                                    Ft_p[batchIndex], ori_dim))
+
+                for batchIndex in range(num_batch_frames):
+                    for intermediateIndex in range(upsampling_factor):
+                        frame = batchFrames[batchIndex][intermediateIndex]
+                        batchFrames[batchIndex][intermediateIndex] = None
+                        if self.slomo_writer:
+                            self.slomo_writer.write(
+                                cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+                            self.numSlomoVideoFramesWritten += 1
+                        yield interframeTimes[
+                            upsampling_factor * batchIndex
+                            + intermediateIndex], frame
+                # Set counter accounting for batching of frames
+                inputFrameCounter += num_batch_frames
+        if nUpsamplingSamples > 0:
+            logger.info('Interpolated {} frames.\nAverage upsampling factor={:5.1f}'.format(inputFrameCounter, upsamplingSum/nUpsamplingSamples))
+
+    def __write_orig_frames(self, frames):
+        """Write the source frames to the original video as they pass."""
+        for frame in frames:
+            if self.ori_writer:
+                self.ori_writer.write(
+                    cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+                self.numOrigVideoFramesWritten += 1
+            yield frame
+
+    @profiled('slomo_interpolate')
     def interpolate_polarization(self, source_frame_path, output_folder, frame_size, direction=None):
         """Run interpolation. \
             Interpolated frames will be saved in folder self.output_folder.
@@ -0,0 +1,266 @@
+"""
+Timers of the stages of the v2e pipeline.
+
+v2e --profile_stages=FILE times each stage of the conversion, i.e. the
+three stages of v2e.py, the SloMo flow and frame synthesis, each step of
+EventEmulator.generate_events() (lin-log, lowpass, CSDVS, leak, event
+generation and its shuffles, HDF5, AEDAT-2.0 and text output) and the
+event rendering. Each timed stage gives one record with its start time,
+duration, frame number and counts such as the number of iterations of
+the event generation; with --streaming, the number of frames waiting
+between the stages is also recorded at each hand-off. The records are
+written as JSON lines, one per stage, or, if FILE ends with .json, as a
+Chrome trace that can be opened with chrome://tracing or
+https://ui.perfetto.dev.
+
+The worker processes of --emulator_processes are not timed, only the
+whole stage 3 that waits for them.
+
+On a GPU, the kernels run asynchronously, so the timers synchronize the
+device at the start and end of each stage; the run is then slower, but
+the time is that of the stage.
+
+Without --profile_stages, stage() returns a shared do-nothing context
+manager, so the timers cost a function call per stage.
+"""
+import atexit
+import functools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# current profiler, None if stages are not timed
+_profiler = None
+
+
+class _NoStage(object):
+    """Context manager of stage() when stages are not timed."""
+
+    def __init__(self):
+        self.args = {}
+
+    def __enter__(self):
+        return self.args
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage(object):
+    """Context manager that times a stage of a StageProfiler."""
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = self.profiler._start(self.args)
+        return self.args
+
+    def __exit__(self, *exc):
+        self.profiler._end(self.name, self.start, self.args)
+        return False
+
+
+class StageProfiler(object):
+    """Records the durations of the stages of the pipeline,
+    see the module documentation.
+    """
+
+    def __init__(self, path, cuda_sync=None):
+        """
+        Parameters
+        ----------
+        path: str
+            output file, a Chrome trace if it ends with .json,
+            else JSON lines.
+        cuda_sync: bool
+            synchronize the CUDA device at the start and end of each stage,
+            by default if CUDA is available.
+        """
+        self.path = path
+        self.chrome_trace = path.lower().endswith('.json')
+        self.cuda_sync = torch.cuda.is_available() \
+            if cuda_sync is None else cuda_sync
+        self.t0 = time.perf_counter()
+        self.trace_events = []
+        self.file = None if self.chrome_trace else open(path, 'w')
+        # total duration and number of each stage, for the summary
+        self.totals = OrderedDict()
+        self.lock = threading.Lock()
+        # frame number of the enclosing stages of each thread
+        self.local = threading.local()
+
+    def stage(self, name, **args):
+        """Returns a context manager that times the stage name.
+
+        Parameters
+        ----------
+        name: str
+            stage name.
+        args:
+            values recorded with the stage, e.g. frame=frame number,
+            which is also recorded with the stages inside this one.
+            The context manager returns the dict of args, in which
+            the stage can store counts found while it runs.
+        """
+        return _Stage(self, name, args)
+
+    def _start(self, args):
+        frames = getattr(self.local, 'frames', None)
+        if frames is None:
+            frames = self.local.frames = [None]
+        if 'frame' in args:
+            frames.append(args['frame'])
+        else:
+            frames.append(frames[-1])
+        if self.cuda_sync:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _end(self, name, start, args):
+        if self.cuda_sync:
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        frame = self.local.frames.pop()
+        duration = end - start
+        args = {k: _json_value(v) for k, v in args.items()}
+        if frame is not None:
+            args['frame'] = frame
+        with self.lock:
+            total = self.totals.get(name, (0., 0))
+            self.totals[name] = (total[0] + duration, total[1] + 1)
+            if self.chrome_trace:
+                self.trace_events.append({
+                    'name': name, 'ph': 'X',
+                    'ts': (start - self.t0) * 1e6, 'dur': duration * 1e6,
+                    'pid': 0, 'tid': threading.get_ident(), 'args': args})
+            else:
+                record = {'stage': name, 'start_s': start - self.t0,
+                          'duration_s': duration}
+                record.update(args)
+                self.file.write(json.dumps(record) + '\n')
+
+    def counter(self, name, **values):
+        """Records values of the counter name at this time, e.g. the
+        number of frames in a queue; a counter track of the Chrome
+        trace."""
+        now = time.perf_counter() - self.t0
+        values = {k: _json_value(v) for k, v in values.items()}
+        with self.lock:
+            if self.chrome_trace:
+                self.trace_events.append({
+                    'name': name, 'ph': 'C', 'ts': now * 1e6,
+                    'pid': 0, 'args': values})
+            else:
+                record = {'counter': name, 'time_s': now}
+                record.update(values)
+                self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        """Writes the Chrome trace, closes the output file and logs
+        the total time of each stage."""
+        if self.chrome_trace:
+            with open(self.path, 'w') as f:
+                json.dump({'traceEvents': self.trace_events,
+                           'displayTimeUnit': 'ms'}, f)
+        elif self.file is not None:
+            self.file.close()
+            self.file = None
+        if not self.totals:
+            return
+        lines = ['{:>28s} {:>10s} {:>8s} {:>10s}'.format(
+            'stage', 'total (s)', 'count', 'mean (ms)')]
+        for name, (total, count) in self.totals.items():
+            lines.append('{:>28s} {:10.3f} {:8d} {:10.3f}'.format(
+                name, total, count, total / count * 1e3))
+        logger.info('stage timings written to {}:\n{}'.format(
+            self.path, '\n'.join(lines)))
+
+
+def _json_value(v):
+    """Converts tensor and numpy scalars to python numbers."""
+    if hasattr(v, 'item'):
+        return v.item()
+    return v
+
+
+def enable_stage_profiler(path, cuda_sync=None):
+    """Starts timing the stages, see StageProfiler.
+
+    Returns
+    -------
+    profiler: StageProfiler
+        the profiler, to be closed with disable_stage_profiler().
+    """
+    global _profiler
+    disable_stage_profiler()
+    _profiler = StageProfiler(path, cuda_sync=cuda_sync)
+    # write the timings also if the run quits early
+    atexit.register(disable_stage_profiler)
+    return _profiler
+
+
+def disable_stage_profiler():
+    """Stops timing the stages and writes the timings."""
+    global _profiler
+    if _profiler is not None:
+        _profiler.close()
+        _profiler = None
+
+
+def stage(name, **args):
+    """Returns a context manager that times the stage name if stages are
+    timed, see StageProfiler.stage()."""
+    if _profiler is None:
+        return _NO_STAGE
+    return _profiler.stage(name, **args)
+
+
+def counter(name, **values):
+    """Records the values of the counter name if stages are timed,
+    see StageProfiler.counter()."""
+    if _profiler is not None:
+        _profiler.counter(name, **values)
+
+
+def begin_stage(name, **args):
+    """Starts timing the stage name for stages that do not fit in a with
+    block, see stage().
+
+    Returns
+    -------
+    timer: the context manager of the stage, to pass to end_stage().
+    """
+    timer = stage(name, **args)
+    timer.__enter__()
+    return timer
+
+
+def end_stage(timer):
+    """Ends the stage started by begin_stage()."""
+    timer.__exit__(None, None, None)
+
+
+def profiled(name):
+    """Decorator that times each call of a function as the stage name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return fn(*args, **kwargs)
+            with _profiler.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -120,6 +120,16 @@ def v2e_args(parser):
              "rendering since it will force high upsampling ratio."
              "\nCan be combind with --auto_timestamp_resolution to "
              "limit upsampling to a maximum limit value.")
+    timestampResolutionGroup.add_argument(
+        "--threshold_crossing_timestamps", action="store_true",
+        help="Timestamp each DVS event at the time its pixel crosses the "
+             "event's threshold level, interpolating the DVS input "
+             "linearly between (interpolated) frames, instead of spreading "
+             "the events evenly over the frame interval. Gives per-pixel "
+             "event timing with a much lower SloMo upsampling factor, "
+             "e.g. a larger --timestamp_resolution. Implies "
+             "--vectorized_event_generation; not supported with "
+             "--active_pixel_update and --tile_size.")
 
     # DVS model parameters
     modelGroup = parser.add_argument_group('DVS model')
@@ -223,6 +233,141 @@ def v2e_args(parser):
         '--dvs1024', action='store_true',
         help='Set size for 1024x768 DVS')
 
+    # emulator performance options, these do not change the DVS model
+    perfGroup = parser.add_argument_group('DVS emulator performance')
+    perfGroup.add_argument(
+        "--vectorized_event_generation", action="store_true",
+        help="Generate the events of all sub-frame iterations of each "
+             "frame in one pass instead of one full-frame pass per "
+             "iteration. Output is identical for the same "
+             "--dvs_emulator_seed.")
+    perfGroup.add_argument(
+        "--active_pixel_update", action="store_true",
+        help="Update only the pixels whose input changed, whose lowpass "
+             "filter has not settled, or that may make leak or shot noise "
+             "events; the leak of the other pixels is applied when they "
+             "become active. Faster for mostly static scenes. Noise events "
+             "are only statistically equivalent to the default update; "
+             "not supported with --csdvs.")
+    perfGroup.add_argument(
+        "--sparse_shot_noise", action="store_true",
+        help="Sample only the shot noise events instead of drawing a "
+             "random number for each pixel and sub-frame iteration. "
+             "Same shot noise rates, but the events differ from the "
+             "default sampler for the same --dvs_emulator_seed.")
+    perfGroup.add_argument(
+        "--compact_events", action="store_true",
+        help="Collect the events in a reused buffer of compact records "
+             "(int64 us timestamp, uint16 x, uint16 y, int8 polarity) "
+             "that is passed to the AEDAT-2.0, text and HDF5 outputs, "
+             "instead of [N,4] float32 arrays. Timestamps stay exact to "
+             "1 us for long recordings. Implies "
+             "--vectorized_event_generation.")
+    perfGroup.add_argument(
+        "--tile_size", type=int, default=0,
+        help="Keep the DVS pixel states in square tiles of this many "
+             "pixels and update the tiles in parallel threads, which "
+             "reduces the peak memory of very high resolution inputs. "
+             "The events are identical to the untiled emulator for the "
+             "same --dvs_emulator_seed. 0 disables tiling.")
+    perfGroup.add_argument(
+        "--tile_workers", type=int, default=0,
+        help="Number of threads that update the tiles of --tile_size; "
+             "0 uses the number of CPU cores.")
+    perfGroup.add_argument(
+        "--fused_pixel_pipeline", action="store_true",
+        help="Compute the lin-log conversion, lowpass filter, leak and "
+             "event counts of each frame in one kernel compiled with "
+             "torch.compile (needs pytorch>=2.0 and a C++ compiler on "
+             "CPU), updating the pixel states in place. The first frames "
+             "are slower while the kernel compiles. For the same "
+             "--dvs_emulator_seed, the events are the same as without it "
+             "up to the float rounding of the compiled kernel, which can "
+             "move or remove a few events of pixels at threshold; not "
+             "supported with --csdvs, --active_pixel_update and "
+             "--tile_size.")
+    perfGroup.add_argument(
+        "--emulator_backend", type=str, default="torch",
+        choices=["torch", "numba"],
+        help="Backend of the DVS pixel model. torch runs on the torch "
+             "device, i.e. the GPU if available. numba runs the pixel "
+             "model in parallel compiled kernels on the CPU, which is "
+             "faster than torch on CPU; without noise it makes the same "
+             "events as torch, the leak and shot noise events are only "
+             "statistically equivalent. Not supported with --csdvs, "
+             "--active_pixel_update, --tile_size, "
+             "--threshold_crossing_timestamps and "
+             "--fused_pixel_pipeline.")
+    perfGroup.add_argument(
+        "--counter_rng", action="store_true",
+        help="Draw the DVS noise and mismatch from counter-based random "
+             "numbers keyed by --dvs_emulator_seed, pixel, frame number "
+             "and noise source, so that they do not depend on the order "
+             "of emulation: --tile_size and --emulator_processes make "
+             "the same noise as a serial run. "
+             "Same noise statistics, but other noise events than the "
+             "default random numbers, and slower.")
+    perfGroup.add_argument(
+        "--scheduled_leak", action="store_true",
+        help="Apply the leak only to the pixels whose next leak event "
+             "can fall in the frame interval, found from a bound of "
+             "their leak rate in a time bucketed index, instead of to "
+             "all pixels at each frame. Same leak noise statistics, "
+             "faster when few pixels leak or change per frame. Not "
+             "supported with --active_pixel_update, --tile_size, "
+             "--fused_pixel_pipeline and --emulator_backend numba.")
+    perfGroup.add_argument(
+        "--profile_stages", type=str, default=None,
+        help="Time each stage of the conversion (resizing, SloMo flow "
+             "and synthesis, lin-log, lowpass, CSDVS, leak, event "
+             "generation and shuffles, HDF5/AEDAT-2.0/text output, "
+             "rendering) and write the timings of each frame and their "
+             "counts, e.g. iterations, to this file in the output "
+             "folder, as JSON lines, or as a Chrome trace "
+             "(chrome://tracing) if it ends with .json. On GPU the "
+             "device is synchronized around each stage, which slows "
+             "the run. The total time of each stage is logged at the "
+             "end.")
+    perfGroup.add_argument(
+        "--streaming", action="store_true",
+        help="Stream the video frames from decoding (crop, resize, luma) "
+             "through SloMo to the DVS emulator and the DVS video in "
+             "bounded in-memory queues instead of writing them to the "
+             "temporary source (.npy) and interpolated (.png) frame "
+             "folders. The stages run in threads at the same time, so "
+             "that the conversion takes about the time of the slowest "
+             "stage; the frames waiting between the stages are logged "
+             "at the end. The output is the same as with the frame "
+             "folders, but the SloMo preview is not shown. Not supported "
+             "with --polarization_input, --davis_output, "
+             "--emulator_processes, checkpoints and SloMo with "
+             "--auto_timestamp_resolution (whose frame times are only "
+             "known at the end), which use the frame folders.")
+    perfGroup.add_argument(
+        "--stream_queue_size", type=int, default=64,
+        help="Number of frames that can wait between two stages of "
+             "--streaming; a stage waits when its queue is full.")
+    perfGroup.add_argument(
+        "--stream_workers", type=int, default=2,
+        help="Number of threads of --streaming that crop, resize and "
+             "convert the video frames to luma; the frames are passed "
+             "on in order.")
+    perfGroup.add_argument(
+        "--emulator_processes", type=int, default=0,
+        help="Split the (interpolated) frames of a video or image folder "
+             "input into this many time segments and emulate them in "
+             "parallel worker processes, e.g. the number of CPU cores. "
+             "0 or 1 emulates serially. The events of the segments after "
+             "the first differ from a serial run; the expected and measured "
+             "deviations are logged. Not supported with checkpoints.")
+    perfGroup.add_argument(
+        "--segment_overlap_s", type=float, default=0.1,
+        help="Duration in seconds over which each segment of "
+             "--emulator_processes is warmed up on the frames before it, "
+             "without emitting events, so that its photoreceptor lowpass "
+             "filter converges. Increase it for a low --cutoff_hz or "
+             "dark scenes.")
+
     # slow motion frame synthesis
     sloMoGroup = parser.add_argument_group(
         'SloMo upsampling (see also "DVS timestamp resolution" group)')
@@ -323,6 +468,23 @@ def v2e_args(parser):
              "\nSYNTHETIC_INPUT is the module name without .py suffix."
              "\nSee example moving_dot.py."
     )
+    syntheticInputGroup.add_argument(
+        "--event_driven", action="store_true",
+        help="Emulate the SYNTHETIC_INPUT in continuous time instead of "
+             "\nfrom its frames, with exact timestamps of the threshold "
+             "\ncrossings. SYNTHETIC_INPUT must implement intensity(t, ys, xs). "
+             "\nThe pixels have no lowpass filter and no shot noise.")
+    syntheticInputGroup.add_argument(
+        "--event_driven_time_step", type=float, default=1e-3,
+        help="Maximum time in seconds between two checks of the input "
+             "\nof a pixel with --event_driven. Input pulses shorter "
+             "\nthan this can be missed.")
+    syntheticInputGroup.add_argument(
+        "--event_driven_max_log_rate", type=float, default=None,
+        help="Maximum rate of change of the log intensity of the "
+             "\nSYNTHETIC_INPUT in log_e units per second. If set, "
+             "\npixels far from their thresholds are checked less often "
+             "\nwith --event_driven, up to --event_driven_time_step.")
 
     # DVS output video
     outGroupDvsVideo = parser.add_argument_group('Output: DVS video')
@@ -366,6 +528,23 @@ def v2e_args(parser):
         "--davis_output", action="store_true",
         help="Save frames, frame timestamp and corresponding event index"
              "in HDF5. Default is False.")
+    dvsEventOutputGroup.add_argument(
+        "--aps_frame_interval", type=int, default=50,
+        help="With --davis_output, save only every this many'th "
+             "(interpolated) frame, starting with the first, like the "
+             "APS frames of a DAVIS; 1 saves all frames.")
+    dvsEventOutputGroup.add_argument(
+        "--aps_frame_rate_hz", type=float, default=0,
+        help="With --davis_output, save instead the first frame of each "
+             "APS frame interval of 1/aps_frame_rate_hz seconds. "
+             "0 uses --aps_frame_interval.")
+    dvsEventOutputGroup.add_argument(
+        "--aps_frame_change", type=float, default=0,
+        help="With --davis_output, save a frame selected by "
+             "--aps_frame_interval or --aps_frame_rate_hz only if its "
+             "mean absolute difference to the last saved frame is at "
+             "least this many gray levels (0-255). 0 saves all selected "
+             "frames.")
     dvsEventOutputGroup.add_argument(
         "--dvs_h5", type=output_file_check, default=None,
         help="Output DVS events as hdf5 event database. ")
@@ -384,6 +563,32 @@ def v2e_args(parser):
     #           "WARNING: memory use is unbounded.")
 
 
+    # checkpointing of long conversions
+    ckptGroup = parser.add_argument_group('Checkpoint and resume')
+    ckptGroup.add_argument(
+        "--checkpoint_interval", type=int, default=0,
+        help="Save a checkpoint of the DVS emulator state and event "
+             "output file sizes every this many (interpolated) frames "
+             "of the DVS emulation of a video or image folder input. "
+             "0 disables checkpoints.")
+    ckptGroup.add_argument(
+        "--checkpoint_file", type=expandpath, default=None,
+        help="Checkpoint file; default is v2e-checkpoint.pt in the "
+             "output folder. It is deleted when the conversion finishes.")
+    ckptGroup.add_argument(
+        "--resume", action="store_true",
+        help="Resume the DVS emulation from the checkpoint file in the "
+             "same output folder (implies --overwrite) with the same "
+             "arguments. The event outputs are truncated to the checkpoint "
+             "and appended to, so they hold the same events as an "
+             "uninterrupted run. The DVS video output only holds the "
+             "frames after the checkpoint. The input is decoded and "
+             "interpolated again, and the resume stops with an error if "
+             "the frames before the checkpoint differ from those that "
+             "were emulated, e.g. if SloMo is not deterministic on the "
+             "device.")
+
+
     # center surround DVS emulation
     csdvs=parser.add_argument_group('Center-Surround DVS')
     csdvs.add_argument('--cs_lambda_pixels',type=float,default=None,help='space constant of surround in pixels, None to disable.  '
@@ -398,6 +603,17 @@ def v2e_args(parser):
                                                                     ' then the simulation of diffuser runs until it converges, '
                                                                     'i.e. until the maximum change between timesteps '
                                                                     'is smaller than a threshold value')
+    csdvs.add_argument(
+        '--cs_solver', type=str, default='euler',
+        choices=['direct', 'euler'],
+        help="solver of the surround diffuser: 'euler' (default) runs "
+             "small Euler steps of the diffuser, which can take thousands "
+             "of steps per frame; 'direct' solves the diffuser exactly in "
+             "the frequency domain with a few FFTs per frame, its steady "
+             "state for instantaneous surround (--cs_tau_p_ms 0) and its "
+             "dynamics over the frame otherwise. 'direct' is much faster, "
+             "but since the Euler steps stop at a tolerance, its events "
+             "differ slightly from those of 'euler'.")
 
     # # perform basic checks, however this fails if script adds
     # # more arguments later
@@ -11,6 +11,8 @@ from numba import njit
 from engineering_notation import EngNumber as eng
 from pathlib import Path
 
+from v2ecore.stage_profiler import stage
+
 # adjust for different sensor than DAVIS346
 DVS_WIDTH, DVS_HEIGHT = 346, 260
 
@@ -319,6 +321,117 @@ def all_images(data_path):
     return images_sorted
 
 
+def luma_frames(cap, num_frames, input_size, output_size, input_channels,
+                crop=None):
+    """Yields the frames of a video as the input of the DVS emulator:
+    cropped, resized to the output size and converted to luma.
+
+    Parameters
+    ----------
+    cap: cv2.VideoCapture or ImageFolderReader
+        the video, positioned at the first frame to convert.
+    num_frames: int
+        number of frames to read.
+    input_size: tuple
+        (width, height) of the video frames.
+    output_size: tuple
+        (width, height) of the converted frames.
+    input_channels: int
+        1 for gray video, 3 for color video.
+    crop: tuple
+        None or the (left, right, top, bottom) slice bounds of the crop,
+        with right and bottom negative or None.
+
+    Returns
+    -------
+    generator of np.ndarray
+        the [height, width] uint8 frames; frames that cannot be read
+        are skipped.
+    """
+    for inputFrameIndex, inputVideoFrame in read_frames(cap, num_frames):
+        yield luma_frame(
+            inputFrameIndex, inputVideoFrame, input_size, output_size,
+            input_channels, crop)
+
+
+def read_frames(cap, num_frames):
+    """Yields the frames of a video that can be read, see luma_frames().
+
+    Returns
+    -------
+    generator of (int, np.ndarray)
+        the frame number and the frame.
+    """
+    for inputFrameIndex in range(num_frames):
+        # read frame
+        with stage('read_video_frame', frame=inputFrameIndex):
+            ret, inputVideoFrame = cap.read()
+        if ret == False:
+            logger.warning(f'could not read frame {inputFrameIndex} from {cap}')
+            continue
+        if inputVideoFrame is None or np.shape(inputVideoFrame) == ():
+            logger.warning(f'empty video frame number {inputFrameIndex} in {cap}')
+            continue
+        yield inputFrameIndex, inputVideoFrame
+
+
+def luma_frame(inputFrameIndex, inputVideoFrame, input_size, output_size,
+               input_channels, crop=None):
+    """Crops, resizes and converts a video frame to luma, see luma_frames().
+
+    Returns
+    -------
+    np.ndarray
+        the [height, width] uint8 frame.
+    """
+    input_width, input_height = input_size
+    output_width, output_height = output_size
+    with stage('luma_frame', frame=inputFrameIndex):
+        if crop is not None:
+            # crop the frame, indices are y,x, UL is 0,0
+            c_l, c_r, c_t, c_b = crop
+            if c_l+(c_r if c_r is not None else 0)>=input_width:
+                logger.error(f'left {c_l}+ right crop {c_r} is larger than image width {input_width}')
+                v2e_quit(1)
+            if c_t+(c_b if c_b is not None else 0)>=input_height:
+                logger.error(f'top {c_t}+ bottom crop {c_b} is larger than image height {input_height}')
+                v2e_quit(1)
+
+            inputVideoFrame= inputVideoFrame[c_t:c_b, c_l:c_r] # https://stackoverflow.com/questions/15589517/how-to-crop-an-image-in-opencv-using-python
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- Crop is performed! ---------')
+        else:
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- Crop is NOT performed! ---------')
+
+        if output_height and output_width and \
+                (input_height != output_height or
+                 input_width != output_width):
+            dim = (output_width, output_height)
+            (fx, fy) = (float(output_width) / input_width,
+                        float(output_height) / input_height)
+            inputVideoFrame = cv2.resize(
+                src=inputVideoFrame, dsize=dim, fx=fx, fy=fy,
+                interpolation=cv2.INTER_AREA)
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- Resize is performed! ---------')
+        else:
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- Resize is NOT performed! ---------')
+        # color, also if the video wrongly reports CAP_PROP_MONOCHROME
+        if input_channels == 3 or inputVideoFrame.ndim == 3:
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- BGR2GRAY is performed! ---------')
+            # TODO would break resize if input is gray frames
+            # convert RGB frame into luminance.
+            inputVideoFrame = cv2.cvtColor(
+                inputVideoFrame, cv2.COLOR_BGR2GRAY)  # much faster
+        else:
+            if inputFrameIndex == 0:  # print info once
+                logger.info('\n------- BGR2GRAY is NOT performed! ---------')
+    return inputVideoFrame
+
+
 def read_image(path: str) -> np.ndarray:
     """Read image and returns it as grayscale np.ndarray float scaled 0-255.
 